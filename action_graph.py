@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+from tracing import tracer
+from utils import get_class_name
+
+
+class Action:
+    """One command of an output: an intent, its params and the actions it has to wait for."""
+
+    def __init__(self, id: str, main_intent: str, detailed_intent: str, params: dict, depends_on: list = None):
+        self.id = id
+        self.main_intent = main_intent
+        self.detailed_intent = detailed_intent
+        self.params = params if isinstance(params, dict) else {}
+        self.depends_on = list(depends_on or [])
+        self.status = "pending"
+        self.result = None
+
+    def record(self) -> dict:
+        return {
+            "id": self.id,
+            "main_intent": self.main_intent,
+            "detailed_intent": self.detailed_intent,
+            "status": self.status,
+            "result": self.result,
+        }
+
+
+def parse_actions(output: dict) -> list:
+    """
+    The actions of an output state: its "actions" list, or the single intent of a
+    classic output. Actions without an id are numbered from 1.
+
+    Raises:
+        ValueError: If an action depends on an unknown action or the dependencies form a cycle.
+    """
+    if isinstance(output.get("actions"), list):
+        items = output["actions"]
+    elif output.get("main_intent") is not None:
+        items = [output]
+    else:
+        return []
+    actions = []
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            raise ValueError(f"Action {number} is not an object")
+        depends_on = item.get("depends_on") or []
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        actions.append(Action(str(item.get("id", number)), item.get("main_intent"), item.get("detailed_intent"), item.get("params", {}), [str(d) for d in depends_on]))
+    _check(actions)
+    return actions
+
+
+def _check(actions: list):
+    ids = {action.id for action in actions}
+    if len(ids) != len(actions):
+        raise ValueError("Action ids must be unique")
+    for action in actions:
+        unknown = [dependency for dependency in action.depends_on if dependency not in ids]
+        if unknown:
+            raise ValueError(f"Action {action.id} depends on unknown actions: {', '.join(unknown)}")
+    _order(actions)
+
+
+def _order(actions: list) -> list:
+    """
+    The actions in an order that respects their declared dependencies, otherwise in the
+    order given (Kahn's algorithm, always taking the earliest ready action).
+
+    Raises:
+        ValueError: If the dependencies form a cycle.
+    """
+    position = {action.id: number for number, action in enumerate(actions)}
+    waiting = {action.id: set(action.depends_on) for action in actions}
+    ready = [position[action_id] for action_id, dependencies in waiting.items() if not dependencies]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        done = actions[heapq.heappop(ready)]
+        order.append(done)
+        del waiting[done.id]
+        for action_id, dependencies in waiting.items():
+            if done.id in dependencies:
+                dependencies.discard(done.id)
+                if not dependencies:
+                    heapq.heappush(ready, position[action_id])
+    if waiting:
+        # Whatever never became ready sits on a cycle
+        raise ValueError(f"Actions depend on each other in a cycle: {', '.join(waiting)}")
+    return order
+
+
+def _edges(actions: list) -> dict:
+    """
+    Dependencies of every action: the declared ones plus the previous action on the same
+    main intent, so commands on one store run one after the other while commands on
+    different stores (tasks, alarms, notes, files) run at the same time. The previous
+    action is taken in dependency order, so an implicit edge never points against a
+    declared one and the graph stays acyclic.
+    """
+    edges = {action.id: set(action.depends_on) for action in actions}
+    last = {}
+    for action in _order(actions):
+        if action.main_intent in last:
+            edges[action.id].add(last[action.main_intent])
+        last[action.main_intent] = action.id
+    return edges
+
+
+async def run_actions(actions: list, on_error=None, on_timing=None) -> list:
+    """
+    Run the actions as a DAG: each starts once everything it depends on has finished,
+    independent ones run concurrently through their executors' arun() (asyncio
+    subprocesses for the script backends, worker threads for the rest). When an action
+    fails, the ones depending on it are skipped.
+
+    Args:
+        actions (list): Actions from parse_actions.
+        on_error: Optional callable(message) for every failure.
+        on_timing: Optional callable(stage, seconds) for every executor run.
+
+    Returns:
+        list: The actions, with their status ("ok", "error", "skipped" or "unrecognized") and result.
+    """
+    edges = _edges(actions)
+    finished = {action.id: asyncio.Event() for action in actions}
+    by_id = {action.id: action for action in actions}
+
+    async def run(action):
+        try:
+            for dependency in edges[action.id]:
+                await finished[dependency].wait()
+            failed = [dependency for dependency in action.depends_on if by_id[dependency].status != "ok"]
+            if failed:
+                action.status = "skipped"
+                action.result = f"Skipped, depends on failed action {', '.join(failed)}"
+                return
+            executor = get_class_name(action.main_intent, action.detailed_intent)
+            if executor is None:
+                # UNRECOGNIZED_INTENT outputs and the like, there is nothing to run
+                action.status = "unrecognized"
+                return
+            try:
+                with tracer.span("executor", main_intent=action.main_intent, detailed_intent=action.detailed_intent, action=action.id) as span:
+                    action.result = await executor.arun(action.params)
+                action.status = "ok"
+                if on_timing is not None:
+                    on_timing("executor", span.duration)
+            except Exception as e:
+                action.status = "error"
+                action.result = f"Error: {e}"
+                if on_error is not None:
+                    on_error(f"Error executing command: {str(e)}")
+        finally:
+            finished[action.id].set()
+
+    await asyncio.gather(*(run(action) for action in actions))
+    return actions
+
+
+def aggregate(actions: list):
+    """One result for the request: the single action's own result, or one line block per action."""
+    if len(actions) == 1:
+        return actions[0].result
+    blocks = []
+    for action in actions:
+        blocks.append(f"[{action.id}] {action.detailed_intent} ({action.status}): {action.result}")
+    return "\n".join(blocks)
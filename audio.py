@@ -1,16 +1,23 @@
 import sounddevice as sd
 import numpy as np
 import wave
-import requests
 import uuid
 import threading
 import json
 import time
 import os
+import speech
+from speech import StreamingTranscription, transcribe
+from vad import SpeechGate, VoiceActivityDetector
 
 WIT_TOKEN = str("Bearer "+os.environ.get('WIT_TOKEN'))
 
-def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5, max_record_seconds=10):
+def listen_and_send_to_wit(silence_duration=0.5, max_record_seconds=10, stream=True):
+    """
+    Record from the first speech until silence (or ENTER) and return the transcription.
+    Speech is detected by the VAD in vad.py, leading and trailing silence is not uploaded.
+    With stream=True the audio is uploaded while recording, without a temp file.
+    """
     sample_rate = 16000
     # Use smaller chunks for more frequent updates
     blocksize = 512  # Smaller block size for more frequent callback calls
@@ -22,49 +29,53 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5, max_reco
     print("🎤 Listening... (start speaking or press ENTER to stop manually)")
 
     recorded_chunks = []
-    silence_chunks = 0
     started_talking = False
     stop_flag = threading.Event()
+    gate = SpeechGate(VoiceActivityDetector(hangover_frames=silence_limit))
+    upload = StreamingTranscription(sample_rate, token=WIT_TOKEN).start() if stream else None
     
     # Keep track of how long we've been recording
     recording_start_time = None
+    recorded_blocks = 0
     last_ui_update = 0
 
     def callback(indata, frames, time_info, status):
-        nonlocal recorded_chunks, silence_chunks, started_talking, recording_start_time, last_ui_update
+        nonlocal recorded_chunks, started_talking, recording_start_time, recorded_blocks, last_ui_update
         current_time = time.time()
 
         if stop_flag.is_set():
             raise sd.CallbackStop
 
-        volume = np.abs(indata).mean() * 1000
+        # The gate only releases blocks that belong to the utterance
+        for block in gate.push(indata.copy()):
+            recorded_chunks.append(block)
+            if upload is not None:
+                upload.write(block.tobytes())
 
-        if volume > silence_threshold:
-            if not started_talking:
-                print("🎙️ Detected speech, recording...")
-                recording_start_time = current_time
-                last_ui_update = current_time
+        if gate.started and not started_talking:
+            print("🎙️ Detected speech, recording...")
             started_talking = True
-            silence_chunks = 0
-            recorded_chunks.append(indata.copy())
-        elif started_talking:
-            silence_chunks += 1
-            recorded_chunks.append(indata.copy())
+            recording_start_time = current_time
+            last_ui_update = current_time
+
+        if started_talking:
+            recorded_blocks += 1
+            silence_chunks = gate.vad.silence_run
             
             # Display remaining time more consistently - update every 0.25 seconds
-            if current_time - last_ui_update >= 0.25 and silence_chunks < silence_limit:
+            if silence_chunks and current_time - last_ui_update >= 0.25 and silence_chunks < silence_limit:
                 last_ui_update = current_time
                 remaining = (silence_limit - silence_chunks) * chunk_duration
                 print(f"⏱️ Stopping in {remaining:.1f}s...")
 
-        # Stop if silence threshold is reached after speech was detected
-        if started_talking and silence_chunks >= silence_limit:
+        # Stop once the VAD hangover after speech has elapsed
+        if gate.ended:
             print("🔇 Silence detected, stopping...")
             stop_flag.set()
             raise sd.CallbackStop
             
         # Also stop if we've recorded for too long
-        if len(recorded_chunks) >= max_chunks:
+        if recorded_blocks >= max_chunks:
             print("⏱️ Maximum duration reached, stopping...")
             stop_flag.set()
             raise sd.CallbackStop
@@ -95,65 +106,47 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5, max_reco
         print(f"Error in audio stream: {e}")
 
     if not recorded_chunks:
+        if upload is not None:
+            upload.cancel()
         print("❌ No speech detected.")
         return None
 
     duration = len(recorded_chunks) * chunk_duration
     print(f"✅ Recording complete: {duration:.1f} seconds")
-    
-    audio_data = np.concatenate(recorded_chunks, axis=0)
-    print("💾 Saving audio...")
-
-    with wave.open(filename, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(audio_data.tobytes())
-
-    print("📤 Sending to Wit.ai...")
-    with open(filename, 'rb') as f:
-        headers = {
-            'Authorization': WIT_TOKEN,
-            'Content-Type': 'audio/wav'
-        }
-        response = requests.post(
-            'https://api.wit.ai/speech?v=20230202',
-            headers=headers,
-            data=f
-        )
 
-    print("✅ Wit.ai response:")
-    
     try:
-        # Split the response by newlines and parse each line as JSON
-        json_objects = []
-        for line in response.text.strip().split('\r'):
-            line = line.strip()
-            if line:  # Skip empty lines
-                try:
-                    json_obj = json.loads(line)
-                    json_objects.append(json_obj)
-                except json.JSONDecodeError:
-                    # Skip invalid JSON
-                    pass
-        
-        # Get the last valid JSON object
-        if json_objects:
-            last_response = json_objects[-1]
-            final_text = last_response.get("text", "")
-            print(f"Final recognized text: {final_text}")
-            return final_text
+        if upload is not None:
+            # The audio went out while recording, only the transcription is left to wait for
+            print("📤 Finishing upload to Wit.ai...")
+            final_text = upload.finish()
         else:
-            print("No valid JSON objects found")
-            return None
-            
+            audio_data = np.concatenate(recorded_chunks, axis=0)
+            print("💾 Saving audio...")
+
+            with wave.open(filename, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(sample_rate)
+                wf.writeframes(audio_data.tobytes())
+
+            print("📤 Sending to Wit.ai...")
+            with open(filename, 'rb') as f:
+                final_text = transcribe(f.read(), 'audio/wav', WIT_TOKEN)
     except Exception as e:
-        print("⚠️ Error processing response:", e)
+        print("⚠️ Error sending to Wit.ai:", e)
+        return None
+
+    print("✅ Wit.ai response:")
+    if final_text is None:
+        print("No valid JSON objects found")
         return None
+    print(f"Final recognized text: {final_text}")
+    return final_text
 
 
 if __name__ == "__main__":
-    # Use a shorter silence duration (0.5s) and keep threshold at 250
-    result = listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5)
+    speech.warm_up()
+    # Use a shorter silence duration (0.5s), the speech threshold adapts to the room noise
+    result = listen_and_send_to_wit(silence_duration=0.5)
     if result:
         print(f"Successfully recognized: '{result}'")
\ No newline at end of file
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from config import configure_model
+from context_warmer import context_warmer
+from engine import AgentEngine, EngineHooks
+from llm import RateLimited
+from prefix_cache import prefix_cache
+from prompts import PROTOCOLS
+from router import route_intent
+from tracing import setup as setup_tracing
+from utils import get_class_name
+
+
+class PreoutputRequired(Exception):
+    """Raised instead of waiting for an answer, a batch has nobody to ask."""
+
+    def __init__(self, question: str):
+        super().__init__(question)
+        self.question = question
+
+
+class BatchHooks(EngineHooks):
+    def __init__(self):
+        self.errors = []
+
+    def ask_user(self, question: str) -> str:
+        raise PreoutputRequired(question)
+
+    def on_error(self, message: str):
+        self.errors.append(message)
+
+
+def read_requests(stream) -> list:
+    """
+    Parse JSONL requests. A line is either {"utterance": "...", "id": ...} or a bare
+    JSON string; blank lines and lines starting with # are skipped. Requests without
+    an id are numbered by line.
+    """
+    requests = []
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f"line {number}: invalid JSON")
+        if isinstance(item, str):
+            item = {"utterance": item}
+        if not isinstance(item, dict) or not isinstance(item.get("utterance"), str):
+            raise ValueError(f"line {number}: expected a string or an object with an \"utterance\"")
+        item.setdefault("id", number)
+        requests.append(item)
+    return requests
+
+
+async def run_request(model, protocol: str, item: dict, execute: bool) -> dict:
+    """Run one utterance on a fresh chat and describe what happened."""
+    system_prompt, format_prompt = PROTOCOLS[protocol]
+    utterance = item["utterance"]
+    record = {"id": item["id"], "utterance": utterance}
+    start_time = time.time()
+
+    route = route_intent(utterance)
+    if route is not None and route["direct"]:
+        record.update(status="ok", routed=True, output={
+            "status": "OK",
+            "main_intent": route["main_intent"],
+            "detailed_intent": route["detailed_intent"],
+            "params": {},
+        })
+        if execute:
+            executor = get_class_name(route["main_intent"], route["detailed_intent"])
+            record["result"] = await executor.arun({})
+        record["elapsed"] = round(time.time() - start_time, 3)
+        return record
+
+    hooks = BatchHooks()
+    engine = AgentEngine(model.start_chat(), system_prompt, format_prompt, protocol, hooks, execute)
+    try:
+        result = await engine.run(utterance, route)
+        record["status"] = "error" if hooks.errors or result.output is None else "ok"
+        record["output"] = result.output.get("output") if result.output else None
+        if execute:
+            record["result"] = result.result
+            record["actions"] = result.actions
+        if hooks.errors:
+            record["error"] = "; ".join(hooks.errors)
+        record["llm"] = {
+            "calls": result.metrics.calls,
+            "retries": result.metrics.retries,
+            "throttled": round(result.metrics.throttled, 3),
+            "cached": result.cached,
+        }
+    except PreoutputRequired as e:
+        record.update(status="preoutput", question=e.question)
+    except RateLimited as e:
+        record.update(status="rate_limited", error=str(e))
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["elapsed"] = round(time.time() - start_time, 3)
+    return record
+
+
+async def run_batch(requests: list, output, concurrency: int = 4, protocol: str = "fast", execute: bool = True) -> dict:
+    """
+    Run requests with up to concurrency chat sessions at once and write one JSON result
+    per line to output as they finish. Model calls share the process rate limiter,
+    so a higher concurrency overlaps the waits on the model without exceeding the quota.
+
+    Returns:
+        dict: Number of results per status.
+    """
+    model = configure_model(PROTOCOLS[protocol][0], protocol)
+    print(prefix_cache.describe(model, protocol), file=sys.stderr)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    counts = {}
+
+    async def worker(item):
+        async with semaphore:
+            record = await run_request(model, protocol, item, execute)
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    await asyncio.gather(*(worker(item) for item in requests))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run utterances through AIOS without interaction.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of requests, - for stdin (default)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for the results, - for stdout (default)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Chat sessions running at once (default 4)")
+    parser.add_argument("--protocol", choices=list(PROTOCOLS), default="fast")
+    parser.add_argument("--dry-run", action="store_true", help="Report the outputs without running their commands")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        requests = read_requests(sys.stdin)
+    else:
+        with open(args.input, 'r') as stream:
+            requests = read_requests(stream)
+
+    output = sys.stdout if args.output == "-" else open(args.output, 'w')
+    # AIOS_TRACE / AIOS_METRICS_PORT
+    setup_tracing()
+    context_warmer.start()
+    try:
+        counts = asyncio.run(run_batch(requests, output, args.concurrency, args.protocol, not args.dry_run))
+    finally:
+        context_warmer.stop()
+        if output is not sys.stdout:
+            output.close()
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"{len(requests)} requests: {summary or 'none'}", file=sys.stderr)
+    return 0 if counts.get("error", 0) == 0 and counts.get("rate_limited", 0) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
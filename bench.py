@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from history import estimate_tokens
+
+TRANSCRIPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_transcripts.jsonl')
+# Text the fake speech endpoint transcribes every recording to
+# Seconds a transcript may run, a request that never returns is reported instead of hanging the run
+REQUEST_TIMEOUT = 30
+SPEECH_TEXT = "what pdfs are in my documents folder"
+
+# The sandbox home of a run: executors work on these files, the stores live next to them
+SANDBOX_FILES = {
+    "Documents/quarterly_report.pdf": "%PDF-1.4 quarterly report\n",
+    "Documents/invoice_march.pdf": "%PDF-1.4 invoice\n",
+    "Documents/meeting_notes.txt": "agenda, budget, hiring\n",
+    "Downloads/setup.sh": "#!/bin/sh\necho setup\n",
+    "Pictures/holiday.jpg": "JPEG",
+}
+
+
+def percentile(values: list, share: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(values: list) -> dict:
+    """Latency summary in milliseconds."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3),
+        "p50_ms": round(1000 * percentile(values, 0.5), 3),
+        "p95_ms": round(1000 * percentile(values, 0.95), 3),
+        "max_ms": round(1000 * max(values), 3),
+    }
+
+
+def read_transcripts(path: str) -> list:
+    transcripts = []
+    with open(path, 'r') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            item = json.loads(line)
+            if not isinstance(item.get("utterance"), str) or not isinstance(item.get("responses"), list):
+                raise ValueError(f"{path}:{number}: a transcript needs an \"utterance\" and \"responses\"")
+            item.setdefault("id", number)
+            transcripts.append(item)
+    return transcripts
+
+
+class BenchError(Exception):
+    """The pipeline asked the scripted model for more than its transcript holds."""
+
+
+class ScriptedResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _ScriptedModel:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+
+class ScriptedChat:
+    """
+    Stands in for a Gemini ChatSession: every message is answered with the next response
+    of a transcript, after latency seconds. Like the real chat it keeps the history and,
+    since the API is sent the system prompt and the whole history with every message,
+    counts those as the prompt of each round trip.
+    """
+
+    def __init__(self, responses: list, system_prompt: str, latency: float = 0.0, model_name: str = "bench-scripted"):
+        self.responses = [response if isinstance(response, str) else json.dumps(response) for response in responses]
+        self.system_prompt = system_prompt
+        self.latency = latency
+        self.model = _ScriptedModel(model_name)
+        self.history = []
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def _answer(self, content: str) -> ScriptedResponse:
+        if self.calls >= len(self.responses):
+            raise BenchError(f"Transcript has no response left for: {content[:80]}")
+        prompt = [self.system_prompt, content]
+        prompt.extend(part for turn in self.history for part in turn["parts"])
+        self.prompt_tokens += sum(estimate_tokens(str(part)) for part in prompt)
+        text = self.responses[self.calls]
+        self.calls += 1
+        self.history = self.history + [
+            {"role": "user", "parts": [content]},
+            {"role": "model", "parts": [text]},
+        ]
+        return ScriptedResponse(text)
+
+    def send_message(self, content: str) -> ScriptedResponse:
+        time.sleep(self.latency)
+        return self._answer(content)
+
+    async def send_message_async(self, content: str) -> ScriptedResponse:
+        await asyncio.sleep(self.latency)
+        return self._answer(content)
+
+
+class _SpeechHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _reply(self, payload: bytes):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        audio = self._body()
+        # Partial then final transcription, separated by carriage returns like Wit.ai
+        partial = json.dumps({"text": SPEECH_TEXT.split()[0], "is_final": False})
+        final = json.dumps({"text": SPEECH_TEXT, "is_final": True, "bytes": len(audio)})
+        self._reply(f"{partial}\r\n{final}\r\n".encode('utf-8'))
+
+
+class FakeSpeechServer:
+    """Local stand-in for the Wit.ai speech endpoint, on a free port of 127.0.0.1."""
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _SpeechHandler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def prepare_sandbox(root: str, speech_url: str):
+    """
+    Point the stores, the filesystem context, the speech client and the LLM limits at
+    the sandbox. Must run before the app modules are imported, they read these at import.
+    """
+    home = os.path.join(root, "home")
+    for relative, content in SANDBOX_FILES.items():
+        path = os.path.join(home, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+    os.makedirs(os.path.join(home, "Backup"), exist_ok=True)
+    os.environ.update({
+        "AIOS_DB_PATH": os.path.join(root, "aios.db"),
+        "NOTES_BACKEND": "sqlite",
+        "TASKS_BACKEND": "sqlite",
+        "FS_CONTEXT_ROOT": home,
+        "AIOS_FS_INDEX_PATH": os.path.join(root, "filename_index.db"),
+        "AIOS_RESPONSE_CACHE_PATH": os.path.join(root, "responses.db"),
+        "RESPONSE_CACHE": "off",
+        # The scripted model has no quota, the limiter must never hold a request back
+        "GEMINI_RPM": "1000000000",
+        "GEMINI_BURST": "1000000",
+        "WIT_TOKEN": "bench",
+        "WIT_BASE_URL": speech_url,
+        "WIT_SPEECH_URL": f"{speech_url}/speech?v=20230202",
+        "AIOS_DAEMON": "off",
+    })
+    return home
+
+
+def _timing_hooks_class():
+    from engine import EngineHooks
+
+    class TimingHooks(EngineHooks):
+        """Collects stage timings and answers preoutput questions from the transcript."""
+
+        def __init__(self, answers: list):
+            self.answers = list(answers)
+            self.stages = {}
+            self.errors = []
+
+        def on_timing(self, stage: str, seconds: float):
+            self.stages.setdefault(stage, []).append(seconds)
+
+        def ask_user(self, question: str) -> str:
+            if not self.answers:
+                raise BenchError(f"Transcript has no answer left for: {question}")
+            return self.answers.pop(0)
+
+        def on_error(self, message: str):
+            self.errors.append(message)
+
+    return TimingHooks
+
+
+async def run_transcript(transcript: dict, home: str, latency: float, hooks_class) -> dict:
+    """Run one transcript through routing and the engine, return its measurements."""
+    from engine import AgentEngine
+    from prompts import PROTOCOLS
+    from router import route_intent
+    from utils import get_class_name
+
+    protocol = transcript.get("protocol", "fast")
+    system_prompt, format_prompt = PROTOCOLS[protocol]
+    responses = [json.loads(json.dumps(response).replace("$ROOT", home)) for response in transcript["responses"]]
+    chat = ScriptedChat(responses, system_prompt, latency)
+    hooks = hooks_class(transcript.get("answers", []))
+    record = {"id": transcript["id"], "protocol": protocol, "routed": False}
+
+    start = time.perf_counter()
+    route = route_intent(transcript["utterance"])
+    hooks.on_timing("route", time.perf_counter() - start)
+    try:
+        if route is not None and route["direct"]:
+            record["routed"] = True
+            executor = get_class_name(route["main_intent"], route["detailed_intent"])
+            executor_start = time.perf_counter()
+            await executor.arun({})
+            hooks.on_timing("executor", time.perf_counter() - executor_start)
+            record["status"] = "ok"
+        else:
+            engine = AgentEngine(chat, system_prompt, format_prompt, protocol, hooks)
+            result = await asyncio.wait_for(engine.run(transcript["utterance"], route), REQUEST_TIMEOUT)
+            record["status"] = "ok" if result.output is not None and not hooks.errors else "error"
+            if hooks.errors:
+                record["error"] = "; ".join(hooks.errors)
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    hooks.on_timing("request", time.perf_counter() - start)
+    record.update(round_trips=chat.calls, prompt_tokens=chat.prompt_tokens, stages=hooks.stages)
+    return record
+
+
+def bench_audio(seconds: float = 2.0, sample_rate: int = 16000, blocksize: int = 512) -> dict:
+    """
+    Time the voice input path on a synthetic recording (noise, a voiced tone, noise):
+    the VAD gate over the recorder blocks, trimming and WAV encoding, the buffered upload
+    and the streamed upload to the fake speech endpoint.
+    """
+    import wave
+    import numpy as np
+    from speech import StreamingTranscription, transcribe
+    from vad import SpeechGate, VoiceActivityDetector
+
+    rng = np.random.default_rng(0)
+    samples = int(seconds * sample_rate)
+    audio = rng.normal(0, 30, samples)
+    t = np.arange(samples) / sample_rate
+    voiced = (t > 0.4) & (t < seconds - 0.7)
+    audio[voiced] += 6000 * np.sin(2 * np.pi * 220 * t[voiced])
+    audio = np.clip(audio, -32768, 32767).astype(np.int16).reshape(-1, 1)
+    blocks = [audio[i:i + blocksize] for i in range(0, samples - blocksize + 1, blocksize)]
+    stages = {}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        value = function(*args)
+        stages[stage] = time.perf_counter() - start
+        return value
+
+    def gate_blocks():
+        gate = SpeechGate(VoiceActivityDetector())
+        return [released for block in blocks for released in gate.push(block)]
+
+    def encode():
+        trimmed = VoiceActivityDetector().trim(np.concatenate(blocks, axis=0), blocksize)
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(trimmed.tobytes())
+        return buffer.getvalue()
+
+    def stream(released):
+        upload = StreamingTranscription(sample_rate).start()
+        for block in released:
+            upload.write(block.tobytes())
+        return upload.finish()
+
+    released = timed("audio_vad", gate_blocks)
+    wav = timed("audio_encode", encode)
+    texts = [timed("speech_upload", transcribe, wav, 'audio/wav'), timed("speech_stream", stream, released)]
+    if any(text != SPEECH_TEXT for text in texts):
+        raise BenchError(f"Unexpected transcription from the fake speech endpoint: {texts}")
+    return stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_bench(transcripts: list, repeat: int = 5, latency: float = 0.0, warm: bool = False, audio: bool = True) -> dict:
+    """
+    Run every transcript repeat times in a sandbox, against the scripted model and
+    the fake speech endpoint.
+
+    Returns:
+        dict: The report: per stage latency summaries, per request round trips,
+        prompt tokens and stage means, and the run configuration.
+    """
+    with tempfile.TemporaryDirectory(prefix="aios-bench-") as root, FakeSpeechServer() as speech_server:
+        home = prepare_sandbox(root, speech_server.url)
+        from context_warmer import context_warmer
+
+        hooks_class = _timing_hooks_class()
+        stages = {}
+        requests = {}
+
+        async def run_all():
+            for _ in range(repeat):
+                for transcript in transcripts:
+                    record = await run_transcript(transcript, home, latency, hooks_class)
+                    requests.setdefault(record["id"], []).append(record)
+                    for stage, values in record["stages"].items():
+                        stages.setdefault(stage, []).extend(values)
+
+        if warm:
+            context_warmer.start()
+        try:
+            asyncio.run(run_all())
+            if audio:
+                for _ in range(repeat):
+                    for stage, seconds in bench_audio().items():
+                        stages.setdefault(stage, []).append(seconds)
+        finally:
+            context_warmer.stop()
+
+    report_requests = []
+    for request_id, records in requests.items():
+        last = records[-1]
+        entry = {
+            "id": request_id,
+            "protocol": last["protocol"],
+            "routed": last["routed"],
+            "status": last["status"],
+            "round_trips": last["round_trips"],
+            "prompt_tokens": last["prompt_tokens"],
+            "stages_mean_ms": {
+                stage: summarize([value for record in records for value in record["stages"].get(stage, [])])["mean_ms"]
+                for stage in last["stages"]
+            },
+        }
+        if "error" in last:
+            entry["error"] = last["error"]
+        report_requests.append(entry)
+
+    count = max(len(report_requests), 1)
+    return {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"repeat": repeat, "llm_latency": latency, "warm": warm, "transcripts": len(transcripts)},
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        "per_request": {
+            "round_trips": round(sum(entry["round_trips"] for entry in report_requests) / count, 3),
+            "prompt_tokens": round(sum(entry["prompt_tokens"] for entry in report_requests) / count, 1),
+        },
+        "requests": report_requests,
+    }
+
+
+def compare(old: dict, new: dict) -> str:
+    """Side by side p50 of every stage and the per request counts of two reports."""
+    lines = [f"{'':<16}{old.get('commit') or 'old':>12}{new.get('commit') or 'new':>12}{'change':>10}"]
+
+    def line(name, before, after, unit):
+        if before is None or after is None:
+            change = ""
+        else:
+            change = f"{100 * (after - before) / before:+.1f}%" if before else ""
+        show = lambda value: "-" if value is None else f"{value:.3f}{unit}" if unit else f"{value:g}"
+        lines.append(f"{name:<16}{show(before):>12}{show(after):>12}{change:>10}")
+
+    for stage in sorted(set(old["stages"]) | set(new["stages"])):
+        line(stage, old["stages"].get(stage, {}).get("p50_ms"), new["stages"].get(stage, {}).get("p50_ms"), "ms")
+    for key in ("round_trips", "prompt_tokens"):
+        line(key, old["per_request"].get(key), new["per_request"].get(key), "")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AIOS pipeline against a scripted model and a fake speech endpoint.")
+    parser.add_argument("transcripts", nargs="?", default=TRANSCRIPTS_PATH, help="JSONL transcripts (default bench_transcripts.jsonl)")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Runs of every transcript (default 5)")
+    parser.add_argument("-o", "--output", default="-", help="JSON file for the report, - for stdout (default)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the scripted model takes per message (default 0)")
+    parser.add_argument("--warm", action="store_true", help="Serve contexts from a running context warmer")
+    parser.add_argument("--no-audio", action="store_true", help="Skip the voice input stages")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two reports instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, 'r') as file:
+                reports.append(json.load(file))
+        print(compare(*reports))
+        return 0
+
+    report = run_bench(read_transcripts(args.transcripts), max(1, args.repeat), args.llm_latency, args.warm, not args.no_audio)
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text + "\n")
+    failed = [entry["id"] for entry in report["requests"] if entry["status"] != "ok"]
+    if failed:
+        print(f"Failed transcripts: {', '.join(map(str, failed))}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
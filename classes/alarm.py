@@ -1,5 +1,8 @@
+import asyncio
 import subprocess
 
+ALARM_JOB = "notify-send 'Alarm' '⏰ Alarm triggered!'"
+
 class alarms:
     """
     A class to manage alarms using the `at` command and notify-send on Linux.
@@ -22,36 +25,81 @@ class alarms:
             case _:
                 return f"Invalid detailed intent: {self.detailed_intent}"
 
+    async def arun(self, params: dict):
+        """
+        Same as run(), but the command runs as an asyncio subprocess so the event loop
+        stays free while `at` works.
+        """
+        command = self._command(params)
+        if command is None:
+            return f"Invalid detailed intent: {self.detailed_intent}"
+        return await self._run_command_async(*command)
+
+    def _command(self, params: dict):
+        """
+        The (args, input_text) pair for the intent, or None if the intent is unknown.
+        """
+        match self.detailed_intent:
+            case "list_scheduled_alarms":
+                return ["atq"], None
+            case "schedule_alarm_at_time_and_date":
+                return self._at_command(self._at_time(params["time"], params["date"]))
+            case "schedule_alarm_at_duration_from_now":
+                # Example: '10 minutes' → at now + 10 minutes
+                return self._at_command(f"now + {params['duration']}")
+            case "remove_scheduled_alarm":
+                return ["atrm", str(params["job_id"])], None
+            case _:
+                return None
+
+    @staticmethod
+    def _at_time(time: str, date: str):
+        # time: "14:30", date: "040625" -> becomes "14:30 04/06/25"
+        if date in ["tom", "day_after_tom"]:
+            date_str = date  # directly use for now, to be interpreted by another system
+        else:
+            date_str = f"{date[:2]}/{date[2:4]}/{date[4:]}"
+        return f"{time} {date_str}"
+
+    @staticmethod
+    def _at_command(at_time: str):
+        # The job is given to at on stdin, as `echo job | at <time>` would
+        return ["at"] + at_time.split(), ALARM_JOB + "\n"
+
     def _run_command(self, command, input_text=None):
         try:
             result = subprocess.run(
                 command,
                 input=input_text,
                 capture_output=True,
-                text=True,
-                shell=True
+                text=True
             )
             return result.stdout.strip() if result.stdout else result.stderr.strip()
         except Exception as e:
             return f"Error: {e}"
 
+    async def _run_command_async(self, command, input_text=None):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=subprocess.PIPE if input_text is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate(input_text.encode() if input_text is not None else None)
+            stdout, stderr = stdout.decode(), stderr.decode()
+            return stdout.strip() if stdout else stderr.strip()
+        except Exception as e:
+            return f"Error: {e}"
+
     def list_scheduled_alarms(self):
-        return self._run_command("atq")
+        return self._run_command(["atq"])
 
     def schedule_alarm_at_time_and_date(self, time: str, date: str):
-        # time: "14:30", date: "040625" -> becomes "14:30 04/06/25"
-        if date in ["tom", "day_after_tom"]:
-            date_str = date  # directly use for now, to be interpreted by another system
-        else:
-            date_str = f"{date[:2]}/{date[2:4]}/{date[4:]}"
-        at_time = f"{time} {date_str}"
-        command = f'echo "notify-send \'Alarm\' \'⏰ Alarm triggered!\'" | at {at_time}'
-        return self._run_command(command)
+        return self._run_command(*self._at_command(self._at_time(time, date)))
 
     def schedule_alarm_at_duration(self, duration: str):
-        # Example: '10 minutes' → at now + 10 minutes
-        command = f'echo "notify-send \'Alarm\' \'⏰ Alarm triggered!\'" | at now + {duration}'
-        return self._run_command(command)
+        return self._run_command(*self._at_command(f"now + {duration}"))
 
     def remove_scheduled_alarm(self, job_id: str):
-        return self._run_command(f"atrm {job_id}")
+        return self._run_command(["atrm", str(job_id)])
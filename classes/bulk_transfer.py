@@ -0,0 +1,282 @@
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Reflinks go through an ioctl, Linux only
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Files copied at the same time, copies mostly wait on the disk so a few more than the cores
+WORKERS = int(os.environ.get('AIOS_TRANSFER_WORKERS', '0')) or min(16, (os.cpu_count() or 1) + 4)
+# linux/fs.h: _IOW(0x94, 9, int), clone the source's extents into the destination
+FICLONE = 0x40049409
+# Chunk size of the kernel side copies and of the read/write fallback
+CHUNK = 8 * 1024 * 1024
+
+# The filesystem or kernel can't do this kind of copy, try the next one
+UNSUPPORTED = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP,
+    errno.ENOTTY, errno.EBADF, errno.ETXTBSY,
+}
+
+
+class TransferReport:
+    """What a bulk copy or move did: counts, bytes, the copy method of every file and the failures."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.directories = 0
+        # (path, error message)
+        self.failed = []
+        # Files per method: reflink, copy_file_range, sendfile, read_write, symlink or rename
+        self.methods = Counter()
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, size: int, method: str):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            self.methods[method] += 1
+
+    def fail(self, path: str, error: Exception):
+        with self.lock:
+            self.failed.append((path, error.strerror if isinstance(error, OSError) and error.strerror else str(error)))
+
+
+class BulkTransfer:
+    """
+    Copies and moves many files on a bounded thread pool.
+
+    Every file takes the cheapest copy the filesystems allow: a reflink (FICLONE,
+    Btrfs, XFS and other copy-on-write filesystems share the data instead of copying it),
+    then copy_file_range and sendfile (the kernel copies, nothing passes through Python),
+    then plain reads and writes. A method that fails as unsupported between two devices
+    isn't tried again for them. Metadata is copied like shutil.copy2 does. Moves rename
+    when source and destination share a filesystem and copy then delete otherwise.
+    """
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = max(1, workers)
+        self.unsupported = set()
+        self.lock = threading.Lock()
+
+    def _supported(self, devices: tuple, method: str) -> bool:
+        return (devices, method) not in self.unsupported
+
+    def _unsupported(self, devices: tuple, method: str):
+        with self.lock:
+            self.unsupported.add((devices, method))
+
+    def copy_file(self, source: str, destination: str) -> tuple:
+        """
+        Copy one file with its metadata. The copy is written to a temporary file next
+        to the destination and renamed over it once complete, so a failed copy never
+        leaves a truncated destination behind.
+
+        Returns:
+            tuple[int, str]: The bytes copied and the method that copied them.
+
+        Raises:
+            shutil.SameFileError: If source and destination are the same file.
+            OSError: If the file could not be copied.
+        """
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            raise shutil.SameFileError(f"{source} and {destination} are the same file")
+        directory, name = os.path.split(os.path.abspath(destination))
+        with open(source, 'rb') as src:
+            fd, temporary = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as dst:
+                    size, method = self._copy_data(src.fileno(), dst.fileno())
+                shutil.copystat(source, temporary)
+                os.replace(temporary, destination)
+            except BaseException:
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+                raise
+        return size, method
+
+    def _copy_data(self, src_fd: int, dst_fd: int) -> tuple:
+        size = os.fstat(src_fd).st_size
+        devices = (os.fstat(src_fd).st_dev, os.fstat(dst_fd).st_dev)
+        offset = 0
+        method = "read_write"
+        if size and fcntl is not None and self._supported(devices, "reflink"):
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                offset, method = size, "reflink"
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                self._unsupported(devices, "reflink")
+        for name, step in (("copy_file_range", self._copy_file_range), ("sendfile", self._sendfile)):
+            if offset >= size or not hasattr(os, name) or not self._supported(devices, name):
+                continue
+            try:
+                offset = step(src_fd, dst_fd, offset, size)
+                method = name
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                self._unsupported(devices, name)
+        # Whatever the kernel paths didn't copy, or everything when none of them worked
+        if offset < size or size == 0:
+            self._read_write(src_fd, dst_fd, offset)
+        return size, method
+
+    @staticmethod
+    def _copy_file_range(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+        while offset < size:
+            copied = os.copy_file_range(src_fd, dst_fd, min(CHUNK, size - offset), offset, offset)
+            if copied == 0:
+                break
+            offset += copied
+        return offset
+
+    @staticmethod
+    def _sendfile(src_fd: int, dst_fd: int, offset: int, size: int) -> int:
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < size:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(CHUNK, size - offset))
+            if sent == 0:
+                break
+            offset += sent
+        return offset
+
+    @staticmethod
+    def _read_write(src_fd: int, dst_fd: int, offset: int):
+        # Files that grew since they were measured are copied to their end
+        os.lseek(src_fd, offset, os.SEEK_SET)
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while True:
+            chunk = os.read(src_fd, CHUNK)
+            if not chunk:
+                break
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(dst_fd, view):]
+
+    def _plan(self, source: str, destination: str, jobs: list, directories: list, report: TransferReport):
+        """Create the directory tree of source under destination and queue its files."""
+        try:
+            info = os.lstat(source)
+            if stat.S_ISLNK(info.st_mode):
+                # Links are copied as links, following them could loop or leave the tree
+                if os.path.lexists(destination):
+                    os.remove(destination)
+                os.symlink(os.readlink(source), destination)
+                report.add(0, "symlink")
+            elif stat.S_ISDIR(info.st_mode):
+                os.makedirs(destination, exist_ok=True)
+                directories.append((source, destination))
+                report.directories += 1
+                with os.scandir(source) as iterator:
+                    entries = [entry.name for entry in iterator]
+                for name in entries:
+                    self._plan(os.path.join(source, name), os.path.join(destination, name), jobs, directories, report)
+            else:
+                jobs.append((source, destination))
+        except OSError as e:
+            report.fail(source, e)
+
+    def _run(self, pairs: list, report: TransferReport):
+        jobs = []
+        directories = []
+        for source, destination in pairs:
+            inside = os.path.join(os.path.realpath(destination), '')
+            if os.path.isdir(source) and inside.startswith(os.path.join(os.path.realpath(source), '')):
+                # The copy would end up in the tree being walked
+                report.fail(source, ValueError(f"Cannot copy {source} into itself"))
+                continue
+            self._plan(source, destination, jobs, directories, report)
+
+        def copy(job):
+            try:
+                report.add(*self.copy_file(*job))
+            except OSError as e:
+                report.fail(job[0], e)
+
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                list(pool.map(copy, jobs))
+        # Deepest first, copying into a directory changes its mtime
+        for source, destination in reversed(directories):
+            try:
+                shutil.copystat(source, destination)
+            except OSError:
+                pass
+
+    def copy(self, pairs: list) -> TransferReport:
+        """
+        Copy files and directory trees.
+
+        Args:
+            pairs (list): (source, destination) paths, a destination is the final path, not its parent.
+
+        Returns:
+            TransferReport: What was copied and what failed.
+        """
+        start = time.perf_counter()
+        report = TransferReport()
+        self._run(pairs, report)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def move(self, pairs: list) -> TransferReport:
+        """
+        Move files and directory trees, a source is only deleted once all of it was copied.
+
+        Args:
+            pairs (list): (source, destination) paths, a destination is the final path, not its parent.
+
+        Returns:
+            TransferReport: What was moved and what failed.
+        """
+        start = time.perf_counter()
+        report = TransferReport()
+        crossing = []
+        for source, destination in pairs:
+            try:
+                info = os.lstat(source)
+                os.rename(source, destination)
+                if stat.S_ISDIR(info.st_mode):
+                    report.directories += 1
+                    with report.lock:
+                        report.methods["rename"] += 1
+                else:
+                    report.add(info.st_size, "rename")
+            except OSError as e:
+                if e.errno == errno.EXDEV:
+                    crossing.append((source, destination))
+                else:
+                    report.fail(source, e)
+        # Across filesystems everything is copied on one pool, then the complete sources deleted
+        self._run(crossing, report)
+        failed = [path for path, _ in report.failed]
+        for source, _ in crossing:
+            if any(path == source or path.startswith(source + os.sep) for path in failed):
+                continue
+            try:
+                if os.path.isdir(source) and not os.path.islink(source):
+                    shutil.rmtree(source)
+                else:
+                    os.remove(source)
+            except OSError as e:
+                report.fail(source, e)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+
+bulk_transfer = BulkTransfer()
@@ -1,7 +1,21 @@
+import asyncio
 import os
 import shutil
 import glob
 from pathlib import Path
+from fs_cache import fs_cache
+from filename_index import filename_index
+from classes.bulk_transfer import bulk_transfer
+
+# Path params of the operations that change the tree
+TREE_CHANGES = {
+    "move_file": ("source_location", "destination_location"),
+    "move_entire_directory": ("directory_source_location", "directory_destination_location"),
+    "remove_entire_directory": ("directory_source_location",),
+    "delete_file": ("file_location",),
+    "copy_file": ("destination_location",),
+    "copy_entire_directory": ("directory_destination_location",),
+}
 
 class file_manager:
     """
@@ -29,6 +43,19 @@ class file_manager:
         Returns:
             str: Result message of the operation.
         """
+        result = self._dispatch(params)
+        if self.detailed_intent in TREE_CHANGES:
+            paths = [params[name] for name in TREE_CHANGES[self.detailed_intent] if isinstance(params.get(name), str)]
+            # Let the filename index pick up what was created, moved or removed
+            filename_index.changed(*paths)
+            # The next listing of the path or of its parent must not come from a stale snapshot
+            for path in paths:
+                path = os.path.abspath(path)
+                fs_cache.invalidate(path)
+                fs_cache.invalidate(os.path.dirname(path))
+        return result
+
+    def _dispatch(self, params: dict):
         match self.detailed_intent:
             case "move_file":
                 return self.move_file(params["source_location"], params["destination_location"])
@@ -42,10 +69,24 @@ class file_manager:
                 return self.opening_file(params["file_location"])
             case "copy_file":
                 return self.copy_file(params["source_location"], params["destination_location"])
+            case "copy_entire_directory":
+                return self.copy_entire_directory(params["directory_source_location"], params["directory_destination_location"])
             case "list_contents_of_directory_with_optional_file_type_filter":
                 return self.list_contents(params["directory_location"], params.get("constraint", ".*"))
             case _:
                 return f"Invalid detailed intent: {self.detailed_intent}"
+
+    async def arun(self, params: dict):
+        """
+        Execute the file operation on a worker thread, so copies and moves don't block the event loop.
+        
+        Args:
+            params (dict): Parameters required for the operation.
+            
+        Returns:
+            str: Result message of the operation.
+        """
+        return await asyncio.to_thread(self.run, params)
     
     def move_file(self, source_location: str, destination_location: str) -> str:
         """
@@ -65,13 +106,10 @@ class file_manager:
                 if not files:
                     return f"No files found matching {source_location}"
                 
-                results = []
-                for file in files:
-                    dest_path = os.path.join(destination_location, os.path.basename(file))
-                    shutil.move(file, dest_path)
-                    results.append(f"Moved {file} to {dest_path}")
-                
-                return "\n".join(results)
+                os.makedirs(destination_location, exist_ok=True)
+                pairs = [(file, os.path.join(destination_location, os.path.basename(file))) for file in files]
+                report = bulk_transfer.move(pairs)
+                return self._transfer_summary("Moved", report, source_location, destination_location)
             else:
                 # Ensure destination directory exists
                 os.makedirs(os.path.dirname(destination_location), exist_ok=True)
@@ -103,12 +141,21 @@ class file_manager:
             str: Result message of the operation.
         """
         try:
+            if not os.path.isdir(directory_source_location):
+                return f"Error: Directory {directory_source_location} not found"
+            
             # Ensure destination directory exists
             os.makedirs(os.path.dirname(directory_destination_location), exist_ok=True)
             
-            # Move the directory
-            shutil.move(directory_source_location, directory_destination_location)
-            return f"Successfully moved directory {directory_source_location} to {directory_destination_location}"
+            # Moving onto an existing directory moves into it, like shutil.move
+            if os.path.isdir(directory_destination_location):
+                dest_path = os.path.join(directory_destination_location, os.path.basename(directory_source_location.rstrip(os.sep)))
+            else:
+                dest_path = directory_destination_location
+            
+            # A rename on the same filesystem, a parallel copy and delete across filesystems
+            report = bulk_transfer.move([(directory_source_location, dest_path)])
+            return self._transfer_summary("Moved directory", report, directory_source_location, dest_path)
         except FileNotFoundError:
             return f"Error: Directory {directory_source_location} not found"
         except PermissionError:
@@ -206,16 +253,12 @@ class file_manager:
                 if not files:
                     return f"No files found matching {source_location}"
                 
-                results = []
-                for file in files:
-                    # Ensure destination directory exists
-                    os.makedirs(destination_location, exist_ok=True)
-                    
-                    dest_path = os.path.join(destination_location, os.path.basename(file))
-                    shutil.copy2(file, dest_path)
-                    results.append(f"Copied {file} to {dest_path}")
+                # Ensure destination directory exists
+                os.makedirs(destination_location, exist_ok=True)
                 
-                return "\n".join(results)
+                pairs = [(file, os.path.join(destination_location, os.path.basename(file))) for file in files]
+                report = bulk_transfer.copy(pairs)
+                return self._transfer_summary("Copied", report, source_location, destination_location)
             else:
                 # Ensure destination directory exists
                 if os.path.isdir(destination_location):
@@ -225,7 +268,8 @@ class file_manager:
                     os.makedirs(os.path.dirname(destination_location), exist_ok=True)
                     dest_path = destination_location
                 
-                shutil.copy2(source_location, dest_path)
+                # Reflink or kernel side copy where the filesystems allow it, metadata like copy2
+                bulk_transfer.copy_file(source_location, dest_path)
                 return f"Successfully copied {source_location} to {dest_path}"
         except FileNotFoundError:
             return f"Error: File {source_location} not found"
@@ -234,6 +278,35 @@ class file_manager:
         except Exception as e:
             return f"Error copying file: {str(e)}"
     
+    def copy_entire_directory(self, directory_source_location: str, directory_destination_location: str) -> str:
+        """
+        Copy a directory with everything inside it, its files are copied in parallel.
+        
+        Args:
+            directory_source_location (str): Path to the source directory.
+            directory_destination_location (str): Path to the destination directory.
+            
+        Returns:
+            str: Summary of the operation.
+        """
+        try:
+            if not os.path.isdir(directory_source_location):
+                return f"Error: Directory {directory_source_location} not found"
+            
+            # Copying onto an existing directory copies into it
+            if os.path.isdir(directory_destination_location):
+                dest_path = os.path.join(directory_destination_location, os.path.basename(directory_source_location.rstrip(os.sep)))
+            else:
+                os.makedirs(os.path.dirname(directory_destination_location.rstrip(os.sep)) or '.', exist_ok=True)
+                dest_path = directory_destination_location
+            
+            report = bulk_transfer.copy([(directory_source_location, dest_path)])
+            return self._transfer_summary("Copied directory", report, directory_source_location, dest_path)
+        except PermissionError:
+            return f"Error: Permission denied when copying directory {directory_source_location}"
+        except Exception as e:
+            return f"Error copying directory: {str(e)}"
+    
     def list_contents(self, directory_location: str, constraint: str = ".*") -> str:
         """
         List contents of a directory with optional file type filtering.
@@ -256,25 +329,24 @@ class file_manager:
             
             # Parse constraint to get file extensions
             if constraint == ".*" or constraint == ".{*}":
-                pattern = "*"  # Match all files
+                extensions = None  # Match all files
             else:
                 # Extract extensions from format like '.{jpg,png,gif}'
-                extensions = constraint.strip('.{}').split(',')
-                pattern = "*.{" + ",".join(extensions) + "}"
+                extensions = tuple("." + ext.strip().lower() for ext in constraint.strip('.{}').split(','))
             
-            # Get all matching files
+            # One scandir pass, served from memory while the directory is unchanged
+            snapshot = fs_cache.snapshot(directory_location)
+            
+            # Get all matching files (hidden files are skipped, like a '*' glob would)
             files = []
-            for item in glob.glob(os.path.join(directory_location, pattern), recursive=False):
-                if os.path.isfile(item):
-                    size = os.path.getsize(item)
-                    files.append(f"{os.path.basename(item)} ({self._format_size(size)})")
+            for name, size in snapshot.files():
+                if name.startswith('.'):
+                    continue
+                if extensions is None or name.lower().endswith(extensions):
+                    files.append(f"{name} ({self._format_size(size)})")
             
             # Get all directories
-            directories = []
-            for item in os.listdir(directory_location):
-                item_path = os.path.join(directory_location, item)
-                if os.path.isdir(item_path):
-                    directories.append(f"{item}/ (directory)")
+            directories = [f"{name}/ (directory)" for name in snapshot.directories()]
             
             # Combine results
             result = f"Contents of {directory_location}:\n"
@@ -305,3 +377,30 @@ class file_manager:
             if size_bytes < 1024.0 or unit == 'TB':
                 return f"{size_bytes:.2f} {unit}"
             size_bytes /= 1024.0
+    
+    def _transfer_summary(self, verb: str, report, source: str, destination: str) -> str:
+        """
+        Summarize a bulk copy or move in a few lines, whatever the number of files.
+        
+        Args:
+            verb (str): What was done, e.g. "Copied".
+            report (TransferReport): The report of the transfer.
+            source (str): Source as given by the user.
+            destination (str): Destination path.
+            
+        Returns:
+            str: The summary.
+        """
+        counts = []
+        if report.files or not report.directories:
+            counts.append(f"{report.files} file{'s' if report.files != 1 else ''} ({self._format_size(report.bytes)})")
+        if report.directories:
+            counts.append(f"{report.directories} director{'ies' if report.directories != 1 else 'y'}")
+        result = f"{verb} {source} to {destination}: {', '.join(counts)} in {report.elapsed:.2f}s"
+        if report.methods:
+            result += " [" + ", ".join(f"{method}: {count}" for method, count in report.methods.most_common()) + "]"
+        if report.failed:
+            result += f"\n{len(report.failed)} failed:\n" + "\n".join(f"{path}: {error}" for path, error in report.failed[:5])
+            if len(report.failed) > 5:
+                result += f"\n...and {len(report.failed) - 5} more"
+        return result
@@ -1,11 +1,16 @@
+import asyncio
 import os
 import subprocess
 from pathlib import Path
+from classes.store import NotesStore, get_store, legacy_notes
+from classes.notes_index import get_notes_index, built_index
 
 class notes:
     """
-    Python class to interact with the notes shell script.
-    This class provides methods to list, add, append, delete, and read notes.
+    Python class to manage notes, stored in SQLite by default.
+    Set NOTES_BACKEND=script to use the notes shell script at NOTES_PATH instead.
+    This class provides methods to list, add, append, delete, read and search notes.
+    Searches go through an inverted index, built on first use and updated on every change.
     """
     
     def __init__(self, detailed_intent: str):
@@ -13,6 +18,7 @@ class notes:
         Initialize the notes class.
         """
         self.script_path = os.environ.get('NOTES_PATH')
+        self.backend = os.environ.get('NOTES_BACKEND', 'sqlite')
         self.detailed_intent = detailed_intent
     
     def run(self, params: dict):
@@ -27,19 +33,61 @@ class notes:
                 return self.delete_note(params["title"])
             case "read_note":
                 return self.read_note(params["title"])
+            case "search_notes":
+                return self.search_notes(params["query"])
             case _:
                 return f"Invalid detailed intent: {self.detailed_intent}"
 
+    async def arun(self, params: dict):
+        """
+        Same as run(), without blocking the event loop: the notes script runs as an
+        asyncio subprocess, the SQLite store and the search index are used from a
+        worker thread.
+        """
+        if self.backend == "script":
+            args = self._args(params)
+            if args is not None:
+                result = await self._run_command_async(args)
+                if args[0] in ("add", "append", "delete"):
+                    await asyncio.to_thread(self._reindex, params["title"])
+                return result
+        return await asyncio.to_thread(self.run, params)
+
+    def _args(self, params: dict):
+        """
+        The script arguments for the intent, or None if the intent doesn't map to
+        a script command (search runs in process).
+        """
+        match self.detailed_intent:
+            case "list_notes":
+                return ["list"]
+            case "add_note":
+                return ["add", params["title"], params["content"]]
+            case "append_to_note":
+                return ["append", params["title"], params["content"]]
+            case "delete_note":
+                return ["delete", params["title"]]
+            case "read_note":
+                return ["read", params["title"]]
+            case _:
+                return None
+
     def _run_command(self, args):
         """
-        Run the notes script with given arguments.
+        Run a notes command, in process against the SQLite store, or through
+        the notes script when the script backend is selected.
         
         Args:
-            args (list): List of command-line arguments to pass to the script.
+            args (list): List of command-line arguments, as the script takes them.
             
         Returns:
-            str: Output from the script execution.
+            str: Output from the command.
         """
+        if self.backend != "script":
+            try:
+                return get_store(NotesStore).run_command(args)
+            except Exception as e:
+                return f"Error executing notes command: {str(e)}"
         try:
             result = subprocess.run(
                 [self.script_path] + args,
@@ -50,7 +98,59 @@ class notes:
             return result.stdout.strip()
         except Exception as e:
             return f"Error executing notes command: {str(e)}"
+
+    async def _run_command_async(self, args):
+        """
+        Run a notes script command as an asyncio subprocess.
+        
+        Args:
+            args (list): List of command-line arguments for the script.
+            
+        Returns:
+            str: Output from the command.
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.script_path, *args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            stdout, _ = await process.communicate()
+            return stdout.decode().strip()
+        except Exception as e:
+            return f"Error executing notes command: {str(e)}"
     
+    def _all_notes(self):
+        """
+        Return (title, body) for every note, to build the search index from.
+        """
+        if self.backend != "script":
+            return get_store(NotesStore).all_notes()
+        return legacy_notes()
+
+    def _reindex(self, title):
+        """
+        Bring the search index up to date for one note after it changed.
+        Nothing to do while the index has not been built yet.
+        """
+        index = built_index()
+        if index is None:
+            return
+        if self.backend != "script":
+            body = get_store(NotesStore).body(title)
+        else:
+            body = dict(legacy_notes()).get(title)
+        if body is None:
+            index.remove(title)
+        else:
+            index.update(title, body)
+
+    def index(self):
+        """
+        Return the notes search index, building it on first use.
+        """
+        return get_notes_index(self._all_notes)
+
     def list_notes(self):
         """
         List all existing notes.
@@ -71,7 +171,9 @@ class notes:
         Returns:
             str: Result message from the script.
         """
-        return self._run_command(["add", title, content])
+        result = self._run_command(["add", title, content])
+        self._reindex(title)
+        return result
     
     def append_to_note(self, title, content):
         """
@@ -84,7 +186,9 @@ class notes:
         Returns:
             str: Result message from the script.
         """
-        return self._run_command(["append", title, content])
+        result = self._run_command(["append", title, content])
+        self._reindex(title)
+        return result
     
     def delete_note(self, title):
         """
@@ -96,7 +200,9 @@ class notes:
         Returns:
             str: Result message from the script.
         """
-        return self._run_command(["delete", title])
+        result = self._run_command(["delete", title])
+        self._reindex(title)
+        return result
     
     def read_note(self, title):
         """
@@ -108,4 +214,23 @@ class notes:
         Returns:
             str: The content of the note or an error message.
         """
-        return self._run_command(["read", title])
\ No newline at end of file
+        return self._run_command(["read", title])
+    
+    def search_notes(self, query, k=5):
+        """
+        Full-text search over note titles and contents.
+        
+        Args:
+            query (str): Words to look for, partial words match as prefixes.
+            k (int): Maximum number of notes to return.
+            
+        Returns:
+            str: The matching note titles, best match first.
+        """
+        hits = self.index().search(query, k)
+        if not hits:
+            return f"No notes match '{query}'."
+        lines = [f"{'TITLE':<30} {'SCORE':<10}".rstrip()]
+        for title, score in hits:
+            lines.append(f"{title:<30} {score:<10}".rstrip())
+        return "\n".join(lines)
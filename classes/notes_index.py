@@ -0,0 +1,133 @@
+import bisect
+import math
+import re
+import threading
+from collections import Counter
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Title words count this many times, a title match says more than a body match
+TITLE_WEIGHT = 3
+# Score multiplier for a query word that only matches as a prefix of an indexed word
+PREFIX_WEIGHT = 0.5
+
+# Words that describe the request rather than the note, ignored in queries
+QUERY_STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "to", "of", "in", "on", "for", "and", "or", "it", "is", "what",
+    "note", "notes", "read", "add", "append", "delete", "remove", "search", "find", "show", "list",
+    "open", "please", "about", "with", "from", "that", "this", "all", "any", "do", "have", "did", "write",
+}
+
+
+def tokenize(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class NotesIndex:
+    """
+    Inverted index over note titles and bodies with BM25 ranking and prefix matching.
+
+    Postings map a term to {title: term frequency}. The sorted term list lets a query word
+    find every indexed word it prefixes with two bisects. Notes are added, replaced and
+    removed one at a time, so the index never needs a full rebuild after it is built.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.terms = []
+        self.doc_terms = {}
+        self.doc_length = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def titles(self) -> list:
+        """Titles in insertion order, oldest first."""
+        return list(self.doc_terms.keys())
+
+    def _remove(self, title: str):
+        counts = self.doc_terms.pop(title, None)
+        if counts is None:
+            return
+        self.total_length -= self.doc_length.pop(title)
+        for term in counts:
+            posting = self.postings[term]
+            del posting[title]
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def update(self, title: str, body: str):
+        """Index a note, replacing any previous version with the same title."""
+        counts = Counter(tokenize(body))
+        for term in tokenize(title):
+            counts[term] += TITLE_WEIGHT
+        with self.lock:
+            self._remove(title)
+            self.doc_terms[title] = counts
+            self.doc_length[title] = sum(counts.values())
+            self.total_length += self.doc_length[title]
+            for term, tf in counts.items():
+                if term not in self.postings:
+                    self.postings[term] = {}
+                    bisect.insort(self.terms, term)
+                self.postings[term][title] = tf
+
+    def remove(self, title: str):
+        with self.lock:
+            self._remove(title)
+
+    def _expand(self, word: str) -> list:
+        """Indexed terms matching a query word, as (term, weight): the word itself and the words it prefixes."""
+        matches = []
+        start = bisect.bisect_left(self.terms, word)
+        end = bisect.bisect_left(self.terms, word + "\uffff")
+        for term in self.terms[start:end]:
+            matches.append((term, 1.0 if term == word else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Return up to k (title, score) pairs, best first."""
+        words = [word for word in tokenize(query) if word not in QUERY_STOPWORDS]
+        with self.lock:
+            total = len(self.doc_terms)
+            if not words or not total:
+                return []
+            average_length = self.total_length / total
+            scores = Counter()
+            for word in set(words):
+                for term, weight in self._expand(word):
+                    posting = self.postings[term]
+                    idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                    for title, tf in posting.items():
+                        length = self.doc_length[title]
+                        bm25 = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+                        scores[title] += weight * bm25
+        return [(title, round(score, 3)) for title, score in scores.most_common(k)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_notes_index(source=None):
+    """
+    Return the shared notes index. The first call builds it from source, a callable
+    yielding (title, body) for every note; later calls return it as is.
+    """
+    global _index
+    with _index_lock:
+        if _index is None and source is not None:
+            index = NotesIndex()
+            for title, body in source():
+                index.update(title, body)
+            _index = index
+        return _index
+
+
+def built_index():
+    """Return the shared index if it was built already, None otherwise."""
+    return _index
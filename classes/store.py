@@ -0,0 +1,295 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+DB_PATH = os.environ.get('AIOS_DB_PATH') or os.path.join(os.path.expanduser('~'), '.aios', 'aios.db')
+LEGACY_NOTES_DIR = os.path.join(os.path.expanduser('~'), '.notes')
+LEGACY_TASKS_DIR = os.path.join(os.path.expanduser('~'), '.tasks')
+
+ISO_UTC = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}T([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]Z$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    title TEXT PRIMARY KEY,
+    created TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    title TEXT PRIMARY KEY,
+    created TEXT NOT NULL,
+    deadline TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imports (
+    source TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+"""
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _connect(path: str):
+    """Open (once per path) a WAL-mode connection shared by the stores, guarded by a lock."""
+    with _connections_lock:
+        if path not in _connections:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            _connections[path] = (conn, threading.Lock())
+        return _connections[path]
+
+
+class _Store:
+    """
+    Base for the SQLite stores. Subclasses answer the same commands as the matching
+    shell script (see scripts/), with the same messages, through run_command(args).
+    """
+
+    table = None
+    legacy_dir = None
+
+    def __init__(self, path: str = DB_PATH):
+        self.conn, self.lock = _connect(path)
+        self.import_legacy()
+
+    def _now(self):
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _get(self, title: str):
+        with self.lock:
+            return self.conn.execute(f"SELECT * FROM {self.table} WHERE title = ?", (title,)).fetchone()
+
+    def _delete(self, title: str) -> bool:
+        with self.lock, self.conn:
+            return self.conn.execute(f"DELETE FROM {self.table} WHERE title = ?", (title,)).rowcount > 0
+
+    def _rows(self):
+        with self.lock:
+            return self.conn.execute(f"SELECT * FROM {self.table} ORDER BY rowid").fetchall()
+
+    def import_legacy(self, force: bool = False):
+        """
+        One-shot import of the directory kept by the shell script (metadata.txt plus one
+        file per entry). Runs the first time the store is opened, existing titles are kept.
+        """
+        metadata = os.path.join(self.legacy_dir, "metadata.txt")
+        with self.lock:
+            done = self.conn.execute("SELECT 1 FROM imports WHERE source = ?", (self.legacy_dir,)).fetchone()
+        if (done and not force) or not os.path.exists(metadata):
+            return 0
+
+        rows = []
+        with open(metadata, 'r') as file:
+            for line in file:
+                line = line.rstrip("\n")
+                if line:
+                    row = self._parse_legacy(line)
+                    if row:
+                        rows.append(row)
+
+        with self.lock, self.conn:
+            before = self.conn.total_changes
+            self._insert_legacy(rows)
+            imported = self.conn.total_changes - before
+            self.conn.execute("INSERT OR REPLACE INTO imports VALUES (?, ?)", (self.legacy_dir, self._now()))
+        return imported
+
+    def _read_legacy_file(self, filename: str):
+        try:
+            with open(os.path.join(self.legacy_dir, filename), 'r') as file:
+                return file.read()
+        except OSError:
+            return None
+
+
+def parse_legacy_note(directory: str, line: str):
+    """Parse a notes.sh metadata line (title,date,filename) into (title, created, body)."""
+    # Titles may contain commas, the other fields never do
+    parts = line.rsplit(",", 2)
+    if len(parts) != 3:
+        return None
+    title, created, filename = parts
+    try:
+        with open(os.path.join(directory, filename), 'r') as file:
+            body = file.read()
+    except OSError:
+        body = f"{title.upper()}\nDate: {created}\n\n"
+    return title, created, body
+
+
+def legacy_notes(directory: str = LEGACY_NOTES_DIR) -> list:
+    """Return (title, body) for every note kept by the notes.sh script."""
+    metadata = os.path.join(directory, "metadata.txt")
+    if not os.path.exists(metadata):
+        return []
+    with open(metadata, 'r') as file:
+        rows = [parse_legacy_note(directory, line.rstrip("\n")) for line in file if line.strip()]
+    return [(row[0], row[2]) for row in rows if row]
+
+
+class NotesStore(_Store):
+    table = "notes"
+    legacy_dir = LEGACY_NOTES_DIR
+
+    def _parse_legacy(self, line: str):
+        return parse_legacy_note(self.legacy_dir, line)
+
+    def _insert_legacy(self, rows: list):
+        self.conn.executemany("INSERT OR IGNORE INTO notes (title, created, body) VALUES (?, ?, ?)", rows)
+
+    def add(self, title: str, content: str) -> str:
+        created = self._now()
+        with self.lock, self.conn:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO notes (title, created, body) VALUES (?, ?, ?)",
+                (title, created, f"{title.upper()}\nDate: {created}\n\n{content}\n")
+            ).rowcount
+        if not inserted:
+            return f"A note with the title '{title}' already exists. Use 'append' to add content."
+        return f"Note '{title}' added!"
+
+    def append(self, title: str, content: str) -> str:
+        with self.lock, self.conn:
+            updated = self.conn.execute(
+                "UPDATE notes SET body = body || ? WHERE title = ?",
+                (f"\n--- Appended on {self._now()} ---\n{content}\n", title)
+            ).rowcount
+        if not updated:
+            return f"Note '{title}' not found. Use 'add' to create it first."
+        return f"Content appended to note '{title}'."
+
+    def delete(self, title: str) -> str:
+        if not self._delete(title):
+            return f"Note '{title}' not found."
+        return f"Note '{title}' deleted."
+
+    def list_all(self) -> str:
+        lines = [f"{'TITLE':<30} {'DATE':<20}".rstrip()]
+        for title, created, _ in self._rows():
+            lines.append(f"{title:<30} {created:<20}".rstrip())
+        return "\n".join(lines)
+
+    def read(self, title: str) -> str:
+        row = self._get(title)
+        if row is None:
+            return f"Note '{title}' not found."
+        return row[2].strip()
+
+    def body(self, title: str):
+        """Return the body of a note, or None if there is no note with that title."""
+        row = self._get(title)
+        return row[2] if row else None
+
+    def all_notes(self) -> list:
+        """Return (title, body) for every note, oldest first."""
+        return [(title, body) for title, _, body in self._rows()]
+
+    def run_command(self, args: list) -> str:
+        """Answer a scripts/notes.sh command line."""
+        match args:
+            case ["add", title, content]:
+                return self.add(title, content)
+            case ["append", title, content]:
+                return self.append(title, content)
+            case ["delete", title]:
+                return self.delete(title)
+            case ["list"]:
+                return self.list_all()
+            case ["read", title]:
+                return self.read(title)
+            case _:
+                return "Usage: notes {add <title> <content> | append <title> <content> | delete <title> | list | read <title>}"
+
+
+class TasksStore(_Store):
+    table = "tasks"
+    legacy_dir = LEGACY_TASKS_DIR
+
+    def _parse_legacy(self, line: str):
+        # title,created,deadline,filename
+        parts = line.rsplit(",", 3)
+        if len(parts) != 4:
+            return None
+        title, created, deadline, filename = parts
+        body = self._read_legacy_file(filename)
+        if body is None:
+            body = f"{title.upper()}\nCreated: {created} UTC\nDeadline: {deadline}\n"
+        return title, created, deadline, body
+
+    def _insert_legacy(self, rows: list):
+        self.conn.executemany("INSERT OR IGNORE INTO tasks (title, created, deadline, body) VALUES (?, ?, ?, ?)", rows)
+
+    def add(self, title: str, deadline: str = None) -> str:
+        if not title:
+            return "Error: Title is required."
+        if not deadline:
+            tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+            deadline = f"{tomorrow.isoformat()}T00:00:00Z"
+        if not ISO_UTC.match(deadline):
+            return "Invalid deadline format. Use ISO format: YYYY-MM-DDTHH:MM:SSZ"
+        created = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO tasks (title, created, deadline, body) VALUES (?, ?, ?, ?)",
+                (title, created, deadline, f"{title.upper()}\nCreated: {created} UTC\nDeadline: {deadline}\n")
+            ).rowcount
+        if not inserted:
+            return f"A task with the title '{title}' already exists."
+        return f"Task '{title}' added with deadline {deadline}!"
+
+    def delete(self, title: str) -> str:
+        if not self._delete(title):
+            return f"Task '{title}' not found."
+        return f"Task '{title}' deleted."
+
+    def list_all(self) -> str:
+        lines = [f"{'TITLE':<30} {'CREATED':<20} {'DEADLINE':<25}".rstrip()]
+        for title, created, deadline, _ in self._rows():
+            lines.append(f"{title:<30} {created:<20} {deadline:<25}".rstrip())
+        return "\n".join(lines)
+
+    def read(self, title: str) -> str:
+        row = self._get(title)
+        if row is None:
+            return f"Task '{title}' not found."
+        return row[3].strip()
+
+    def run_command(self, args: list) -> str:
+        """Answer a scripts/tasks.sh command line."""
+        match args:
+            case ["add", title]:
+                return self.add(title)
+            case ["add", title, deadline]:
+                return self.add(title, deadline)
+            case ["delete", title]:
+                return self.delete(title)
+            case ["list"]:
+                return self.list_all()
+            case ["read", title]:
+                return self.read(title)
+            case _:
+                return "Usage: tasks {add <title> [deadline] | delete <title> | list | read <title>}"
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(store_class):
+    """Return the shared instance of a store class, opened (and imported) on first use."""
+    with _stores_lock:
+        if store_class not in _stores:
+            _stores[store_class] = store_class()
+        return _stores[store_class]
+
+
+if __name__ == "__main__":
+    # Re-run the import of ~/.notes and ~/.tasks, e.g. after using the script backend for a while
+    print(f"Imported {get_store(NotesStore).import_legacy(force=True)} notes")
+    print(f"Imported {get_store(TasksStore).import_legacy(force=True)} tasks")
@@ -1,11 +1,14 @@
+import asyncio
 import os
 import subprocess
 import datetime
 from pathlib import Path
+from classes.store import TasksStore, get_store
 
 class tasks:
     """
-    Python class to interact with the tasks shell script.
+    Python class to manage tasks, stored in SQLite by default.
+    Set TASKS_BACKEND=script to use the tasks shell script at TASKS_PATH instead.
     This class provides methods to add, delete, list, and read tasks.
     """
     
@@ -14,6 +17,7 @@ class tasks:
         Initialize the tasks class.
         """
         self.script_path = os.environ.get('TASKS_PATH')
+        self.backend = os.environ.get('TASKS_BACKEND', 'sqlite')
         self.detailed_intent = detailed_intent 
     
     def run(self, params: dict):
@@ -31,16 +35,52 @@ class tasks:
             case _:
                 return f"Invalid detailed intent: {self.detailed_intent}"
 
+    async def arun(self, params: dict):
+        """
+        Same as run(), without blocking the event loop: the tasks script runs as an
+        asyncio subprocess, the SQLite store is used from a worker thread.
+        """
+        if self.backend == "script":
+            args = self._args(params)
+            if args is not None:
+                return await self._run_command_async(args)
+        return await asyncio.to_thread(self.run, params)
+
+    def _args(self, params: dict):
+        """
+        The script arguments for the intent, or None if the intent is unknown.
+        """
+        match self.detailed_intent:
+            case "add_task":
+                args = ["add", params["title"]]
+                if params.get("deadline"):
+                    args.append(params["deadline"])
+                return args
+            case "delete_task":
+                return ["delete", params["title"]]
+            case "list_tasks":
+                return ["list"]
+            case "read_task":
+                return ["read", params["title"]]
+            case _:
+                return None
+
     def _run_command(self, args):
         """
-        Run the tasks script with given arguments.
+        Run a tasks command, in process against the SQLite store, or through
+        the tasks script when the script backend is selected.
         
         Args:
-            args (list): List of command-line arguments to pass to the script.
+            args (list): List of command-line arguments, as the script takes them.
             
         Returns:
-            str: Output from the script execution.
+            str: Output from the command.
         """
+        if self.backend != "script":
+            try:
+                return get_store(TasksStore).run_command(args)
+            except Exception as e:
+                return f"Error executing tasks command: {str(e)}"
         try:
             result = subprocess.run(
                 [self.script_path] + args,
@@ -51,6 +91,27 @@ class tasks:
             return result.stdout.strip()
         except Exception as e:
             return f"Error executing tasks command: {str(e)}"
+
+    async def _run_command_async(self, args):
+        """
+        Run a tasks script command as an asyncio subprocess.
+        
+        Args:
+            args (list): List of command-line arguments for the script.
+            
+        Returns:
+            str: Output from the command.
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.script_path, *args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            stdout, _ = await process.communicate()
+            return stdout.decode().strip()
+        except Exception as e:
+            return f"Error executing tasks command: {str(e)}"
     
     def list_tasks(self):
         """
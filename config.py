@@ -1,11 +1,21 @@
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 load_dotenv()
 
-def configure_model(SYSTEMPROMPT):
+MODEL_NAME = 'gemini-1.5-flash'
+
+def configure_model(SYSTEMPROMPT, protocol=None):
+    # Imported on first use, the SDK takes most of a second to load
+    import google.generativeai as genai
+    from prefix_cache import prefix_cache
+    from structured_output import STRUCTURED_PROMPT, generation_config
+
     api_key = os.environ.get('API_KEY')
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name='gemini-1.5-flash', system_instruction=SYSTEMPROMPT)
-    return model
+    # With a protocol the responses are constrained to its JSON schema (unless STRUCTURED_OUTPUT=off)
+    config = generation_config(protocol) if protocol is not None else None
+    if config is not None:
+        SYSTEMPROMPT = SYSTEMPROMPT + STRUCTURED_PROMPT
+    # One model per prompt for the process, its prompt uploaded once to the context cache
+    return prefix_cache.model(MODEL_NAME, SYSTEMPROMPT, config)
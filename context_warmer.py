@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tracing import tracer
+
+# Seconds a warmed listing is served before it is loaded again
+CONTEXT_TTL = float(os.environ.get('CONTEXT_TTL', '30'))
+
+
+class ContextWarmer:
+    """
+    Keeps the context sources of every main intent loaded in memory.
+
+    Each source is a loader registered under its main intent. start() loads all of
+    them on a thread pool, a background thread reloads every entry before it gets
+    older than its TTL, and get() answers from memory, only waiting when a load is
+    already in flight or the entry was invalidated. Executors that change a source
+    call invalidate(), which drops the entry and reloads it right away.
+
+    Sources registered with ttl=0 keep themselves fresh (the filesystem cache checks
+    mtimes, the notes index is updated on every change), for them warming only means
+    building them before the first request and get() always asks the loader.
+
+    Until start() is called get() simply runs the loader, so scripts and tests don't
+    need a running warmer.
+    """
+
+    def __init__(self, ttl: float = CONTEXT_TTL, workers: int = 4):
+        self.ttl = ttl
+        self.workers = workers
+        self.loaders = {}
+        self.ttls = {}
+        self.entries = {}
+        self.pending = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.pool = None
+        self.stop_event = None
+
+    def register(self, name: str, loader, ttl: float = None):
+        self.loaders[name] = loader
+        self.ttls[name] = self.ttl if ttl is None else ttl
+
+    def running(self) -> bool:
+        return self.pool is not None
+
+    def start(self):
+        """Load every source in the background and keep them fresh until stop()."""
+        if self.pool is not None:
+            return
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="context-warmer")
+        self.stop_event = threading.Event()
+        for name in self.loaders:
+            self.refresh(name)
+        threading.Thread(target=self._keep_fresh, daemon=True).start()
+
+    def stop(self):
+        if self.pool is None:
+            return
+        self.stop_event.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+
+    def _load(self, name: str, generation: int):
+        value = None
+        try:
+            with tracer.span("context_load", source=name):
+                value = self.loaders[name]()
+            return value
+        finally:
+            with self.lock:
+                # A load that started before an invalidation may hold the old state, drop it
+                if self.generations.get(name, 0) == generation:
+                    if value is not None:
+                        self.entries[name] = (value, time.monotonic())
+                    self.pending.pop(name, None)
+
+    def refresh(self, name: str):
+        """Start loading a source unless a load is already in flight. Returns its future."""
+        pool = self.pool
+        if pool is None:
+            raise RuntimeError("Context warmer is not running")
+        with self.lock:
+            future = self.pending.get(name)
+            if future is None:
+                future = pool.submit(self._load, name, self.generations.get(name, 0))
+                self.pending[name] = future
+            return future
+
+    def invalidate(self, name: str):
+        """Forget a source's value (it changed) and reload it in the background."""
+        with self.lock:
+            self.entries.pop(name, None)
+            self.pending.pop(name, None)
+            self.generations[name] = self.generations.get(name, 0) + 1
+        if self.pool is not None and name in self.loaders:
+            self.refresh(name)
+
+    def get(self, name: str):
+        """The value of a source: from memory if fresh, otherwise from a (possibly running) load."""
+        if self.pool is None or not self.ttls[name]:
+            return self.loaders[name]()
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is not None and time.monotonic() - entry[1] < self.ttls[name]:
+            return entry[0]
+        try:
+            return self.refresh(name).result()
+        except RuntimeError:
+            # Pool shut down in between, load in place
+            return self.loaders[name]()
+
+    def _keep_fresh(self):
+        stop_event = self.stop_event
+        ttls = [ttl for ttl in self.ttls.values() if ttl]
+        interval = max(min(ttls, default=self.ttl) / 4, 0.5)
+        while not stop_event.wait(interval):
+            now = time.monotonic()
+            for name, ttl in self.ttls.items():
+                if not ttl:
+                    continue
+                with self.lock:
+                    entry = self.entries.get(name)
+                # Reload in the second half of the TTL, so get() never finds it expired
+                if entry is None or now - entry[1] >= ttl / 2:
+                    try:
+                        self.refresh(name)
+                    except RuntimeError:
+                        return
+
+
+context_warmer = ContextWarmer()
@@ -0,0 +1,385 @@
+import json
+import os
+import socket
+import sys
+
+# Unix socket the daemon listens on, only the owner can connect
+SOCKET_PATH = os.environ.get('AIOS_SOCKET') or os.path.join(os.path.expanduser('~'), '.aios', 'aios.sock')
+
+# Protocol: one JSON object per line in both directions.
+#
+# client -> daemon
+#   {"type": "session", "protocol": "fast", "events": false}   optional, resets the chat
+#   {"type": "request", "utterance": "..."}
+#   {"type": "answer", "answer": "..."}                         reply to a preoutput
+# daemon -> client
+#   {"type": "event", "event": "response", "data": {...}}       protocol states, if events were asked for
+#   {"type": "event", "event": "message", "data": {...}}        messages sent to the model, if events were asked for
+#   {"type": "event", "event": "invalid_response", "text": "..."} unparsable model responses, if events were asked for
+#   {"type": "event", "event": "rate_limit", "delay": 2.5}
+#   {"type": "event", "event": "history_compacted", "summary": "...", "saved": 1200}
+#   {"type": "event", "event": "error", "message": "..."}
+#   {"type": "preoutput", "question": "..."}                    the client answers with an "answer"
+#   {"type": "result", "status": "ok", "routed": false, "state": {...}, "result": "...", "llm": {...}}
+#   {"type": "error", "error": "...", "rate_limited": false}
+
+
+class DaemonError(Exception):
+    """A request failed on the daemon side."""
+
+    def __init__(self, message: str, rate_limited: bool = False):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+
+
+# ---------------------------------------------------------------- server side
+# The heavy modules (genai, the engine, the executors) are only imported by serve(),
+# so a thin client importing this module stays fast.
+
+def _session_hooks_class():
+    from engine import EngineHooks
+
+    class SessionHooks(EngineHooks):
+        """Forwards the engine's progress to the client and asks it the preoutput questions."""
+
+        def __init__(self, connection):
+            self.connection = connection
+
+        def on_response(self, jres: dict):
+            if self.connection.events:
+                self.connection.write({"type": "event", "event": "response", "data": jres})
+
+        def on_message(self, payload: dict):
+            if self.connection.events:
+                self.connection.write({"type": "event", "event": "message", "data": payload})
+
+        def on_invalid_response(self, text: str):
+            if self.connection.events:
+                self.connection.write({"type": "event", "event": "invalid_response", "text": text})
+
+        def on_rate_limit(self, delay: float):
+            self.connection.write({"type": "event", "event": "rate_limit", "delay": round(delay, 2)})
+
+        def on_history_compacted(self, report):
+            self.connection.write({"type": "event", "event": "history_compacted", "summary": report.summary(), "saved": report.saved})
+
+        def on_error(self, message: str):
+            self.connection.write({"type": "event", "event": "error", "message": message})
+
+        async def ask_user(self, question: str) -> str:
+            self.connection.write({"type": "preoutput", "question": question})
+            while True:
+                message = await self.connection.read()
+                if message.get("type") == "answer":
+                    return str(message.get("answer", ""))
+                self.connection.write({"type": "error", "error": "Expected an answer to the preoutput question"})
+
+    return SessionHooks
+
+
+class _Connection:
+    """One client, with its own chat session. Requests on a connection run one at a time."""
+
+    def __init__(self, reader, writer, models: dict, hooks_class):
+        self.reader = reader
+        self.writer = writer
+        self.models = models
+        self.hooks = hooks_class(self)
+        self.events = False
+        self.engine = None
+        self._open_session("fast")
+
+    def _open_session(self, protocol: str):
+        from engine import AgentEngine
+        from prompts import PROTOCOLS
+
+        system_prompt, format_prompt = PROTOCOLS[protocol]
+        self.protocol = protocol
+        self.engine = AgentEngine(self.models[protocol].start_chat(), system_prompt, format_prompt, protocol, self.hooks)
+
+    def write(self, message: dict):
+        self.writer.write(json.dumps(message).encode('utf-8') + b"\n")
+
+    async def read(self) -> dict:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Client disconnected")
+        return json.loads(line)
+
+    async def handle(self):
+        while True:
+            try:
+                message = await self.read()
+            except json.JSONDecodeError:
+                self.write({"type": "error", "error": "Invalid JSON"})
+                continue
+            match message.get("type"):
+                case "session":
+                    protocol = message.get("protocol", "fast")
+                    if protocol not in self.models:
+                        self.write({"type": "error", "error": f"Unknown protocol: {protocol}"})
+                    else:
+                        self.events = bool(message.get("events", False))
+                        self._open_session(protocol)
+                        self.write({"type": "session", "protocol": protocol})
+                case "request":
+                    self.write(await self._request(str(message.get("utterance", ""))))
+                case _:
+                    self.write({"type": "error", "error": f"Unknown message type: {message.get('type')}"})
+            await self.writer.drain()
+
+    async def _request(self, utterance: str) -> dict:
+        from llm import RateLimited
+        from router import route_intent
+        from utils import get_class_name
+
+        try:
+            route = route_intent(utterance)
+            if route is not None and route["direct"]:
+                executor = get_class_name(route["main_intent"], route["detailed_intent"])
+                result = await executor.arun({})
+                return {"type": "result", "status": "ok", "routed": True, "result": result, "state": {
+                    "type": "output",
+                    "output": {
+                        "status": "OK",
+                        "main_intent": route["main_intent"],
+                        "detailed_intent": route["detailed_intent"],
+                        "params": {},
+                        "response": result
+                    }
+                }}
+            result = await self.engine.run(utterance, route)
+            return {
+                "type": "result",
+                "status": "ok" if result.output is not None else "error",
+                # The router's hint was passed to the model
+                "routed": route is not None,
+                "state": result.output,
+                "result": result.result,
+                "actions": result.actions,
+                "llm": {
+                    "calls": result.metrics.calls,
+                    "retries": result.metrics.retries,
+                    "throttled": round(result.metrics.throttled, 3),
+                    "cached": result.cached,
+                    "summary": result.metrics.summary(),
+                },
+            }
+        except RateLimited as e:
+            return {"type": "error", "error": str(e), "rate_limited": True}
+        except ConnectionError:
+            raise
+        except Exception as e:
+            return {"type": "error", "error": f"{type(e).__name__}: {e}", "rate_limited": False}
+
+
+async def serve(path: str = SOCKET_PATH):
+    """
+    Run the daemon until SIGINT/SIGTERM: one configured model per protocol, the
+    intent registry and router, and the context warmer stay loaded, each client
+    connection gets its own chat session.
+    """
+    import asyncio
+    import signal
+    from config import configure_model
+    from context_warmer import context_warmer
+    from prefix_cache import prefix_cache
+    from prompts import PROTOCOLS
+    from router import route_intent
+    from tracing import setup as setup_tracing
+
+    if daemon_running(path):
+        raise SystemExit(f"A daemon is already listening on {path}")
+    if os.path.exists(path):
+        # Left behind by a daemon that didn't shut down cleanly
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    # AIOS_TRACE / AIOS_METRICS_PORT
+    setup_tracing()
+    models = {protocol: configure_model(prompts[0], protocol) for protocol, prompts in PROTOCOLS.items()}
+    for protocol, model in models.items():
+        print(f"{protocol}: {prefix_cache.describe(model, protocol)}", file=sys.stderr)
+    context_warmer.start()
+    # Builds the router's index, so the first request doesn't
+    route_intent("")
+    hooks_class = _session_hooks_class()
+
+    async def on_connect(reader, writer):
+        try:
+            await _Connection(reader, writer, models, hooks_class).handle()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    old_umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(on_connect, path=path)
+    finally:
+        os.umask(old_umask)
+    print(f"AIOS daemon listening on {path}", file=sys.stderr)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        context_warmer.stop()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ---------------------------------------------------------------- client side
+
+def daemon_running(path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+class _Metrics:
+    """Stands in for the engine's LLMMetrics in a remote result, main only prints summary()."""
+
+    def __init__(self, llm: dict):
+        self.calls = llm.get("calls", 0)
+        self.retries = llm.get("retries", 0)
+        self.throttled = llm.get("throttled", 0.0)
+        self.text = llm.get("summary", "0 LLM calls")
+
+    def summary(self) -> str:
+        return self.text
+
+
+class RemoteCompactionReport:
+    """Stands in for history.CompactionReport in a history_compacted event."""
+
+    def __init__(self, message: dict):
+        self.text = message.get("summary", "")
+        self.saved = message.get("saved", 0)
+
+    def summary(self) -> str:
+        return self.text
+
+
+class RemoteResult:
+    def __init__(self, message: dict):
+        self.output = message.get("state")
+        self.result = message.get("result")
+        self.routed = message.get("routed", False)
+        self.metrics = _Metrics(message.get("llm", {}))
+        self.cached = message.get("llm", {}).get("cached", 0)
+        self.actions = message.get("actions", [])
+
+
+class RemoteEngine:
+    """
+    Client of the daemon with the interface of AgentEngine (run_sync, close), so the
+    console UI can use either. The daemon routes, asks the model and runs the command,
+    the hooks are called here as its messages come in.
+    """
+
+    def __init__(self, sock: socket.socket, protocol: str = "fast", hooks=None, events: bool = True):
+        self.sock = sock
+        self.stream = sock.makefile('rw', encoding='utf-8')
+        self.hooks = hooks
+        self._send({"type": "session", "protocol": protocol, "events": events and hooks is not None})
+        reply = self._receive()
+        if reply.get("type") != "session":
+            raise DaemonError(reply.get("error", "Could not open a session"))
+
+    @classmethod
+    def connect(cls, protocol: str = "fast", hooks=None, path: str = SOCKET_PATH, events: bool = True):
+        """Connect to a running daemon, or return None if there is none."""
+        if os.environ.get('AIOS_DAEMON', 'on').lower() in ('0', 'off', 'false', 'no') or not os.path.exists(path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock, protocol, hooks, events)
+
+    def _send(self, message: dict):
+        self.stream.write(json.dumps(message) + "\n")
+        self.stream.flush()
+
+    def _receive(self) -> dict:
+        line = self.stream.readline()
+        if not line:
+            raise DaemonError("The daemon closed the connection")
+        return json.loads(line)
+
+    def run_sync(self, utterance: str, route: dict = None) -> RemoteResult:
+        """Run a request on the daemon. The route is ignored, the daemon routes by itself."""
+        self._send({"type": "request", "utterance": utterance})
+        while True:
+            message = self._receive()
+            match message.get("type"):
+                case "event":
+                    if self.hooks is None:
+                        continue
+                    if message["event"] == "response":
+                        self.hooks.on_response(message["data"])
+                    elif message["event"] == "message":
+                        self.hooks.on_message(message["data"])
+                    elif message["event"] == "invalid_response":
+                        self.hooks.on_invalid_response(message["text"])
+                    elif message["event"] == "rate_limit":
+                        self.hooks.on_rate_limit(message["delay"])
+                    elif message["event"] == "history_compacted":
+                        self.hooks.on_history_compacted(RemoteCompactionReport(message))
+                    elif message["event"] == "error":
+                        self.hooks.on_error(message["message"])
+                case "preoutput":
+                    answer = self.hooks.ask_user(message["question"]) if self.hooks is not None else input(f"{message['question']} ")
+                    self._send({"type": "answer", "answer": answer})
+                case "result":
+                    result = RemoteResult(message)
+                    if self.hooks is not None and result.output is not None:
+                        self.hooks.on_output(result.output, result.result)
+                    return result
+                case "error":
+                    raise DaemonError(message.get("error", "Unknown error"), message.get("rate_limited", False))
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.sock.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        import asyncio
+        asyncio.run(serve())
+    elif argv[:1] == ["send"] and len(argv) > 1:
+        # Thin client: run one request and print the result as JSON
+        engine = RemoteEngine.connect()
+        if engine is None:
+            print(f"No daemon listening on {SOCKET_PATH}, start one with: python daemon.py serve", file=sys.stderr)
+            return 1
+        try:
+            result = engine.run_sync(" ".join(argv[1:]))
+        except DaemonError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            engine.close()
+        print(json.dumps({"state": result.output, "result": result.result, "routed": result.routed}, indent=2))
+    else:
+        print("Usage: python daemon.py serve | python daemon.py send <utterance>")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
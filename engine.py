@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import json
+from action_graph import aggregate, parse_actions, run_actions
+from context_warmer import context_warmer
+from history import HistoryManager
+from llm import LLMMetrics, send_message_async
+from registry import registry
+from response_cache import get_response_cache
+from router import routed_hint
+from structured_output import parse_response
+from tracing import tracer
+from utils import get_context_async, get_detailed_intents, get_main_intents, get_params_and_context
+
+
+class EngineHooks:
+    """
+    What the engine needs from the interface. The defaults do nothing and answer
+    preoutput questions with an empty string; main.py implements them for the console.
+    """
+
+    def on_message(self, payload: dict):
+        """A message is about to be sent to the model."""
+
+    def on_response(self, jres: dict):
+        """A protocol state was received (or unpacked from a fast plan)."""
+
+    def on_invalid_response(self, text: str):
+        """The model's answer couldn't be parsed or repaired as a state, a format correction follows."""
+
+    def on_rate_limit(self, delay: float):
+        """The API refused a message for quota, it is retried after delay seconds."""
+
+    def ask_user(self, question: str) -> str:
+        """Answer a preoutput question (may also return an awaitable)."""
+        return ""
+
+    def on_output(self, jres: dict, result):
+        """The request reached its output and the executor returned result."""
+
+    def on_error(self, message: str):
+        """A step failed, the request stops."""
+
+    def on_history_compacted(self, report):
+        """The chat history was compacted before the request (a history.CompactionReport)."""
+
+    def on_timing(self, stage: str, seconds: float):
+        """
+        A stage of the request took seconds: "llm" (one model round trip, rate limiter
+        and cache lookup included), "context" (get_params_and_context) or "executor".
+        """
+
+
+class RequestResult:
+    """What came out of one request: the output state, the executor result and the counters."""
+
+    def __init__(self):
+        self.output = None
+        self.result = None
+        # Status and result of every action the output ran
+        self.actions = []
+        self.metrics = LLMMetrics()
+        self.cached = 0
+
+
+class AgentEngine:
+    """
+    Drives requests through the chat protocol on an asyncio event loop.
+
+    Model calls use the async Gemini client, executors run through their arun()
+    (asyncio subprocesses for the script backed ones), so nothing blocks the loop.
+    Once the main intent is known, from get_detailed_intents, the context for it
+    (task list, atq, notes, file listing) is gathered in the background while the
+    model works out the detailed intent, and the get_params_and_context observation
+    only waits for whatever of it is left.
+
+    The async client is bound to the loop it first ran on, so keep one loop per chat
+    session and run every request of the session on it (see run_sync).
+    """
+
+    def __init__(self, chat, system_prompt: str, format_prompt: str, protocol: str = "fast", hooks: EngineHooks = None, execute: bool = True, history: HistoryManager = None):
+        self.chat = chat
+        self.system_prompt = system_prompt
+        self.format_prompt = format_prompt
+        self.protocol = protocol
+        self.hooks = hooks or EngineHooks()
+        # With execute=False the output is reported without running its command
+        self.execute = execute
+        # Bounds what every message resends of the earlier requests in the session
+        self.history = history or HistoryManager()
+        self.loop = None
+
+    def run_sync(self, utterance: str, route: dict = None) -> RequestResult:
+        """Run a request from synchronous code, on the engine's own event loop."""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self.run(utterance, route))
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+    async def run(self, utterance: str, route: dict = None) -> RequestResult:
+        """
+        Run one request to its output. llm.RateLimited is raised when the quota
+        outlasts the retries, command failures are reported through hooks.on_error.
+        """
+        with tracer.span("request", protocol=self.protocol, routed=route is not None) as span:
+            report = self.history.compact(self.chat)
+            if report is not None:
+                span.set(history_tokens=report.after, history_saved=report.saved)
+                self.hooks.on_history_compacted(report)
+            result = await self._run(utterance, route)
+            span.set(llm_calls=result.metrics.calls, cached=result.cached, retries=result.metrics.retries)
+            if result.output is not None:
+                output = result.output["output"]
+                span.set(main_intent=output.get("main_intent"), detailed_intent=output.get("detailed_intent"), actions=len(output.get("actions") or []))
+        return result
+
+    async def _run(self, utterance: str, route: dict) -> RequestResult:
+        result = RequestResult()
+        prefetched = {}
+        # Known steps of this request are replayed from the cache instead of sent
+        turn = get_response_cache().turn(self.chat, utterance, self.system_prompt, send_message_async)
+
+        async def send(payload: dict):
+            self.hooks.on_message(payload)
+            hits, retries, throttled = turn.hits, result.metrics.retries, result.metrics.throttled
+            with tracer.span("llm", message=payload["type"]) as span:
+                response = await turn.send_async(json.dumps(payload), result.metrics, self.hooks.on_rate_limit)
+                span.set(
+                    cached=turn.hits > hits,
+                    retries=result.metrics.retries - retries,
+                    throttled=round(result.metrics.throttled - throttled, 3)
+                )
+            self.hooks.on_timing("llm", span.duration)
+            return response
+
+        payload = {
+            "type": "user",
+            "user": utterance,
+            "intents": get_main_intents()
+        }
+        if route is not None:
+            # Builds the hinted intent's context, off the loop like any other context fetch
+            payload["routed"] = await asyncio.to_thread(routed_hint, route, utterance)
+
+        try:
+            response = await send(payload)
+            while True:
+                res = response.text.strip()
+                try:
+                    # Malformed JSON (quotes, fences, text around it) is repaired here
+                    jres = parse_response(res)
+                except ValueError:
+                    self.hooks.on_invalid_response(res)
+                    with tracer.span("json_retry", length=len(res)):
+                        response = await send({"type": "SYSTEM", "SYSTEM": f"Response format incorrect. Please correct. \n\n{self.format_prompt}"})
+                    continue
+                self.hooks.on_response(jres)
+                # Fast protocol: the plan carries its next state, handle it right away
+                if self.protocol == "fast" and jres.get("type") == 'plan' and isinstance(jres.get("next"), dict):
+                    jres = jres["next"]
+                    self.hooks.on_response(jres)
+
+                if jres["type"] == 'plan':
+                    response = await send({"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"})
+
+                elif jres["type"] == 'action':
+                    fcn, ipt = jres["function"], jres["input"]
+                    if fcn == 'get_detailed_intents' and isinstance(ipt, dict):
+                        # The response schema makes every input an object
+                        ipt = ipt.get("main_intent")
+                    if fcn == 'preoutput':
+                        with tracer.span("tool", function=fcn):
+                            answer = self.hooks.ask_user(ipt["response"])
+                            if inspect.isawaitable(answer):
+                                # Hooks that ask over the network answer asynchronously
+                                answer = await answer
+                        response = await send({
+                            "type": "preoutput_user_answer",
+                            "preoutput_user_answer": answer
+                        })
+                    else:
+                        output = None
+                        with tracer.span("tool", function=fcn) as span:
+                            if fcn == 'get_detailed_intents':
+                                output = get_detailed_intents(ipt)
+                                if isinstance(ipt, str) and output and ipt not in prefetched:
+                                    prefetched[ipt] = asyncio.create_task(get_context_async(ipt, utterance))
+                            elif fcn == 'get_params_and_context':
+                                span.set(prefetched=isinstance(ipt, dict) and ipt.get("main_intent") in prefetched)
+                                output = await self._params_and_context(ipt, utterance, prefetched)
+                        if fcn == 'get_params_and_context':
+                            self.hooks.on_timing("context", span.duration)
+                        response = await send({
+                            "type": "observation",
+                            "observation": output
+                        })
+
+                elif jres["type"] == 'output':
+                    try:
+                        actions = parse_actions(jres["output"])
+                    except ValueError as e:
+                        response = await send({"type": "SYSTEM", "SYSTEM": f"Invalid actions: {e}. Please correct."})
+                        continue
+                    result.output = jres
+                    if self.execute and actions:
+                        # Independent actions run concurrently, dependents wait for theirs
+                        await run_actions(actions, self.hooks.on_error, self.hooks.on_timing)
+                        # The commands may have changed what the warmed context shows
+                        for main_intent in {action.main_intent for action in actions if action.status == "ok"}:
+                            context_warmer.invalidate(main_intent)
+                        if all(action.status == "ok" for action in actions):
+                            turn.commit()
+                        result.result = aggregate(actions)
+                        result.actions = [action.record() for action in actions]
+                    self.hooks.on_output(jres, result.result)
+                    break
+                else:
+                    self.hooks.on_error(f"Unknown response type: {jres['type']}")
+                    break
+        finally:
+            for task in prefetched.values():
+                task.cancel()
+            result.cached = turn.hits
+        return result
+
+    async def _params_and_context(self, intents: dict, utterance: str, prefetched: dict) -> dict:
+        main_intent = intents["main_intent"]
+        task = prefetched.pop(main_intent, None)
+        if task is None:
+            return await asyncio.to_thread(get_params_and_context, intents, utterance)
+        return {
+            "params": registry.params(main_intent, intents["detailed_intent"]),
+            "context": await task
+        }
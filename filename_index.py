@@ -0,0 +1,399 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from tracing import tracer
+
+try:
+    # Optional, keeps the index current as soon as a directory changes
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+# Set FS_INDEX=off to give the model only the one-level listing again
+ENABLED = os.environ.get('FS_INDEX', 'on').lower() not in ('0', 'off', 'false', 'no')
+# Trees indexed, os.pathsep separated, the file_operation context root by default
+ROOTS = [
+    os.path.abspath(os.path.expanduser(root))
+    for root in (os.environ.get('FS_INDEX_ROOTS') or os.environ.get('FS_CONTEXT_ROOT') or os.path.expanduser('~')).split(os.pathsep)
+    if root
+]
+INDEX_PATH = os.environ.get('AIOS_FS_INDEX_PATH') or os.path.join(os.path.expanduser('~'), '.aios', 'filename_index.db')
+# Without inotify, seconds between the mtime checks that bring the index up to date
+RESCAN_INTERVAL = float(os.environ.get('FS_INDEX_RESCAN', '30'))
+# Directories scanned at the same time
+WORKERS = 8
+# inotify watches taken at most, the rest of the tree is kept current by rescans
+MAX_WATCHES = 8192
+# Directories applied to the database per transaction while walking
+COMMIT_EVERY = 200
+# Seconds a query waits for the first build of an empty index
+FIRST_BUILD_WAIT = 2.0
+# Entries fetched by trigram overlap before they are ranked
+POOL = 200
+# Trigram similarity below which a query word doesn't count as matching a name word
+MIN_SIMILARITY = 0.4
+# Path candidates given to the model
+CANDIDATES = 8
+
+# Package trees and caches, never worth resolving a spoken name against
+SKIP_DIRS = {"node_modules", "__pycache__", "site-packages"}
+
+# Words that describe the request rather than the file
+QUERY_STOPWORDS = {
+    "a", "an", "the", "my", "me", "to", "of", "in", "on", "for", "and", "or", "it", "is", "what", "from",
+    "into", "with", "that", "this", "all", "any", "please", "file", "files", "folder", "folders",
+    "directory", "directories", "move", "copy", "delete", "remove", "open", "show", "list", "put",
+    "called", "named", "inside", "there", "everything",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries(parent);
+CREATE TABLE IF NOT EXISTS trigrams (
+    trigram TEXT NOT NULL,
+    entry INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trigrams_trigram ON trigrams(trigram);
+CREATE INDEX IF NOT EXISTS trigrams_entry ON trigrams(entry);
+"""
+
+
+def tokenize(text: str) -> list:
+    """Words of a name or an utterance, camelCase, digits and punctuation split apart."""
+    return [word.lower() for word in re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+", text)]
+
+
+def trigrams(word: str) -> set:
+    """Trigrams of a word padded like pg_trgm, so short words and word starts get their own."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: set, b: set) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+def _subtree(path: str) -> tuple:
+    """Bounds of the paths below a directory, '0' sorts right after the separator."""
+    return path + os.sep, path + chr(ord(os.sep) + 1)
+
+
+class FilenameIndex:
+    """
+    Trigram index over the names of every file and directory under ROOTS, in SQLite.
+
+    The tree is walked with os.scandir on a thread pool, one directory per task. The
+    mtime of every directory is stored, so the walk after a restart only lists the
+    directories whose entries changed and the index is ready from disk straight away.
+    With inotify_simple installed the walked directories are watched and a change
+    rescans just that directory, otherwise the mtime walk runs again every
+    RESCAN_INTERVAL seconds when the index is used. Hidden entries and package trees
+    are skipped, like the context listing does.
+
+    search() fetches the entries sharing the most trigrams with the words of an
+    utterance and ranks them by how well each word matches a word of the name, with
+    the parent directories counting half, so "the tax pdf from last year in documents"
+    finds ~/Documents/finance/Tax-Return_2023.pdf.
+    """
+
+    def __init__(self, path: str = INDEX_PATH, roots: list = None):
+        self.path = path
+        self.roots = roots if roots is not None else ROOTS
+        self.conn = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.thread = None
+        self.built = threading.Event()
+        self.wake = threading.Event()
+        self.was_empty = False
+        self.refreshed = 0.0
+        self.dirty = set()
+        self.inotify = None
+        self.watches = {}
+        self.watched = set()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        stored = {row[0] for row in conn.execute("SELECT path FROM roots")}
+        if stored != set(self.roots):
+            # Other trees configured, start over
+            with conn:
+                conn.executescript("DELETE FROM roots; DELETE FROM directories; DELETE FROM entries; DELETE FROM trigrams;")
+                conn.executemany("INSERT INTO roots (path) VALUES (?)", [(root,) for root in self.roots])
+        self.was_empty = conn.execute("SELECT COUNT(*) FROM directories").fetchone()[0] == 0
+        self.conn = conn
+
+    def warm(self):
+        """
+        Open the index and keep it current in the background, cheap once started.
+        The context warmer calls it when a session opens, search() on every query.
+        """
+        if not ENABLED:
+            return self
+        with self.state_lock:
+            if self.thread is None:
+                self._open()
+                self.thread = threading.Thread(target=self._maintain, daemon=True, name="filename-index")
+                self.thread.start()
+            elif self.inotify is None and time.monotonic() - self.refreshed > RESCAN_INTERVAL:
+                self.wake.set()
+        return self
+
+    def _maintain(self):
+        try:
+            self.refresh()
+        finally:
+            self.built.set()
+        self._start_watching()
+        while True:
+            self.wake.wait()
+            # Let a burst of changes (a bulk copy) settle into one update
+            time.sleep(0.5)
+            self.wake.clear()
+            with self.state_lock:
+                dirty, self.dirty = self.dirty, set()
+            try:
+                if dirty:
+                    self.refresh(sorted(dirty))
+                else:
+                    self.refresh()
+            except Exception:
+                # A broken update must not end the thread, the next one starts over
+                continue
+
+    def _scan(self, directory: str, known_mtime: int, force: bool):
+        """
+        List one directory on a worker thread.
+
+        Returns:
+            tuple: The directory, its mtime and its (name, is_dir) entries, or None for the
+            entries when the mtime says they didn't change.
+        """
+        mtime_ns = os.stat(directory).st_mtime_ns
+        if not force and mtime_ns == known_mtime:
+            return directory, mtime_ns, None
+        entries = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir and entry.name in SKIP_DIRS:
+                    continue
+                entries.append((entry.name, is_dir))
+        return directory, mtime_ns, entries
+
+    def _remove(self, path: str):
+        low, high = _subtree(path)
+        self.conn.execute(
+            "DELETE FROM trigrams WHERE entry IN (SELECT id FROM entries WHERE path = ? OR (path >= ? AND path < ?))",
+            (path, low, high)
+        )
+        self.conn.execute("DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+        self.conn.execute("DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+
+    def _apply(self, directory: str, mtime_ns: int, entries: list) -> list:
+        """Bring the entries of one directory in line with a scan. Returns the new subdirectories."""
+        with self.lock:
+            known = dict(self.conn.execute("SELECT name, is_dir FROM entries WHERE parent = ?", (directory,)).fetchall())
+            current = dict(entries)
+            added = []
+            for name, is_dir in known.items():
+                if current.get(name) != is_dir:
+                    self._remove(os.path.join(directory, name))
+            for name, is_dir in current.items():
+                if known.get(name) == is_dir:
+                    continue
+                path = os.path.join(directory, name)
+                entry = self.conn.execute(
+                    "INSERT INTO entries (path, parent, name, is_dir) VALUES (?, ?, ?, ?)",
+                    (path, directory, name, int(is_dir))
+                ).lastrowid
+                grams = set().union(set(), *(trigrams(word) for word in tokenize(name)))
+                self.conn.executemany("INSERT INTO trigrams (trigram, entry) VALUES (?, ?)", [(gram, entry) for gram in grams])
+                if is_dir:
+                    added.append(path)
+            self.conn.execute("INSERT OR REPLACE INTO directories (path, mtime_ns) VALUES (?, ?)", (directory, mtime_ns))
+        return added
+
+    def _children(self, directory: str) -> list:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT path FROM entries WHERE parent = ? AND is_dir = 1", (directory,))]
+
+    def refresh(self, directories: list = None):
+        """
+        Walk the roots and update what changed, or only rescan the given directories
+        (and whatever new directories turn up under them).
+        """
+        full = directories is None
+        with self.refresh_lock, tracer.span("filename_index_refresh", full=full) as span:
+            with self.lock:
+                known = dict(self.conn.execute("SELECT path, mtime_ns FROM directories").fetchall())
+            starts = self.roots if full else directories
+            scanned = 0
+            applied = 0
+            with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="filename-index") as pool:
+                pending = {pool.submit(self._scan, directory, known.get(directory), not full): directory for directory in starts}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        directory = pending.pop(future)
+                        try:
+                            directory, mtime_ns, entries = future.result()
+                        except FileNotFoundError:
+                            # Gone, the scan of its parent drops it too
+                            with self.lock:
+                                self._remove(directory)
+                            continue
+                        except OSError:
+                            # No permission, keep what is known about it
+                            continue
+                        if entries is None:
+                            subdirectories = self._children(directory)
+                        else:
+                            scanned += 1
+                            added = self._apply(directory, mtime_ns, entries)
+                            applied += 1
+                            if applied % COMMIT_EVERY == 0:
+                                with self.lock:
+                                    self.conn.commit()
+                            subdirectories = [os.path.join(directory, name) for name, is_dir in entries if is_dir] if full else added
+                            self._watch(added)
+                        for subdirectory in subdirectories:
+                            pending[pool.submit(self._scan, subdirectory, known.get(subdirectory), False)] = subdirectory
+            with self.lock:
+                self.conn.commit()
+            self.refreshed = time.monotonic()
+            span.set(scanned=scanned)
+
+    def _start_watching(self):
+        if INotify is None:
+            return
+        try:
+            self.inotify = INotify()
+        except OSError:
+            self.inotify = None
+            return
+        with self.lock:
+            directories = [row[0] for row in self.conn.execute("SELECT path FROM directories")]
+        self._watch(directories)
+        threading.Thread(target=self._read_events, daemon=True, name="filename-index-inotify").start()
+
+    def _watch(self, directories: list):
+        if self.inotify is None:
+            return
+        mask = (inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO)
+        for directory in directories:
+            if directory in self.watched:
+                continue
+            if len(self.watched) >= MAX_WATCHES:
+                return
+            try:
+                self.watches[self.inotify.add_watch(directory, mask)] = directory
+                self.watched.add(directory)
+            except OSError:
+                # Out of watches (fs.inotify.max_user_watches) or gone
+                return
+
+    def _read_events(self):
+        while True:
+            for event in self.inotify.read():
+                directory = self.watches.get(event.wd)
+                if directory is not None:
+                    with self.state_lock:
+                        self.dirty.add(directory)
+                    self.wake.set()
+
+    def changed(self, *paths: str):
+        """
+        Rescan the directories of paths a command just created, moved or deleted, so
+        the next request sees them without waiting for inotify or the next mtime walk.
+        """
+        if self.thread is None:
+            return
+        directories = set()
+        for path in paths:
+            if not isinstance(path, str):
+                continue
+            path = os.path.abspath(path.rstrip(os.sep) or os.sep)
+            # The parent lists the path coming or going, the path itself what was copied into it
+            for directory in ([path] if os.path.isdir(path) else []) + [os.path.dirname(path)]:
+                if any(directory == root or directory.startswith(root + os.sep) for root in self.roots):
+                    directories.add(directory)
+        if directories:
+            with self.state_lock:
+                self.dirty.update(directories)
+            self.wake.set()
+
+    def search(self, text: str, limit: int = CANDIDATES) -> list:
+        """
+        Paths whose names best match the words of text, best first.
+
+        Args:
+            text (str): The utterance.
+            limit (int): Candidates returned at most.
+
+        Returns:
+            list[tuple[str, bool, float]]: Path, whether it is a directory and its score.
+        """
+        if not ENABLED:
+            return []
+        self.warm()
+        if self.was_empty:
+            self.built.wait(FIRST_BUILD_WAIT)
+        words = [word for word in tokenize(text or "") if word not in QUERY_STOPWORDS and len(word) > 1]
+        query = {word: trigrams(word) for word in words}
+        grams = set().union(set(), *query.values())
+        if not grams:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT e.path, e.name, e.is_dir, COUNT(*) AS hits FROM trigrams t JOIN entries e ON e.id = t.entry "
+                f"WHERE t.trigram IN ({','.join('?' * len(grams))}) GROUP BY t.entry ORDER BY hits DESC LIMIT ?",
+                (*grams, POOL)
+            ).fetchall()
+
+        def matched(query_grams: set, names: list) -> float:
+            best = max((similarity(query_grams, trigrams(name)) for name in names), default=0.0)
+            return best if best >= MIN_SIMILARITY else 0.0
+
+        ranked = []
+        for path, name, is_dir, _ in rows:
+            name_words = tokenize(name)
+            root = next((root for root in self.roots if path.startswith(root + os.sep)), "")
+            parent_words = tokenize(os.path.dirname(path)[len(root):])
+            score = 0.0
+            for query_grams in query.values():
+                in_name = matched(query_grams, name_words)
+                score += in_name if in_name else matched(query_grams, parent_words) / 2
+            if score > 0:
+                ranked.append((path, bool(is_dir), round(score, 3)))
+        ranked.sort(key=lambda item: (-item[2], item[0].count(os.sep), item[0]))
+        return ranked[:limit]
+
+
+filename_index = FilenameIndex()
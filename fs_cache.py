@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+
+try:
+    # Optional, used to invalidate snapshots as soon as a watched directory changes
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+# Upper bound for the listing sent to the model
+MAX_EXCERPT_CHARS = 4000
+
+
+class DirectorySnapshot:
+    """
+    One-level listing of a directory, taken with a single os.scandir pass.
+    Entries are (name, is_dir, size) tuples, size is None for directories.
+    """
+
+    def __init__(self, directory: str, mtime_ns: int, entries: list):
+        self.directory = directory
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+
+    @classmethod
+    def scan(cls, directory: str):
+        mtime_ns = os.stat(directory).st_mtime_ns
+        entries = []
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir():
+                        entries.append((entry.name, True, None))
+                    else:
+                        entries.append((entry.name, False, entry.stat().st_size))
+                except OSError:
+                    # Broken symlinks and entries removed mid-scan
+                    continue
+        entries.sort(key=lambda item: item[0].lower())
+        return cls(directory, mtime_ns, entries)
+
+    def directories(self) -> list:
+        return [name for name, is_dir, _ in self.entries if is_dir]
+
+    def files(self) -> list:
+        return [(name, size) for name, is_dir, size in self.entries if not is_dir]
+
+
+class FilesystemCache:
+    """
+    In-memory directory snapshots keyed by directory.
+
+    With inotify_simple installed, watched directories are marked dirty by kernel events.
+    Otherwise a snapshot is reused for as long as the directory's mtime is unchanged, which
+    catches entries being added, removed or renamed but not a file changing size in place.
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._inotify = None
+        self._watches = {}
+        self._watched = set()
+        if INotify is not None:
+            try:
+                self._inotify = INotify()
+                threading.Thread(target=self._watch, daemon=True).start()
+            except OSError:
+                self._inotify = None
+
+    def _watch(self):
+        while True:
+            for event in self._inotify.read():
+                directory = self._watches.get(event.wd)
+                if directory is not None:
+                    with self._lock:
+                        self._dirty.add(directory)
+
+    def _add_watch(self, directory: str):
+        if self._inotify is None or directory in self._watched:
+            return
+        try:
+            mask = (inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM |
+                    inotify_flags.MOVED_TO | inotify_flags.CLOSE_WRITE | inotify_flags.DELETE_SELF)
+            self._watches[self._inotify.add_watch(directory, mask)] = directory
+            self._watched.add(directory)
+        except OSError:
+            pass
+
+    def snapshot(self, directory: str) -> DirectorySnapshot:
+        """Return the snapshot of a directory, rescanning only if it changed."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            cached = self._snapshots.get(directory)
+            dirty = directory in self._dirty
+        if cached is not None and not dirty:
+            if directory in self._watched or os.stat(directory).st_mtime_ns == cached.mtime_ns:
+                return cached
+
+        # Watch and clear the flag before scanning, a change made during the scan marks
+        # the directory dirty again instead of being lost
+        self._add_watch(directory)
+        with self._lock:
+            self._dirty.discard(directory)
+        snapshot = DirectorySnapshot.scan(directory)
+        with self._lock:
+            self._snapshots[directory] = snapshot
+        return snapshot
+
+    def invalidate(self, directory: str = None):
+        """Drop one snapshot, or all of them. Called after file operations change the tree."""
+        with self._lock:
+            if directory is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(os.path.abspath(directory), None)
+
+
+def format_size(size_bytes: int) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size_bytes < 1024.0 or unit == 'TB':
+            return f"{size_bytes:.2f} {unit}"
+        size_bytes /= 1024.0
+
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 1}
+
+
+def relevance(name: str, words: set) -> int:
+    """Number of utterance words found in an entry name (as whole words or as prefixes of its words)."""
+    name_words = _words(name)
+    score = 0
+    for word in words:
+        if word in name_words:
+            score += 2
+        elif any(name_word.startswith(word) or word.startswith(name_word) for name_word in name_words if len(name_word) > 2):
+            score += 1
+    return score
+
+
+def excerpt(snapshot: DirectorySnapshot, utterance: str = None, max_chars: int = MAX_EXCERPT_CHARS) -> str:
+    """
+    Format a snapshot for the prompt, entries matching the utterance first, cut at max_chars.
+    """
+    words = _words(utterance or "")
+    ranked = sorted(
+        snapshot.entries,
+        key=lambda item: (-relevance(item[0], words), item[0].startswith('.'), item[0].lower())
+    )
+
+    result = f"Contents of {snapshot.directory} ({len(snapshot.entries)} entries, most relevant first):\n"
+    shown = 0
+    for name, is_dir, size in ranked:
+        line = f"{name}/ (directory)\n" if is_dir else f"{name} ({format_size(size)})\n"
+        if len(result) + len(line) > max_chars:
+            break
+        result += line
+        shown += 1
+    if shown < len(ranked):
+        result += f"... and {len(ranked) - shown} more entries not shown"
+    return result.rstrip("\n")
+
+
+fs_cache = FilesystemCache()
@@ -0,0 +1,203 @@
+import json
+import os
+
+# Completed requests kept verbatim in the chat history, older ones are summarized
+KEEP_REQUESTS = int(os.environ.get('AIOS_HISTORY_REQUESTS', '3'))
+# Estimated tokens the history may hold, fewer requests are kept verbatim beyond it
+TOKEN_BUDGET = int(os.environ.get('AIOS_HISTORY_TOKENS', '8000'))
+# Summarized requests carried along, the oldest are forgotten
+SUMMARY_REQUESTS = int(os.environ.get('AIOS_HISTORY_SUMMARY', '20'))
+# Rough size of a Gemini token
+CHARS_PER_TOKEN = 4
+
+STALE_OBSERVATION = "(dropped from history: stale, call the function again if needed)"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def _role(entry) -> str:
+    return entry["role"] if isinstance(entry, dict) else entry.role
+
+
+def _text(entry) -> str:
+    """Text of a history entry: a Content proto from the SDK or a dict set by us or the response cache."""
+    parts = entry["parts"] if isinstance(entry, dict) else entry.parts
+    return "".join(part if isinstance(part, str) else part.get("text", "") if isinstance(part, dict) else part.text for part in parts)
+
+
+def _state(text: str):
+    try:
+        state = json.loads(text)
+    except json.JSONDecodeError:
+        from structured_output import parse_response
+        try:
+            state = parse_response(text)
+        except ValueError:
+            return None
+    return state if isinstance(state, dict) else None
+
+
+def _entry(role: str, message: dict) -> dict:
+    return {"role": role, "parts": [json.dumps(message)]}
+
+
+class CompactionReport:
+    def __init__(self, before: int, after: int, summarized: int, observations: int):
+        self.before = before
+        self.after = after
+        self.summarized = summarized
+        self.observations = observations
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+    def summary(self) -> str:
+        return (f"History {self.before} -> {self.after} tokens, {self.summarized} request"
+                f"{'s' if self.summarized != 1 else ''} summarized, {self.observations} observation"
+                f"{'s' if self.observations != 1 else ''} dropped")
+
+
+class HistoryManager:
+    """
+    Keeps a chat session's history bounded.
+
+    Every request sent resends the whole history, so it is compacted before each new
+    request: the last keep_requests completed requests stay verbatim, older ones are
+    folded into one summary exchange at the start of the history (utterance, intents,
+    params and response of each, no model call involved), and the observation payloads
+    of completed requests, the contexts they were given, are always replaced by a
+    placeholder since they are stale by the next request. Format corrections lose the
+    format prompt they carried. While the history is above token_budget (estimated)
+    fewer requests are kept verbatim.
+    """
+
+    def __init__(self, keep_requests: int = KEEP_REQUESTS, token_budget: int = TOKEN_BUDGET, summary_requests: int = SUMMARY_REQUESTS):
+        self.keep_requests = max(0, keep_requests)
+        self.token_budget = token_budget
+        self.summary_requests = summary_requests
+
+    def _split(self, history: list):
+        """The summarized requests already in the history and the entries of every request after them."""
+        summary = []
+        requests = []
+        for entry in history:
+            state = _state(_text(entry)) if _role(entry) == "user" else None
+            if state is not None and state.get("type") == "history":
+                summary.extend(state.get("history", []))
+            elif state is not None and state.get("type") == "user":
+                requests.append([entry])
+            elif requests:
+                requests[-1].append(entry)
+            # Anything before the first request that isn't a summary is the summary's acknowledgement
+        return summary, requests
+
+    @staticmethod
+    def _summarize(request: list) -> dict:
+        first = _state(_text(request[0])) or {}
+        line = {"user": first.get("user", ""), "status": "INCOMPLETE"}
+        for entry in request:
+            state = _state(_text(entry)) if _role(entry) == "model" else None
+            if state is None:
+                continue
+            if state.get("type") == "plan" and isinstance(state.get("next"), dict):
+                state = state["next"]
+            if state.get("type") == "output" and isinstance(state.get("output"), dict):
+                output = state["output"]
+                line.update(status=output.get("status", "OK"), response=output.get("response"))
+                if isinstance(output.get("actions"), list):
+                    line["actions"] = [
+                        {key: action.get(key) for key in ("main_intent", "detailed_intent", "params")}
+                        for action in output["actions"] if isinstance(action, dict)
+                    ]
+                else:
+                    line.update(
+                        main_intent=output.get("main_intent"),
+                        detailed_intent=output.get("detailed_intent"),
+                        params=output.get("params"),
+                    )
+        return line
+
+    @staticmethod
+    def _strip(request: list):
+        """
+        Drop the stale payloads of a completed request.
+
+        Returns:
+            tuple[list, int, bool]: The entries, the payloads dropped and whether anything changed.
+        """
+        entries = []
+        dropped = 0
+        changed = False
+        for entry in request:
+            state = _state(_text(entry)) if _role(entry) == "user" else None
+            if state is None:
+                entries.append(entry)
+            elif state.get("type") == "observation" and state.get("observation") != STALE_OBSERVATION:
+                entries.append(_entry("user", {"type": "observation", "observation": STALE_OBSERVATION}))
+                dropped += 1
+            elif state.get("type") == "user" and isinstance(state.get("routed"), dict) and "params_and_context" in state["routed"]:
+                routed = {key: value for key, value in state["routed"].items() if key != "params_and_context"}
+                entries.append(_entry("user", dict(state, routed=routed)))
+                dropped += 1
+            elif state.get("type") == "SYSTEM" and str(state.get("SYSTEM", "")).startswith("Response format incorrect") and len(state["SYSTEM"]) > 60:
+                entries.append(_entry("user", {"type": "SYSTEM", "SYSTEM": "Response format incorrect. Please correct."}))
+                changed = True
+            else:
+                entries.append(entry)
+        return entries, dropped, changed or dropped > 0
+
+    def _build(self, summary: list, requests: list) -> list:
+        history = []
+        if summary:
+            history.append(_entry("user", {
+                "type": "history",
+                "note": "Summary of the earlier requests of this session, for reference only",
+                "history": summary[-self.summary_requests:]
+            }))
+            history.append(_entry("model", {"type": "plan", "plan": "Noted the earlier requests of this session."}))
+        for request in requests:
+            history.extend(request)
+        return history
+
+    @staticmethod
+    def tokens(history: list) -> int:
+        return sum(estimate_tokens(_text(entry)) for entry in history)
+
+    def compact(self, chat):
+        """
+        Compact chat.history in place, call it between requests.
+
+        Returns:
+            CompactionReport | None: What was saved, None if there was nothing to compact.
+        """
+        history = list(chat.history)
+        if not history:
+            return None
+        before = self.tokens(history)
+        summary, requests = self._split(history)
+
+        observations = 0
+        changed = False
+        stripped = []
+        for request in requests:
+            entries, dropped, request_changed = self._strip(request)
+            stripped.append(entries)
+            observations += dropped
+            changed = changed or request_changed
+
+        keep = min(self.keep_requests, len(stripped))
+        while True:
+            old, recent = stripped[:len(stripped) - keep], stripped[len(stripped) - keep:]
+            compacted = self._build(summary + [self._summarize(request) for request in old], recent)
+            if keep == 0 or self.tokens(compacted) <= self.token_budget:
+                break
+            keep -= 1
+        summarized = len(old)
+
+        if not changed and not summarized:
+            return None
+        chat.history = compacted
+        return CompactionReport(before, self.tokens(compacted), summarized, observations)
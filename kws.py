@@ -0,0 +1,229 @@
+import os
+import queue
+import sys
+import threading
+import numpy as np
+from vad import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+BLOCKSIZE = 512
+KWS_DIR = os.environ.get('KWS_DIR') or os.path.join(os.path.expanduser('~'), '.aios', 'kws')
+
+# MFCC parameters
+FRAME_LENGTH = 400   # 25 ms
+HOP_LENGTH = 160     # 10 ms
+N_FFT = 512
+N_MELS = 26
+N_MFCC = 13
+
+# Keywords are short, longer speech segments are not even compared
+MAX_SEGMENT_SECONDS = 1.5
+# A segment matches a keyword when its DTW distance is below this many times the
+# average distance between the keyword's own enrolled samples
+MATCH_MARGIN = 1.35
+# Sakoe-Chiba band, as a share of the longer sequence
+DTW_BAND = 0.25
+
+
+def _mel_filterbank():
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(SAMPLE_RATE / 2), N_MELS + 2)
+    bins = np.floor((N_FFT + 1) * mel_to_hz(mel_points) / SAMPLE_RATE).astype(int)
+    filterbank = np.zeros((N_MELS, N_FFT // 2 + 1))
+    for m in range(1, N_MELS + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filterbank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            filterbank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return filterbank
+
+
+def _dct_matrix():
+    n = np.arange(N_MELS)
+    k = np.arange(N_MFCC)[:, None]
+    return np.sqrt(2 / N_MELS) * np.cos(np.pi * k * (2 * n + 1) / (2 * N_MELS))
+
+
+MEL_FILTERBANK = _mel_filterbank()
+DCT_MATRIX = _dct_matrix()
+WINDOW = np.hamming(FRAME_LENGTH)
+
+
+def mfcc(audio: np.ndarray) -> np.ndarray:
+    """
+    MFCC features of an int16 signal, one row of N_MFCC coefficients per 10 ms,
+    with cepstral mean normalization so the microphone gain doesn't matter.
+    """
+    samples = audio.reshape(-1).astype(np.float64) / 32768.0
+    samples = np.append(samples[0], samples[1:] - 0.97 * samples[:-1]) if len(samples) else samples
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+    count = 1 + (len(samples) - FRAME_LENGTH) // HOP_LENGTH
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH][:count]
+    power = np.abs(np.fft.rfft(frames * WINDOW, N_FFT)) ** 2 / N_FFT
+    energies = np.log(np.maximum(power @ MEL_FILTERBANK.T, 1e-10))
+    coefficients = energies @ DCT_MATRIX.T
+    return coefficients - coefficients.mean(axis=0)
+
+
+def dtw_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Dynamic time warping distance between two feature sequences, normalized by
+    their total length. Frame distances are computed in one vectorized step, the
+    alignment is restricted to a band around the diagonal.
+    """
+    n, m = len(a), len(b)
+    cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    band = max(int(DTW_BAND * max(n, m)), abs(n - m))
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for i in range(1, n + 1):
+        center = i * m // n
+        for j in range(max(1, center - band), min(m, center + band) + 1):
+            accumulated[i, j] = cost[i - 1, j - 1] + min(
+                accumulated[i - 1, j], accumulated[i, j - 1], accumulated[i - 1, j - 1]
+            )
+    return float(accumulated[n, m] / (n + m))
+
+
+class KeywordSpotter:
+    """
+    Offline keyword spotting by template matching.
+
+    Every keyword has a few enrolled recordings in KWS_DIR/<keyword>/*.npy. Incoming
+    audio is cut into speech segments by the VAD, and only complete short segments
+    are turned into MFCCs and compared (DTW) against the templates, so the CPU cost
+    between utterances is the VAD's energy computation.
+    """
+
+    def __init__(self, directory: str = KWS_DIR):
+        self.directory = directory
+        self.templates = {}
+        self.thresholds = {}
+        self.load()
+
+    def load(self):
+        self.templates = {}
+        if not os.path.isdir(self.directory):
+            return
+        for keyword in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, keyword)
+            if not os.path.isdir(path):
+                continue
+            features = [mfcc(np.load(os.path.join(path, name)))
+                        for name in sorted(os.listdir(path)) if name.endswith('.npy')]
+            if features:
+                self.templates[keyword] = features
+                self.thresholds[keyword] = self._threshold(features)
+
+    @staticmethod
+    def _threshold(features: list) -> float:
+        """Acceptance threshold from the spread of a keyword's own samples."""
+        distances = [dtw_distance(features[i], features[j])
+                     for i in range(len(features)) for j in range(i + 1, len(features))]
+        if not distances:
+            # A single sample gives no spread, fall back to a fixed, fairly strict distance
+            return 4.0
+        return MATCH_MARGIN * float(np.mean(distances))
+
+    def keywords(self) -> list:
+        return list(self.templates.keys())
+
+    def match(self, segment: np.ndarray):
+        """
+        Return the keyword a speech segment matches, or None.
+        """
+        if len(segment) > MAX_SEGMENT_SECONDS * SAMPLE_RATE or not self.templates:
+            return None
+        features = mfcc(segment)
+        best, best_ratio = None, 1.0
+        for keyword, templates in self.templates.items():
+            distance = min(dtw_distance(features, template) for template in templates)
+            ratio = distance / self.thresholds[keyword]
+            if ratio < best_ratio:
+                best, best_ratio = keyword, ratio
+        return best
+
+    def listen(self, keywords: set = None, stop_event: threading.Event = None):
+        """
+        Listen on the microphone until one of keywords (all enrolled ones by default)
+        is spoken, and return it. Returns None if stop_event is set first.
+
+        The audio callback only queues blocks, segmentation and matching happen on
+        this thread.
+        """
+        import sounddevice as sd
+
+        keywords = set(keywords or self.templates.keys())
+        stop_event = stop_event or threading.Event()
+        blocks = queue.Queue()
+
+        def callback(indata, frames, time_info, status):
+            blocks.put(indata.copy())
+
+        vad = VoiceActivityDetector(onset_frames=2, hangover_frames=6)
+        segment = []
+        with sd.InputStream(callback=callback, channels=1, samplerate=SAMPLE_RATE,
+                            dtype='int16', blocksize=BLOCKSIZE):
+            while not stop_event.is_set():
+                try:
+                    block = blocks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                vad.is_speech(block)
+                if vad.speaking:
+                    segment.append(block)
+                elif segment:
+                    keyword = self.match(np.concatenate(segment))
+                    segment = []
+                    if keyword in keywords:
+                        return keyword
+        return None
+
+    def start(self, on_keyword, keywords: set = None):
+        """
+        Spot keywords on a background thread, calling on_keyword(keyword) on every
+        detection. Returns the event that stops the thread when set.
+        """
+        stop_event = threading.Event()
+
+        def run():
+            while not stop_event.is_set():
+                keyword = self.listen(keywords, stop_event)
+                if keyword is not None:
+                    on_keyword(keyword)
+
+        threading.Thread(target=run, daemon=True).start()
+        return stop_event
+
+
+def enroll(keyword: str, samples: int = 3, seconds: float = 2.0, directory: str = KWS_DIR):
+    """
+    Record a few samples of a keyword and store them (trimmed to the speech) as templates.
+    """
+    import sounddevice as sd
+
+    path = os.path.join(directory, keyword)
+    os.makedirs(path, exist_ok=True)
+    existing = len([name for name in os.listdir(path) if name.endswith('.npy')])
+    for number in range(samples):
+        input(f"Press Enter, then say '{keyword}' ({number + 1}/{samples})")
+        audio = sd.rec(int(seconds * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype='int16')
+        sd.wait()
+        audio = VoiceActivityDetector().trim(audio.reshape(-1), BLOCKSIZE)
+        np.save(os.path.join(path, f"{existing + number}.npy"), audio)
+    print(f"Enrolled {samples} samples of '{keyword}' in {path}")
+
+
+if __name__ == "__main__":
+    # python kws.py enroll <keyword> [samples]
+    if len(sys.argv) >= 3 and sys.argv[1] == "enroll":
+        enroll(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 3)
+    else:
+        print("Usage: python kws.py enroll <keyword> [samples]")
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+# Client side quota, keep it at or below the model's requests-per-minute limit, 0 disables it
+RPM = float(os.environ.get('GEMINI_RPM', '15'))
+# Requests that may go out back to back before the per-minute rate applies
+BURST = int(os.environ.get('GEMINI_BURST', '3'))
+# Attempts after a ResourceExhausted before giving up on a message
+MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '5'))
+# Used when the error doesn't say how long to wait
+DEFAULT_RETRY_DELAY = 5
+# Random extra wait, as a share of the retry delay, so queued requests don't retry in lockstep
+JITTER = 0.25
+
+
+class RateLimited(Exception):
+    """The API kept refusing a message for quota after every retry."""
+
+    def __init__(self, retry_delay: int, retries: int = MAX_RETRIES):
+        super().__init__(f"API rate limit still exceeded after {retries} retries, retry in {retry_delay}s")
+        self.retry_delay = retry_delay
+        self.retries = retries
+
+
+def get_retry_delay_from_error(error):
+    """
+    Extract the retry delay from a GoogleAPI ResourceExhausted error.
+    """
+    error_str = str(error)
+    try:
+        if "retry_delay" in error_str and "seconds" in error_str:
+            match = re.search(r'retry_delay \{\s*seconds: (\d+)\s*\}', error_str)
+            if match:
+                return int(match.group(1))
+    except Exception:
+        pass
+    return DEFAULT_RETRY_DELAY
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by every LLM call in the process.
+
+    Tokens refill at rate_per_minute / 60 per second up to capacity, each request takes
+    one. Callers waiting for a token are served strictly in arrival order (ticket
+    numbers), so concurrent requests queue instead of failing or starving each other.
+    pause() empties the bucket and holds everyone back, used when the server reports
+    that the quota is exhausted anyway. A rate of 0 or less means no client side limit,
+    only pauses hold callers back.
+    """
+
+    def __init__(self, rate_per_minute: float = RPM, capacity: int = BURST):
+        # None when unlimited, dividing by a zero rate would fail on the first wait
+        self.rate = rate_per_minute / 60.0 if rate_per_minute > 0 else None
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.next_ticket = 0
+        self.serving = 0
+        self.condition = threading.Condition()
+
+    def _refill(self, now: float):
+        if self.rate is None:
+            self.tokens = float(self.capacity)
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """
+        Block until a token is available and this caller is first in line.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        start = time.monotonic()
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while True:
+                now = time.monotonic()
+                if ticket == self.serving:
+                    self._refill(now)
+                    if self.tokens >= 1 and now >= self.paused_until:
+                        self.tokens -= 1
+                        self.serving += 1
+                        self.condition.notify_all()
+                        break
+                    wait = self.paused_until - now
+                    if self.tokens < 1:
+                        wait = max(wait, (1 - self.tokens) / self.rate)
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
+        return time.monotonic() - start
+
+    def pause(self, seconds: float):
+        with self.condition:
+            self._refill(time.monotonic())
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+
+class LLMMetrics:
+    """Counters for the LLM calls of one user request."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, waited: float, retried: bool = False):
+        with self.lock:
+            self.throttled += waited
+            if retried:
+                self.retries += 1
+            else:
+                self.calls += 1
+
+    def summary(self) -> str:
+        text = f"{self.calls} LLM call{'s' if self.calls != 1 else ''}"
+        if self.throttled >= 0.01:
+            text += f", {self.throttled:.2f}s throttled"
+        if self.retries:
+            text += f", {self.retries} retr{'ies' if self.retries != 1 else 'y'}"
+        return text
+
+
+bucket = TokenBucket()
+# Process wide counters, per request ones are passed to send_message
+totals = LLMMetrics()
+
+
+def _rebuild_model(chat):
+    """A replacement for the chat's model when its cached prefix is gone, None if it has none."""
+    from prefix_cache import prefix_cache
+
+    model = getattr(chat, "model", None)
+    return prefix_cache.rebuild(model) if model is not None else None
+
+
+def send_message(chat, content, metrics: LLMMetrics = None, on_retry=None):
+    """
+    Send a message on a chat session through the shared rate limiter.
+
+    On ResourceExhausted the whole process backs off for the server supplied delay
+    (plus jitter) and the message is sent again, up to MAX_RETRIES times, then
+    RateLimited is raised. When the model's cached prompt prefix was deleted on the
+    server (NotFound) the model is rebuilt once with the prefix uploaded again. The chat
+    history is only extended by successful sends, so a retry doesn't duplicate turns.
+
+    Args:
+        chat: A ChatSession (anything with send_message).
+        content: The message to send.
+        metrics (LLMMetrics): Optional counters for the current request.
+        on_retry: Optional callable(delay) called before waiting to retry.
+
+    Returns:
+        The model's response.
+    """
+    # Imported here, google.api_core is only needed once there is a chat to send on
+    from google.api_core.exceptions import NotFound, ResourceExhausted
+
+    retried = False
+    rebuilt = False
+    retries = 0
+    # One more send than the quota retries, for the rebuild after a NotFound
+    for _ in range(MAX_RETRIES + 2):
+        waited = bucket.acquire()
+        for counters in (metrics, totals):
+            if counters is not None:
+                counters.record(waited, retried)
+        try:
+            return chat.send_message(content)
+        except NotFound:
+            # The cached prompt prefix expired on the server, upload it again and resend
+            model = None if rebuilt else _rebuild_model(chat)
+            if model is None:
+                raise
+            chat.model = model
+            rebuilt = retried = True
+        except ResourceExhausted as e:
+            if retries == MAX_RETRIES:
+                raise RateLimited(get_retry_delay_from_error(e)) from e
+            delay = get_retry_delay_from_error(e)
+            delay += random.uniform(0, delay * JITTER)
+            bucket.pause(delay)
+            if on_retry is not None:
+                on_retry(delay)
+            retries += 1
+            retried = True
+
+
+async def send_message_async(chat, content, metrics: LLMMetrics = None, on_retry=None):
+    """
+    send_message for the asyncio engine: uses the chat's async client, waits for
+    the rate limiter on a worker thread so the event loop keeps running meanwhile.
+    """
+    from google.api_core.exceptions import NotFound, ResourceExhausted
+
+    retried = False
+    rebuilt = False
+    retries = 0
+    # One more send than the quota retries, for the rebuild after a NotFound
+    for _ in range(MAX_RETRIES + 2):
+        waited = await asyncio.to_thread(bucket.acquire)
+        for counters in (metrics, totals):
+            if counters is not None:
+                counters.record(waited, retried)
+        try:
+            return await chat.send_message_async(content)
+        except NotFound:
+            # The cached prompt prefix expired on the server, upload it again and resend
+            model = None if rebuilt else await asyncio.to_thread(_rebuild_model, chat)
+            if model is None:
+                raise
+            chat.model = model
+            rebuilt = retried = True
+        except ResourceExhausted as e:
+            if retries == MAX_RETRIES:
+                raise RateLimited(get_retry_delay_from_error(e)) from e
+            delay = get_retry_delay_from_error(e)
+            delay += random.uniform(0, delay * JITTER)
+            bucket.pause(delay)
+            if on_retry is not None:
+                on_retry(delay)
+            retries += 1
+            retried = True
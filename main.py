@@ -1,26 +1,29 @@
+import argparse
 import json
 import time
 import traceback
 from config import configure_model
-from prompts import SYSTEMPROMPT, FORMAT_PROMPT
-from utils import get_detailed_intents, get_main_intents, get_params_and_context
+from prompts import PROTOCOLS
 from rich.console import Console
 from rich.panel import Panel
-from rich.syntax import Syntax
 from rich.prompt import Prompt
 from rich.theme import Theme
 from rich.padding import Padding
 from rich.progress import Progress
 from utils import get_class_name
-import google.api_core.exceptions
-import sounddevice as sd
-import numpy as np
-import wave
-import requests
+from router import route_intent
+from engine import AgentEngine, EngineHooks
+from context_warmer import context_warmer
+from daemon import SOCKET_PATH, DaemonError, RemoteEngine, daemon_running
+from llm import RateLimited
+from prefix_cache import prefix_cache
+from tracing import TRACE_PATH, setup as setup_tracing, tracer
 import uuid
 import threading
 import os
 import signal
+import select
+import sys
 
 WIT_TOKEN = "Bearer 5YCZYHOW6DIYF2AQT53XAYVKPT2YIGRZ"
 TEMP_AUDIO_FILENAME = "temp_audio.wav"  # Fixed filename for temp audio
@@ -42,6 +45,8 @@ console = Console(theme=custom_theme)
 def display_json(data: dict, mode: str):
     msg_type = data.get('type', '').lower()
     if mode == "debug":
+        # Pulls in pygments, only the debug mode needs it
+        from rich.syntax import Syntax
         title = f"[{msg_type}]{msg_type.upper()}[/{msg_type}]"
         syntax = Syntax(
             json.dumps(data, indent=2),
@@ -64,22 +69,52 @@ def display_json(data: dict, mode: str):
     elif mode == "training":
         console.print(json.dumps(data, indent=2))
 
-def get_retry_delay_from_error(error):
+def run_routed_locally(route: dict, mode: str):
     """
-    Extract the retry delay from a GoogleAPI ResourceExhausted error.
+    Execute a param-less intent picked by the local router without asking the model.
     """
-    error_str = str(error)
+    class_name = get_class_name(route["main_intent"], route["detailed_intent"])
     try:
-        if "retry_delay" in error_str and "seconds" in error_str:
-            import re
-            match = re.search(r'retry_delay \{\s*seconds: (\d+)\s*\}', error_str)
-            if match:
-                return int(match.group(1))
-    except Exception:
-        pass
-    return 5
+        with tracer.span("request", routed=True), tracer.span("executor", main_intent=route["main_intent"], detailed_intent=route["detailed_intent"]):
+            response_text = class_name.run({})
+    except Exception as e:
+        console.print(Panel(f"Error executing command: {str(e)}", border_style="red"))
+        return
+    if mode == "chat":
+        console.print(Panel(
+            str(response_text),
+            title="Response",
+            border_style="green",
+            padding=(1, 2),
+            expand=False
+        ))
+    else:
+        display_json({
+            "type": "output",
+            "routed": route,
+            "output": {
+                "status": "OK",
+                "main_intent": route["main_intent"],
+                "detailed_intent": route["detailed_intent"],
+                "params": {},
+                "response": response_text
+            }
+        }, mode)
+
+def listen_and_send_to_wit(silence_duration=0.5, stream=True):
+    """
+    Record until silence_duration of silence after speech (or Enter) and return the transcription.
+    Leading and trailing silence is never uploaded. With stream=True the audio is uploaded
+    while recording, without a temp file, otherwise it is trimmed, written to
+    TEMP_AUDIO_FILENAME and sent once recording ends.
+    """
+    # The audio stack is only loaded once voice input is actually used
+    import sounddevice as sd
+    import numpy as np
+    import wave
+    from speech import StreamingTranscription, transcribe
+    from vad import SpeechGate, VoiceActivityDetector
 
-def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5):
     sample_rate = 16000
     blocksize = 512
     chunk_duration = blocksize / sample_rate
@@ -92,10 +127,13 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5):
         except:
             pass
 
-    console.print("[voice]🎤 Recording... (Press Enter to stop)[/voice]")
+    console.print("[voice]🎤 Recording... (stops after silence, or press Enter)[/voice]")
     
     recorded_chunks = []
     stop_flag = threading.Event()
+    vad = VoiceActivityDetector(hangover_frames=int(silence_duration / chunk_duration))
+    gate = SpeechGate(vad)
+    upload = StreamingTranscription(sample_rate, token=WIT_TOKEN).start() if stream else None
     
     def callback(indata, frames, time_info, status):
         nonlocal recorded_chunks
@@ -103,8 +141,16 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5):
         if stop_flag.is_set():
             raise sd.CallbackStop
 
-        # Record all audio regardless of volume
+        # Keep all audio for the file path, stream only what the VAD gate releases
         recorded_chunks.append(indata.copy())
+        for block in gate.push(recorded_chunks[-1]):
+            if upload is not None:
+                upload.write(block.tobytes())
+
+        if gate.ended:
+            console.print("[voice]🔇 Silence detected, stopping...[/voice]")
+            stop_flag.set()
+            raise sd.CallbackStop
         
         # Update recording duration occasionally
         if len(recorded_chunks) % 20 == 0:  # Update roughly every second
@@ -112,11 +158,16 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5):
             console.print(f"[voice]🎤 Recording... ({duration:.1f}s) Press Enter to stop[/voice]", end="\r")
 
     def check_for_enter():
+        # Poll stdin instead of blocking in input(), so the thread exits when the
+        # VAD stops the recording and doesn't swallow the next line typed
         try:
             print("")  # Add a line for input to appear on
-            input()
-            console.print("[voice]🛑 Recording stopped by user[/voice]")
-            stop_flag.set()
+            while not stop_flag.is_set():
+                rlist, _, _ = select.select([sys.stdin], [], [], 0.1)
+                if rlist:
+                    sys.stdin.readline()
+                    console.print("[voice]🛑 Recording stopped by user[/voice]")
+                    stop_flag.set()
         except Exception as e:
             console.print(f"[error]Error in input thread: {e}[/error]")
 
@@ -133,69 +184,115 @@ def listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5):
     except Exception as e:
         console.print(f"[error]Error in audio stream: {e}[/error]")
 
-    if not recorded_chunks:
-        console.print("[voice]❌ No recording data or recording cancelled.[/voice]")
+    if not recorded_chunks or not gate.started:
+        if upload is not None:
+            upload.cancel()
+        console.print("[voice]❌ No speech detected or recording cancelled.[/voice]")
         return None
 
-    if len(recorded_chunks) > 0:
-        duration = len(recorded_chunks) * chunk_duration
-        
-        console.print(f"[voice]✅ Recording complete ({duration:.1f}s)[/voice]")
-        
-        audio_data = np.concatenate(recorded_chunks, axis=0)
-        
-        with wave.open(filename, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(audio_data.tobytes())
-
-        console.print("[voice]📤 Processing speech...[/voice]")
-        with open(filename, 'rb') as f:
-            headers = {
-                'Authorization': WIT_TOKEN,
-                'Content-Type': 'audio/wav'
-            }
-            try:
-                response = requests.post(
-                    'https://api.wit.ai/speech?v=20230202',
-                    headers=headers,
-                    data=f
-                )
-            except Exception as e:
-                console.print(f"[error]Error sending to Wit.ai: {e}[/error]")
-                return None
+    duration = len(recorded_chunks) * chunk_duration
+    console.print(f"[voice]✅ Recording complete ({duration:.1f}s)[/voice]")
+    console.print("[voice]📤 Processing speech...[/voice]")
 
-        try:
-            # Split the response by newlines and parse each line as JSON
-            json_objects = []
-            for line in response.text.strip().split('\r'):
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        json_obj = json.loads(line)
-                        json_objects.append(json_obj)
-                    except json.JSONDecodeError:
-                        # Skip invalid JSON
-                        pass
+    try:
+        if upload is not None:
+            # Most of the audio is already uploaded, only wait for the transcription
+            final_text = upload.finish()
+        else:
+            audio_data = vad.trim(np.concatenate(recorded_chunks, axis=0), blocksize)
             
-            # Get the last valid JSON object
-            if json_objects:
-                last_response = json_objects[-1]
-                final_text = last_response.get("text", "")
-                console.print(f"[voice]🗣️ You said: \"{final_text}\"[/voice]")
-                return final_text
-            else:
-                console.print("[error]No valid JSON objects found in response[/error]")
-                return None
-                
-        except Exception as e:
-            console.print(f"[error]Error processing response: {e}[/error]")
-            return None
-    
-    return None
+            with wave.open(filename, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(sample_rate)
+                wf.writeframes(audio_data.tobytes())
+
+            with open(filename, 'rb') as f:
+                final_text = transcribe(f.read(), 'audio/wav', WIT_TOKEN)
+    except Exception as e:
+        console.print(f"[error]Error sending to Wit.ai: {e}[/error]")
+        return None
+
+    if final_text is None:
+        console.print("[error]No valid JSON objects found in response[/error]")
+        return None
+    console.print(f"[voice]🗣️ You said: \"{final_text}\"[/voice]")
+    return final_text
+
+class ConsoleHooks(EngineHooks):
+    """
+    Shows the engine's progress on the console and asks preoutput questions by text or voice.
+    """
+
+    def __init__(self, mode: str, voice_mode: bool):
+        self.mode = mode
+        self.voice_mode = voice_mode
+
+    def on_message(self, payload: dict):
+        if payload["type"] == "user" and self.mode in ["debug", "training"]:
+            display_json(payload, self.mode)
+
+    def on_response(self, jres: dict):
+        if self.mode in ["debug", "training"]:
+            display_json(jres, self.mode)
+
+    def on_invalid_response(self, text: str):
+        console.print(Panel("Error: Invalid JSON response", border_style="red"))
+
+    def on_rate_limit(self, delay: float):
+        console.print(f"[yellow]Rate limited by the API, retrying in {delay:.1f}s...[/yellow]")
+
+    def ask_user(self, question: str) -> str:
+        # Simplified user response prompt
+        if not self.voice_mode:
+            return Prompt.ask(f'[cyan]{question}[/cyan]')
+        console.print(f'[cyan]{question}[/cyan]')
+        console.print("[voice]Press Enter to speak your response or type it:[/voice]")
+        user_action = input()
+        if user_action.strip():
+            return user_action
+        pmessage = listen_and_send_to_wit(silence_duration=0.5)
+        if not pmessage:
+            pmessage = Prompt.ask(f'[cyan]Voice not detected. Please type response[/cyan]')
+        return pmessage
+
+    def on_output(self, jres: dict, result):
+        if self.mode != "chat":
+            display_json(jres, self.mode)
+            return
+        ai_response_text = (jres.get("response") or
+                            jres.get("output", {}).get("response",
+                            "No response available"))
+        if len(jres.get("output", {}).get("actions") or []) > 1 and result is not None:
+            # Several commands ran, show how each of them went
+            ai_response_text = f"{ai_response_text}\n\n{result}"
+        console.print(Panel(
+            str(ai_response_text),
+            title="Response",
+            border_style="green",
+            padding=(1, 2),
+            expand=False  # Allow text to wrap naturally
+        ))
+
+    def on_history_compacted(self, report):
+        if self.mode == "debug":
+            console.print(f"[info]{report.summary()}, {report.saved} tokens saved per message[/info]")
+
+    def on_error(self, message: str):
+        console.print(Panel(message, border_style="red"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Voice and text interface to AIOS.")
+    parser.add_argument("--profile-startup", action="store_true", help="Report where the import time of this interface goes and exit")
+    parser.add_argument("--trace", nargs="?", const=TRACE_PATH, metavar="PATH", help=f"Write a span per request stage to a JSONL file (default {TRACE_PATH})")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="Serve Prometheus metrics of the spans on 127.0.0.1:PORT")
+    args = parser.parse_args(argv)
+    if args.profile_startup:
+        from startup_profile import profile_imports
+        profile_imports("main", console)
+        return
+    setup_tracing(args.trace, args.metrics_port)
 
-def main():
     console.clear()
     console.print(Panel.fit("🎙️ Voice-Enabled AI Chat Interface", style="bold cyan"))
     
@@ -209,8 +306,13 @@ def main():
         
         input_method = Prompt.ask("Input method", choices=["text", "voice"])
         voice_mode = (input_method == "voice")
+        protocol = Prompt.ask("Protocol", choices=["fast", "standard"], default="fast")
+        system_prompt, format_prompt = PROTOCOLS[protocol]
         
         if voice_mode:
+            import speech
+            # Open the speech connections now, not on the first utterance
+            speech.warm_up()
             voice_instructions = """
             [info]Voice mode instructions:[/info]
             [info]- Press Enter to start/stop recording[/info]
@@ -219,13 +321,29 @@ def main():
             """
             console.print(Panel(voice_instructions, border_style="cyan", title="Voice Mode"))
             
-        console.print(f"Operating in {mode} mode with {input_method} input\n")
+        console.print(f"Operating in {mode} mode with {input_method} input ({protocol} protocol)\n")
         
-        with Progress() as progress:
-            task = progress.add_task("Initializing AI...", total=100)
-            model = configure_model(SYSTEMPROMPT)
-            progress.update(task, advance=100)
-            chat = model.start_chat()
+        hooks = ConsoleHooks(mode, voice_mode)
+        # A running daemon (python daemon.py serve) already holds the model and the caches,
+        # but its requests would record no spans here, so tracing runs the engine locally
+        tracing = args.trace is not None or args.metrics_port is not None
+        engine = None if tracing else RemoteEngine.connect(protocol, hooks)
+        if tracing and daemon_running(SOCKET_PATH):
+            console.print("[info]Tracing is on, running the engine locally instead of on the daemon "
+                          "(start the daemon with AIOS_TRACE=on to trace it)[/info]\n")
+        if engine is not None:
+            console.print(f"[info]Connected to the AIOS daemon at {SOCKET_PATH}[/info]\n")
+        else:
+            # Load the task, alarm, notes and file contexts while the session starts
+            context_warmer.start()
+
+            with Progress() as progress:
+                task = progress.add_task("Initializing AI...", total=100)
+                model = configure_model(system_prompt, protocol)
+                progress.update(task, advance=100)
+                chat = model.start_chat()
+            console.print(f"[info]{prefix_cache.describe(model, protocol)}[/info]\n")
+            engine = AgentEngine(chat, system_prompt, format_prompt, protocol, hooks)
 
         try:
             while True:
@@ -238,7 +356,7 @@ def main():
                     user_action = input()
                     
                     if not user_action.strip():  # Empty input (Enter pressed)
-                        uinput = listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5)
+                        uinput = listen_and_send_to_wit(silence_duration=0.5)
                         if not uinput:
                             console.print("[voice]No voice input detected. Please try again.[/voice]")
                             continue
@@ -253,166 +371,26 @@ def main():
                     
                 start_time = time.time()
 
-                payload = {
-                    "type": "user",
-                    "user": uinput,
-                    "intents": get_main_intents()
-                }
-                
-                if mode in ["debug", "training"]:
-                    display_json(payload, mode)
-                
-                try:
-                    response = chat.send_message(json.dumps(payload))
-
-                    while True:
-                        try:
-                            res = response.text.strip('```json').strip('\n```').strip()
-                            try:
-                                jres = json.loads(res)
-                                if mode in ["debug", "training"]:
-                                    display_json(jres, mode)
-                            except json.JSONDecodeError:
-                                console.print(Panel("Error: Invalid JSON response", border_style="red"))
-                                payload = {"type": "SYSTEM", "SYSTEM": f"Response format incorrect. Please correct. \n\n{FORMAT_PROMPT}"}
-                                try:
-                                    response = chat.send_message(json.dumps(payload))
-                                except google.api_core.exceptions.ResourceExhausted as e:
-                                    retry_delay = get_retry_delay_from_error(e)
-                                    console.print(Panel(
-                                        f"API rate limit exceeded. Please wait {retry_delay} seconds before trying again.",
-                                        border_style="yellow",
-                                        title="Rate Limit"
-                                    ))
-                                    break
-                                except Exception as e:
-                                    console.print(Panel(f"Error: {str(e)}", border_style="red"))
-                                    break
-                                continue
-
-                            if jres["type"] == 'plan':
-                                payload = {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"}
-                                try:
-                                    response = chat.send_message(json.dumps(payload))
-                                except google.api_core.exceptions.ResourceExhausted as e:
-                                    retry_delay = get_retry_delay_from_error(e)
-                                    console.print(Panel(
-                                        f"API rate limit exceeded. Please wait {retry_delay} seconds before trying again.",
-                                        border_style="yellow",
-                                        title="Rate Limit"
-                                    ))
-                                    break
-                                except Exception as e:
-                                    console.print(Panel(f"Error: {str(e)}", border_style="red"))
-                                    break
-
-                            elif jres["type"] == 'action':
-                                fcn, ipt = jres["function"], jres["input"]
-
-                                if fcn == 'preoutput':
-                                    # Simplified user response prompt
-                                    if voice_mode:
-                                        console.print(f'[cyan]{ipt["response"]}[/cyan]')
-                                        console.print("[voice]Press Enter to speak your response or type it:[/voice]")
-                                        
-                                        user_action = input()
-                                        
-                                        if not user_action.strip():  # Empty input (Enter pressed)
-                                            pmessage = listen_and_send_to_wit(silence_threshold=250, silence_duration=0.5)
-                                            if not pmessage:
-                                                pmessage = Prompt.ask(f'[cyan]Voice not detected. Please type response[/cyan]')
-                                        else:
-                                            pmessage = user_action
-                                    else:
-                                        pmessage = Prompt.ask(f'[cyan]{ipt["response"]}[/cyan]')
-                                    
-                                    payload = {
-                                        "type": "preoutput_user_answer",
-                                        "preoutput_user_answer": pmessage
-                                    }
-                                    try:
-                                        response = chat.send_message(json.dumps(payload))
-                                    except google.api_core.exceptions.ResourceExhausted as e:
-                                        retry_delay = get_retry_delay_from_error(e)
-                                        console.print(Panel(
-                                            f"API rate limit exceeded. Please wait {retry_delay} seconds before trying again.",
-                                            border_style="yellow",
-                                            title="Rate Limit"
-                                        ))
-                                        break
-                                    except Exception as e:
-                                        console.print(Panel(f"Error: {str(e)}", border_style="red"))
-                                        break
-
-                                else:
-                                    output = None
-                                    if fcn == 'get_detailed_intents':
-                                        output = get_detailed_intents(ipt)
-                                    elif fcn == 'get_params_and_context':
-                                        output = get_params_and_context({
-                                            "main_intent": ipt["main_intent"],
-                                            "detailed_intent": ipt["detailed_intent"]
-                                        })
-
-                                    observation_payload = {
-                                        "type": "observation",
-                                        "observation": output
-                                    }
-                                    try:
-                                        response = chat.send_message(json.dumps(observation_payload))
-                                    except google.api_core.exceptions.ResourceExhausted as e:
-                                        retry_delay = get_retry_delay_from_error(e)
-                                        console.print(Panel(
-                                            f"API rate limit exceeded. Please wait {retry_delay} seconds before trying again.",
-                                            border_style="yellow",
-                                            title="Rate Limit"
-                                        ))
-                                        break
-                                    except Exception as e:
-                                        console.print(Panel(f"Error: {str(e)}", border_style="red"))
-                                        break
-
-                            elif jres["type"] == 'output':
-                                if mode == "chat":
-                                    ai_response_text = (jres.get("response") or 
-                                                  jres.get("output", {}).get("response", 
-                                                  "No response available"))
-                                    try:
-                                        class_name = get_class_name(jres["output"]["main_intent"], jres["output"]["detailed_intent"])
-                                        if class_name is not None:
-                                            response_text = class_name.run(jres["output"]["params"])
-                                    except Exception as e:
-                                        console.print(Panel(f"Error executing command: {str(e)}", border_style="red"))
-                                    
-                                    console.print(Panel(
-                                        str(ai_response_text),
-                                        title="Response",
-                                        border_style="green",
-                                        padding=(1, 2),
-                                        expand=False  # Allow text to wrap naturally
-                                    ))
-                                else:
-                                    display_json(jres, mode)
-                                    try:
-                                        class_name = get_class_name(jres["output"]["main_intent"], jres["output"]["detailed_intent"])
-                                        if class_name is not None:
-                                            response_text = class_name.run(jres["output"]["params"])
-                                    except Exception as e:
-                                        console.print(Panel(f"Error executing command: {str(e)}", border_style="red"))
-                                break
-                        except Exception as e:
-                            console.print(Panel(f"Error processing response: {str(e)}", border_style="red"))
-                            break
+                # The daemon routes on its side
+                route = route_intent(uinput) if isinstance(engine, AgentEngine) else None
+                if route is not None and route["direct"]:
+                    run_routed_locally(route, mode)
+                    if mode != "chat":
+                        console.print(f"Finished in {(time.time() - start_time):.2f}s (routed locally)\n")
+                    continue
 
+                try:
+                    result = engine.run_sync(uinput, route)
                     if mode != "chat":
-                        console.print(f"Finished in {(time.time() - start_time):.2f}s\n")
-                except google.api_core.exceptions.ResourceExhausted as e:
-                    retry_delay = get_retry_delay_from_error(e)
+                        console.print(f"Finished in {(time.time() - start_time):.2f}s ({result.metrics.summary()}, {result.cached} cached)\n")
+                except RateLimited as e:
                     console.print(Panel(
-                        f"API rate limit exceeded. Please wait {retry_delay} seconds before trying again.",
+                        f"API rate limit still exceeded after {e.retries} retries. Please wait {e.retry_delay} seconds before trying again.",
                         border_style="yellow",
                         title="Rate Limit"
                     ))
+                except DaemonError as e:
+                    console.print(Panel(f"Error from the daemon: {str(e)}", border_style="yellow" if e.rate_limited else "red"))
                 except Exception as e:
                     console.print(Panel(f"Error: {str(e)}\n{traceback.format_exc()}", border_style="red"))
 
@@ -421,6 +399,8 @@ def main():
             console.print(Panel("\nClosing session. Goodbye!\n", border_style="yellow"))
             break
         finally:
+            engine.close()
+            context_warmer.stop()
             # Clean up the temp audio file before exiting
             if os.path.exists(TEMP_AUDIO_FILENAME):
                 try:
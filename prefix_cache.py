@@ -0,0 +1,276 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from history import estimate_tokens
+
+# on: upload the system prompt to the Gemini context cache, local: the in-process stand-in
+# (no upload, for running offline), off: plain models
+MODE = os.environ.get('PREFIX_CACHE', 'on').lower()
+# Seconds a cached prefix lives on the server, renewed while a process uses it
+TTL = int(os.environ.get('PREFIX_CACHE_TTL', '3600'))
+STORE_PATH = os.environ.get('AIOS_PREFIX_CACHE_PATH') or os.path.join(os.path.expanduser('~'), '.aios', 'prefix_cache.json')
+# A prefix expiring sooner than this is uploaded again instead of reused
+RENEW_MARGIN = 300
+# Once the API refused to cache a prompt (too short for its minimum, unsupported model)
+# it isn't asked again for that prompt before this many seconds
+REFUSAL_BACKOFF = 86400
+# Round trips of a typical request, measured with bench.py on bench_transcripts.jsonl
+ROUND_TRIPS = {"fast": 3, "standard": 6}
+
+
+def cache_model_name(model_name: str) -> str:
+    """Context caching needs a versioned model, e.g. models/gemini-1.5-flash-001."""
+    return os.environ.get('GEMINI_CACHE_MODEL') or f"models/{model_name}-001"
+
+
+class GeminiContextCache:
+    """The Gemini API's explicit context caching."""
+
+    persistent = True
+
+    def create(self, model_name: str, system_prompt: str, ttl: int):
+        """Upload the prompt. Returns the cache name and its token count."""
+        from google.generativeai import caching
+
+        cache = caching.CachedContent.create(
+            model=cache_model_name(model_name),
+            display_name="aios-prefix",
+            system_instruction=system_prompt,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return cache.name, cache.usage_metadata.total_token_count
+
+    def extend(self, name: str, ttl: int):
+        from google.generativeai import caching
+
+        caching.CachedContent.get(name).update(ttl=datetime.timedelta(seconds=ttl))
+
+    def model(self, name: str, generation_config=None):
+        import google.generativeai as genai
+
+        return genai.GenerativeModel.from_cached_content(name, generation_config=generation_config)
+
+
+class LocalContextCache:
+    """
+    In-process stand-in for the context cache: keeps the prompts in memory and builds
+    plain models from them, so the caching flow runs without the API.
+    """
+
+    persistent = False
+
+    def __init__(self):
+        self.entries = {}
+
+    def create(self, model_name: str, system_prompt: str, ttl: int):
+        name = f"local/{len(self.entries)}"
+        self.entries[name] = (model_name, system_prompt)
+        return name, estimate_tokens(system_prompt)
+
+    def extend(self, name: str, ttl: int):
+        if name not in self.entries:
+            raise LookupError(f"No cached prefix {name}")
+
+    def model(self, name: str, generation_config=None):
+        import google.generativeai as genai
+
+        model_name, system_prompt = self.entries[name]
+        return genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt, generation_config=generation_config)
+
+
+class PrefixStatus:
+    def __init__(self, tokens: int, cached: bool, source: str, name: str = None, expires: float = None):
+        self.tokens = tokens
+        self.cached = cached
+        # "created", "reused", or why the prefix isn't cached
+        self.source = source
+        self.name = name
+        self.expires = expires
+
+
+class PrefixCache:
+    """
+    Models whose system prompt, the static few-shot prefix, is uploaded once.
+
+    model() returns one model per (prompt, generation config) for the whole process,
+    so switching modes doesn't configure it again. With a backend the prompt is created
+    as cached content with a TTL and the model references it, every message then only
+    sends the history and the new message. The cache name is kept in STORE_PATH, so the
+    next process reuses it while it is alive, and a timer keeps extending the TTL while
+    the process runs. When the API refuses (Gemini only caches prompts above a minimum
+    size) the model falls back to a plain system instruction.
+    """
+
+    def __init__(self, backend=None, ttl: int = TTL, path: str = STORE_PATH):
+        self.backend = backend
+        self.ttl = ttl
+        self.path = path
+        self.models = {}
+        self.status = {}
+        # How every cached model was built, so it can be built again:
+        # id(model) -> (key, digest, generation config)
+        self.built = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.entries = self._load() if backend is not None and backend.persistent else {}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if self.backend is None or not self.backend.persistent:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w') as file:
+                json.dump(self.entries, file, indent=2)
+        except OSError:
+            pass
+
+    def model(self, model_name: str, system_prompt: str, generation_config=None):
+        """A model for the prompt, from the process cache, the server cache or newly configured."""
+        key = (model_name, system_prompt, json.dumps(generation_config, sort_keys=True, default=str))
+        with self.lock:
+            model = self.models.get(key)
+            if model is None:
+                model, status = self._build(model_name, system_prompt, generation_config)
+                self.models[key] = model
+                self.status[id(model)] = status
+                if status.cached:
+                    self.built[id(model)] = (key, self._digest(model_name, system_prompt), generation_config)
+            return model
+
+    def rebuild(self, model):
+        """
+        A model to replace one whose cached prefix is gone on the server (the API answered
+        NotFound), with the prompt uploaded again. None if the model doesn't use the cache.
+        """
+        with self.lock:
+            built = self.built.get(id(model))
+            if built is None:
+                return None
+            key, digest, generation_config = built
+            if self.models.get(key) is model:
+                self._forget(digest)
+        model_name, system_prompt, _ = key
+        return self.model(model_name, system_prompt, generation_config)
+
+    def _forget(self, digest: str):
+        """Drop every trace of a cached prefix that expired, the next model() uploads it again."""
+        for key, (model_key, model_digest, _) in list(self.built.items()):
+            if model_digest == digest:
+                model = self.models.get(model_key)
+                if model is not None and id(model) == key:
+                    del self.models[model_key]
+                    self.status.pop(key, None)
+        self.entries.pop(digest, None)
+        timer = self.timers.pop(digest, None)
+        if timer is not None:
+            timer.cancel()
+        self._save()
+
+    @staticmethod
+    def _digest(model_name: str, system_prompt: str) -> str:
+        return hashlib.sha256(f"{cache_model_name(model_name)}\0{system_prompt}".encode('utf-8')).hexdigest()
+
+    def _plain(self, model_name: str, system_prompt: str, generation_config, reason: str):
+        import google.generativeai as genai
+
+        model = genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt, generation_config=generation_config)
+        return model, PrefixStatus(estimate_tokens(system_prompt), False, reason)
+
+    def _build(self, model_name: str, system_prompt: str, generation_config):
+        if self.backend is None:
+            return self._plain(model_name, system_prompt, generation_config, "prefix cache off")
+        digest = self._digest(model_name, system_prompt)
+        entry = self.entries.get(digest, {})
+        now = time.time()
+        if entry.get("refused_until", 0) > now:
+            return self._plain(model_name, system_prompt, generation_config, entry.get("reason", "refused by the API"))
+
+        source = None
+        if entry.get("name") and entry.get("expires", 0) - now > RENEW_MARGIN:
+            try:
+                self.backend.extend(entry["name"], self.ttl)
+                source = "reused"
+            except Exception:
+                # Deleted or expired on the server in the meantime
+                entry = {}
+        if source is None:
+            try:
+                name, tokens = self.backend.create(model_name, system_prompt, self.ttl)
+            except Exception as e:
+                from google.api_core.exceptions import BadRequest, NotFound, PermissionDenied
+
+                reason = f"{type(e).__name__}: {str(e)[:200]}"
+                if isinstance(e, (BadRequest, NotFound, PermissionDenied)):
+                    # The API won't cache this prompt or model (below the minimum size, unsupported
+                    # model), a quota or network error is worth retrying next start
+                    self.entries[digest] = {"refused_until": now + REFUSAL_BACKOFF, "reason": reason}
+                    self._save()
+                return self._plain(model_name, system_prompt, generation_config, reason)
+            entry = {"name": name, "tokens": tokens}
+            source = "created"
+        entry["expires"] = now + self.ttl
+        self.entries[digest] = entry
+        self._save()
+        self._schedule_renewal(digest)
+        model = self.backend.model(entry["name"], generation_config)
+        return model, PrefixStatus(entry["tokens"], True, source, entry["name"], entry["expires"])
+
+    def _schedule_renewal(self, digest: str):
+        if digest in self.timers:
+            return
+
+        def renew():
+            entry = self.entries.get(digest)
+            try:
+                self.backend.extend(entry["name"], self.ttl)
+            except Exception:
+                # Expired anyway (the machine slept past the TTL), forget the models that
+                # reference it so the next configure uploads it again
+                with self.lock:
+                    self.timers.pop(digest, None)
+                    self._forget(digest)
+                return
+            with self.lock:
+                entry["expires"] = time.time() + self.ttl
+                self._save()
+            self.timers.pop(digest, None)
+            self._schedule_renewal(digest)
+
+        timer = threading.Timer(max(self.ttl / 2, 1), renew)
+        timer.daemon = True
+        self.timers[digest] = timer
+        timer.start()
+
+    def describe(self, model, protocol: str = None) -> str:
+        """One line on the prefix of a model returned by model(): its size and what caching saves."""
+        status = self.status.get(id(model))
+        if status is None:
+            return "Prompt prefix: unknown model"
+        round_trips = ROUND_TRIPS.get(protocol)
+        per_request = f", ~{status.tokens * round_trips} per {protocol} request ({round_trips} round trips)" if round_trips else ""
+        if status.cached:
+            expires = time.strftime("%H:%M", time.localtime(status.expires))
+            return (f"Prompt prefix {status.source} in the context cache until {expires}: "
+                    f"{status.tokens} tokens per message not sent again{per_request}")
+        return f"Prompt prefix not cached ({status.source}): {status.tokens} tokens resent per message{per_request}"
+
+
+def _backend():
+    if MODE == 'local':
+        return LocalContextCache()
+    if MODE in ('0', 'off', 'false', 'no'):
+        return None
+    return GeminiContextCache()
+
+
+prefix_cache = PrefixCache(_backend())
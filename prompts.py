@@ -39,7 +39,7 @@ START
 {"type": "plan", "plan": "I will call get_detailed_intents for the intent: file_operation"}
 {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"}
 {"type": "action", "function": "get_detailed_intents", "input": "file_operation"}
-{"type": "observation", "observation": ["move_file", "move_entire_directory", "remove_entire_directory", "delete_file", "opening_file", "copy_file", "list_contents_of_directory_with_optional_file_type_filter"]}
+{"type": "observation", "observation": ["move_file", "move_entire_directory", "remove_entire_directory", "delete_file", "opening_file", "copy_file", "copy_entire_directory", "list_contents_of_directory_with_optional_file_type_filter"]}
 {"type": "plan", "plan": "I will now call the get_params_and_context for the main_intent- file_operation, and detailed_intent- list_contents_of_directory_with_optional_file_type_filter"}
 {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"}
 {"type": "action", "function": "get_params_and_context", "input": {"main_intent":"file_operation","detailed_intent":"list_contents_of_directory_with_optional_file_type_filter"}}
@@ -58,7 +58,7 @@ START
 {"type": "plan", "plan": "I will call get_detailed_intents for the intent: file_operation"}
 {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"}
 {"type": "action", "function": "get_detailed_intents", "input": "file_operation"}
-{"type": "observation", "observation": ["move_file", "move_entire_directory", "remove_entire_directory", "delete_file", "opening_file", "copy_file", "list_contents_of_directory_with_optional_file_type_filter"]}
+{"type": "observation", "observation": ["move_file", "move_entire_directory", "remove_entire_directory", "delete_file", "opening_file", "copy_file", "copy_entire_directory", "list_contents_of_directory_with_optional_file_type_filter"]}
 {"type": "plan", "plan": "I will now call the get_params_and_context for the main_intent- file_operation, and detailed_intent- move_file"}
 {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"}
 {"type": "action", "function": "get_params_and_context", "input": {"main_intent":"file_operation","detailed_intent":"move_file"}}
@@ -104,4 +104,48 @@ FORMAT_PROMPT = """Correct formats are exclusively :-
 2.b. {"type": "action", "function": "get_params_and_context", "input": "{main_intent: string,detailed_intent: string}"}
 2.c. {"type": "action", "function": "preoutput", "input": "{status: string, main_intent:string, detailed_intent: string, params:{string: string}, response: string}"}
 3. {"type": "output", "output": {"status": "OK", "main_intent": "<main intent>", "detailed_intent": "<detailed intent>", "params": {"<param name>": "<param value>"}, "response": "<response text>"}}
-"""
\ No newline at end of file
+3.a. {"type": "output", "output": {"status": "OK", "actions": [{"id": "<action id>", "main_intent": "<main intent>", "detailed_intent": "<detailed intent>", "params": {"<param name>": "<param value>"}, "depends_on": ["<action id>"]}], "response": "<response text>"}}
+"""
+FAST_PROTOCOL_PROMPT = """
+FAST PROTOCOL
+This session runs the fast protocol, it overrides the SYSTEM rule above. You will never receive {"type": "SYSTEM", "SYSTEM": "Proceed as strictly per protocol"} after a plan.
+Instead, every plan must carry the state that follows it in a "next" field of the same response, so plan and action travel together.
+The "next" field is always an action or an output in exactly the formats above, never another plan and never empty.
+The client runs the action in "next" straight away and answers with its observation (or the preoutput_user_answer), then you reply with the next plan and its "next".
+
+example
+{"type": "user", "user": "list my notes", "intents": ["task_management", "file_operation", "alarms", "notes"]}
+{"type": "plan", "plan": "I will call get_detailed_intents for the intent: notes", "next": {"type": "action", "function": "get_detailed_intents", "input": "notes"}}
+{"type": "observation", "observation": ["list_notes", "add_note", "append_to_note", "delete_note", "read_note"]}
+{"type": "plan", "plan": "I will now call the get_params_and_context for the main_intent- notes, and detailed_intent- list_notes", "next": {"type": "action", "function": "get_params_and_context", "input": {"main_intent": "notes", "detailed_intent": "list_notes"}}}
+{"type": "observation", "observation": {"params": [], "context": "..."}}
+{"type": "plan", "plan": "list_notes needs no params, I will fill the output", "next": {"type": "output", "output": {"status": "OK", "main_intent": "notes", "detailed_intent": "list_notes", "params": {}, "response": "Here are your notes."}}}
+"""
+FAST_FORMAT_PROMPT = """In the fast protocol a plan always carries its next state :-
+4. {"type": "plan", "plan": "<your plan>", "next": <an action (2.a, 2.b, 2.c) or an output (3)>}
+"""
+MULTI_ACTION_PROMPT = """
+MULTIPLE ACTIONS
+A user request may ask for several things at once, e.g. "add a task to pay rent, set an alarm for 6pm and list my notes".
+Then go through get_detailed_intents and get_params_and_context (and preoutput when params are missing) for every one of them, one after the other, and finish with a single output that lists them all in "actions" (format 3.a) instead of main_intent, detailed_intent and params.
+Every action has a unique "id" ("1", "2", ...). "depends_on" lists the ids of the actions that must finish before it, e.g. appending to a note the request also creates, leave it empty when the action stands on its own.
+Actions without dependencies run at the same time, so only add the dependencies that are really needed. The "response" covers all the actions.
+A request with a single command keeps the single output format 3.
+
+example output
+{"type": "output", "output": {"status": "OK", "actions": [{"id": "1", "main_intent": "task_management", "detailed_intent": "add_task", "params": {"title": "Pay rent"}, "depends_on": []}, {"id": "2", "main_intent": "alarms", "detailed_intent": "schedule_alarm_at_time_and_date", "params": {"time": "18:00", "date": "today"}, "depends_on": []}, {"id": "3", "main_intent": "notes", "detailed_intent": "list_notes", "params": {}, "depends_on": []}], "response": "Task added, alarm set for 6pm, and here are your notes."}}
+"""
+ROUTER_PROMPT = """
+ROUTED HINTS
+The user message may carry a "routed" field, a guess made by a local intent router before you were asked:
+{"type": "user", "user": "...", "intents": [...], "routed": {"main_intent": "...", "detailed_intent": "...", "params_and_context": {"params": [...], "context": "..."}}}
+"params_and_context" is exactly what get_params_and_context would return for that intent. If the guess fits the user request, do not call get_detailed_intents or get_params_and_context, plan and go straight to the output (or the preoutput when params are missing) using those params and that context.
+If the guess does not fit the request, ignore it completely and follow the normal protocol.
+"""
+# System prompt and format correction prompt for each protocol.
+# "fast" lets the model send a plan together with its next state, which
+# saves the {"type": "SYSTEM"} nudge round trip after every plan.
+PROTOCOLS = {
+    "standard": (SYSTEMPROMPT + MULTI_ACTION_PROMPT + ROUTER_PROMPT, FORMAT_PROMPT),
+    "fast": (SYSTEMPROMPT + MULTI_ACTION_PROMPT + ROUTER_PROMPT + FAST_PROTOCOL_PROMPT, FORMAT_PROMPT + FAST_FORMAT_PROMPT),
+}
@@ -0,0 +1,142 @@
+import hashlib
+import importlib
+import json
+import os
+import threading
+
+INTENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intents.json')
+
+# Executor class for every main intent, as "module:class". The modules are imported
+# on first use, so startup doesn't pay for the stores and the search index.
+EXECUTOR_CLASSES = {
+    "notes": "classes.notes:notes",
+    "file_operation": "classes.file_manager:file_manager",
+    "alarms": "classes.alarm:alarms",
+    "task_management": "classes.tasks:tasks",
+}
+
+
+def executor_class(main_intent: str):
+    """Import and return the executor class of a main intent, None if there is none."""
+    path = EXECUTOR_CLASSES.get(main_intent)
+    if path is None:
+        return None
+    module_name, class_name = path.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def build_param_schema(params: list) -> dict:
+    """
+    Build a JSON schema for the params object of a detailed intent.
+    Params whose note starts with "Optional" are not required.
+    """
+    properties = {}
+    required = []
+    for param in params:
+        properties[param["param_name"]] = {
+            "type": "string",
+            "description": param.get("param_note", "")
+        }
+        if not param.get("param_note", "").lower().startswith("optional"):
+            required.append(param["param_name"])
+    return {"type": "object", "properties": properties, "required": required}
+
+
+class IntentRegistry:
+    """
+    Index over intents.json, built once and rebuilt only when the file's mtime changes.
+
+    Lookups by (main_intent, detailed_intent) are dictionary hits, the param schemas are
+    built at load time and the executors are created on first use and then reused.
+    """
+
+    def __init__(self, path: str = INTENTS_PATH):
+        self.path = path
+        self.version = 0
+        self.digest = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as file:
+            raw = file.read()
+        data = json.loads(raw)
+        mtime = os.stat(self.path).st_mtime_ns
+
+        specs = {}
+        detailed_names = {}
+        for main_intent, intents in data.items():
+            detailed_names[main_intent] = [intent["name"] for intent in intents]
+            for intent in intents:
+                params = intent.get("params", [])
+                specs[(main_intent, intent["name"])] = {
+                    "params": params,
+                    "schema": build_param_schema(params),
+                }
+
+        self.data = data
+        self._main_intents = list(data.keys())
+        self._detailed_names = detailed_names
+        self._specs = specs
+        self._executors = {}
+        self._mtime = mtime
+        # version changes on every reload, digest only when the content does (stable across runs)
+        self.version += 1
+        self.digest = hashlib.sha256(raw).hexdigest()
+
+    def refresh(self):
+        """Reload intents.json if it changed on disk since the last load."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._load()
+
+    def main_intents(self) -> list:
+        self.refresh()
+        return list(self._main_intents)
+
+    def detailed_intents(self, main_intent: str) -> list:
+        self.refresh()
+        return list(self._detailed_names.get(main_intent, []))
+
+    def spec(self, main_intent: str, detailed_intent: str):
+        """Return the spec ({"params", "schema"}) of a detailed intent, or None if unknown."""
+        self.refresh()
+        return self._specs.get((main_intent, detailed_intent))
+
+    def params(self, main_intent: str, detailed_intent: str) -> list:
+        spec = self.spec(main_intent, detailed_intent)
+        return spec["params"] if spec else []
+
+    def schema(self, main_intent: str, detailed_intent: str):
+        spec = self.spec(main_intent, detailed_intent)
+        return spec["schema"] if spec else None
+
+    def executor(self, main_intent: str, detailed_intent: str):
+        """
+        Return the executor for an intent, created on first use and reused afterwards.
+        Unknown detailed intents still get a fresh executor, which reports the invalid intent itself.
+        """
+        if main_intent not in EXECUTOR_CLASSES:
+            return None
+        self.refresh()
+        key = (main_intent, detailed_intent)
+        if key not in self._specs:
+            return executor_class(main_intent)(detailed_intent)
+        executor = self._executors.get(key)
+        if executor is None:
+            with self._lock:
+                executor = self._executors.get(key)
+                if executor is None:
+                    executor = executor_class(main_intent)(detailed_intent)
+                    self._executors[key] = executor
+        return executor
+
+
+registry = IntentRegistry()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from registry import registry
+
+CACHE_PATH = os.environ.get('AIOS_RESPONSE_CACHE_PATH') or os.path.join(os.path.expanduser('~'), '.aios', 'responses.db')
+# Set RESPONSE_CACHE=off to always ask the model
+ENABLED = os.environ.get('RESPONSE_CACHE', 'on').lower() not in ('0', 'off', 'false', 'no')
+MEMORY_ENTRIES = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+DISK_ENTRIES = int(os.environ.get('RESPONSE_CACHE_DISK_SIZE', '5000'))
+
+# "Current date time is Monday, May 05, 2025 at 10:11:12.123456 PM ..." in the task and
+# alarm contexts. Seconds are dropped so a context only changes once a minute, anything
+# finer would make every observation unique.
+CURRENT_TIME = re.compile(r"(\d{1,2}:\d{2}):\d{2}(\.\d+)?")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    used REAL NOT NULL
+);
+"""
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different phrasings share a key."""
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+def normalize_message(message: str) -> str:
+    """Canonical form of a message sent to the model, used for hashing only."""
+    try:
+        message = json.dumps(json.loads(message), sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        pass
+    return CURRENT_TIME.sub(r"\1", message)
+
+
+def _digest(*parts: str) -> str:
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+class ResponseCache:
+    """
+    Content addressed cache of model responses within one request.
+
+    A request is a chain of messages and responses. The key of a step hashes the key of
+    the previous step, the previous response and the (normalized) message sent, the chain
+    starts from the model, the system prompt, the intents.json digest and the normalized
+    utterance. A key therefore identifies everything the model was shown in this request,
+    so a hit can be replayed instead of sent. Earlier requests in the chat are not part of
+    the key, the protocol treats every request on its own.
+
+    Recent entries stay in an in-memory LRU, every entry is also kept in SQLite so they
+    survive restarts; the oldest ones beyond DISK_ENTRIES are evicted. With no path the
+    cache is memory only and never touches the disk.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, memory_entries: int = MEMORY_ENTRIES, disk_entries: int = DISK_ENTRIES):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.lock = threading.Lock()
+        self.conn = None
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+        except sqlite3.Error:
+            # Memory only when the file can't be used
+            self.conn = None
+
+    def _remember(self, key: str, response: str):
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str):
+        with self.lock:
+            response = self.memory.get(key)
+            if response is not None:
+                self.memory.move_to_end(key)
+                return response
+            if self.conn is None:
+                return None
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            self._remember(key, row[0])
+            return row[0]
+
+    def put_many(self, entries: list):
+        """Store (key, response) pairs, in one transaction on disk."""
+        with self.lock:
+            for key, response in entries:
+                self._remember(key, response)
+            if self.conn is None:
+                return
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO responses (key, response, used) VALUES (?, ?, ?)",
+                    [(key, response, now) for key, response in entries]
+                )
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_entries,)
+                )
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM responses")
+
+    def turn(self, chat, utterance: str, system_prompt: str, send):
+        return CachedTurn(self, chat, utterance, system_prompt, send)
+
+
+class CachedResponse:
+    """Stands in for a model response replayed from the cache, main only reads .text."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class CachedTurn:
+    """
+    The messages of one user request. send() replays a cached response when the chain so
+    far is known, and calls the model otherwise. Replayed steps are added to the chat
+    history as if they had been sent, so a later live step sees the same conversation.
+    New responses are only written to the cache by commit(), once the request reached a
+    successful output, so an abandoned or failed chain is never replayed.
+    """
+
+    def __init__(self, cache: ResponseCache, chat, utterance: str, system_prompt: str, send):
+        self.cache = cache
+        self.chat = chat
+        self.send_live = send
+        self.key = _digest(
+            getattr(getattr(chat, 'model', None), 'model_name', ''),
+            hashlib.sha256(system_prompt.encode('utf-8')).hexdigest(),
+            registry.digest or '',
+            normalize_utterance(utterance),
+        )
+        self.previous = ''
+        self.pending = []
+        self.hits = 0
+
+    def _lookup(self, message: str):
+        self.key = _digest(self.key, self.previous, normalize_message(message))
+        text = self.cache.get(self.key) if ENABLED else None
+        if text is not None:
+            self.hits += 1
+            self.chat.history = self.chat.history + [
+                {"role": "user", "parts": [message]},
+                {"role": "model", "parts": [text]},
+            ]
+            self.previous = text
+            return CachedResponse(text)
+        return None
+
+    def _record(self, response):
+        self.pending.append((self.key, response.text))
+        self.previous = response.text
+        return response
+
+    def send(self, message: str, *args, **kwargs):
+        """Send a message (extra arguments go to the live send function), return the response."""
+        response = self._lookup(message)
+        if response is not None:
+            return response
+        return self._record(self.send_live(self.chat, message, *args, **kwargs))
+
+    async def send_async(self, message: str, *args, **kwargs):
+        """send() for a coroutine send function, such as llm.send_message_async."""
+        response = self._lookup(message)
+        if response is not None:
+            return response
+        return self._record(await self.send_live(self.chat, message, *args, **kwargs))
+
+    def commit(self):
+        if ENABLED and self.pending:
+            self.cache.put_many(self.pending)
+        self.pending = []
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the shared cache, opened on first use. It is memory only when the cache is off."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(CACHE_PATH if ENABLED else None)
+        return _cache
@@ -0,0 +1,191 @@
+import math
+import re
+from collections import Counter
+from registry import registry
+from utils import get_params_and_context
+
+# Scores are TF-IDF cosine similarities in [0, 1].
+# HINT_THRESHOLD: the match is passed to the model as a hint in the first message.
+# DIRECT_THRESHOLD: a param-less intent is executed locally without the model at all.
+HINT_THRESHOLD = 0.4
+DIRECT_THRESHOLD = 0.6
+DIRECT_MARGIN = 0.15
+
+# Weights of the different text sources that make up an intent document
+NAME_WEIGHT = 3
+MAIN_WEIGHT = 2
+NOTE_WEIGHT = 1
+# Aliases outweigh the name, a long name would dilute them otherwise
+ALIAS_WEIGHT = 6
+
+# Share of the score coming from the name-only document, the rest comes from the full document.
+# Param notes are long, so without this a short "list_*" intent beats e.g. "add_task" on "add a task".
+NAME_SHARE = 0.7
+
+STOPWORDS = {
+    "a", "an", "the", "my", "me", "i", "is", "are", "was", "be", "to", "of", "in", "on", "at", "for",
+    "and", "or", "it", "this", "that", "these", "those", "all", "any", "some", "please", "can", "could",
+    "would", "you", "your", "with", "from", "by", "as", "do", "does", "what", "which", "whats", "e", "g",
+    "example", "should", "will", "if", "not", "no", "so", "up", "get",
+}
+
+# Everyday words mapped onto the vocabulary used by intents.json
+SYNONYMS = {
+    "show": "list", "display": "list", "view": "read",
+    "todo": "task", "todos": "task", "reminder": "alarm", "remind": "alarm", "wake": "alarm", "set": "schedule",
+    "remove": "delete", "erase": "delete", "create": "add", "new": "add", "write": "add",
+    "folder": "directory", "dir": "directory",
+}
+
+# Verbs mapped only when the utterance names no object of another intent: "open the report"
+# opens a file, "list open tasks" doesn't
+VERB_SYNONYMS = {"open": "opening"}
+OBJECTS = {"task", "note", "alarm"}
+
+# Extra name words of intents whose names don't read like the way people ask for them
+ALIASES = {
+    "list_contents_of_directory_with_optional_file_type_filter": "list files",
+}
+
+# Only hinted when the match is confident enough to run, a wrong hint must not suggest these
+DESTRUCTIVE = {"remove_entire_directory", "remove_scheduled_alarm"}
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, split on non-alphanumerics, drop stopwords, map synonyms and strip plurals."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        word = SYNONYMS.get(word, word)
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    if not OBJECTS.intersection(tokens):
+        tokens = [VERB_SYNONYMS.get(token, token) for token in tokens]
+    return tokens
+
+
+def destructive(detailed_intent: str) -> bool:
+    """Whether an intent deletes something."""
+    return detailed_intent.startswith("delete_") or detailed_intent in DESTRUCTIVE
+
+
+class IntentRouter:
+    """
+    Classifies a user utterance against the main and detailed intents of intents.json.
+    Every detailed intent becomes two weighted documents, one with its name and its main
+    intent name and one that adds its param notes. The IDF and the document vectors are
+    computed once at build time.
+    """
+
+    def __init__(self, intents: dict):
+        self.intents = intents
+        documents = []
+        for main_intent, detailed_intents in intents.items():
+            for intent in detailed_intents:
+                name_counts = Counter()
+                for token in tokenize(intent["name"].replace("_", " ")):
+                    name_counts[token] += NAME_WEIGHT
+                for token in tokenize(ALIASES.get(intent["name"], "")):
+                    name_counts[token] += ALIAS_WEIGHT
+                for token in tokenize(main_intent.replace("_", " ")):
+                    name_counts[token] += MAIN_WEIGHT
+                full_counts = Counter(name_counts)
+                for param in intent.get("params", []):
+                    for token in tokenize(param["param_name"].replace("_", " ") + " " + param.get("param_note", "")):
+                        full_counts[token] += NOTE_WEIGHT
+                documents.append((main_intent, intent, name_counts, full_counts))
+
+        document_frequency = Counter()
+        for _, _, _, full_counts in documents:
+            document_frequency.update(full_counts.keys())
+        total = len(documents)
+        self.idf = {token: math.log(1 + total / df) for token, df in document_frequency.items()}
+
+        self.vectors = []
+        for main_intent, intent, name_counts, full_counts in documents:
+            name_vector = self._weigh(name_counts)
+            full_vector = self._weigh(full_counts)
+            self.vectors.append((main_intent, intent, name_vector, self._norm(name_vector),
+                                 full_vector, self._norm(full_vector)))
+
+    def _weigh(self, counts: Counter) -> dict:
+        return {token: tf * self.idf[token] for token, tf in counts.items()}
+
+    @staticmethod
+    def _norm(vector: dict) -> float:
+        return math.sqrt(sum(value * value for value in vector.values())) or 1.0
+
+    def scores(self, utterance: str) -> list:
+        """Return (score, main_intent, detailed_intent_spec) for every detailed intent, best first."""
+        counts = Counter(token for token in tokenize(utterance) if token in self.idf)
+        if not counts:
+            return []
+        query = self._weigh(counts)
+        query_norm = self._norm(query)
+        results = []
+        for main_intent, intent, name_vector, name_norm, full_vector, full_norm in self.vectors:
+            name_dot = sum(weight * name_vector.get(token, 0.0) for token, weight in query.items())
+            full_dot = sum(weight * full_vector.get(token, 0.0) for token, weight in query.items())
+            score = (NAME_SHARE * name_dot / name_norm + (1 - NAME_SHARE) * full_dot / full_norm) / query_norm
+            results.append((score, main_intent, intent))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results
+
+    def route(self, utterance: str):
+        """
+        Route an utterance to its most likely intent.
+
+        Returns:
+            dict | None: main_intent, detailed_intent, score and whether the intent can be
+            executed directly, or None if nothing matches well enough to be worth a hint.
+            Intents that delete something are only returned above DIRECT_THRESHOLD.
+            Direct execution needs a confident match, an intent without params, and an
+            utterance made only of words from the intent name ("list my tasks" but not
+            "set an alarm", whose "set" the router knows nothing about).
+        """
+        results = self.scores(utterance)
+        if not results or results[0][0] < HINT_THRESHOLD:
+            return None
+        score, main_intent, intent = results[0]
+        if score < DIRECT_THRESHOLD and destructive(intent["name"]):
+            return None
+        runner_up = results[1][0] if len(results) > 1 else 0.0
+        name_tokens = set(tokenize(intent["name"].replace("_", " ") + " " + main_intent.replace("_", " ")))
+        direct = (score >= DIRECT_THRESHOLD
+                  and score - runner_up >= DIRECT_MARGIN
+                  and not intent.get("params")
+                  and set(tokenize(utterance)) <= name_tokens)
+        return {
+            "main_intent": main_intent,
+            "detailed_intent": intent["name"],
+            "score": round(score, 3),
+            "direct": direct,
+        }
+
+
+_router = None
+_router_version = None
+
+
+def route_intent(utterance: str):
+    """Route an utterance with a router over the current intents, rebuilt when intents.json reloads."""
+    global _router, _router_version
+    registry.refresh()
+    if _router is None or _router_version != registry.version:
+        _router = IntentRouter(registry.data)
+        _router_version = registry.version
+    return _router.route(utterance)
+
+
+def routed_hint(route: dict, utterance: str = None) -> dict:
+    """Build the hint injected in the first user message, with the params and context already fetched."""
+    return {
+        "main_intent": route["main_intent"],
+        "detailed_intent": route["detailed_intent"],
+        "params_and_context": get_params_and_context({
+            "main_intent": route["main_intent"],
+            "detailed_intent": route["detailed_intent"]
+        }, utterance)
+    }
@@ -0,0 +1,170 @@
+import json
+import os
+import queue
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+WIT_TOKEN = f"Bearer {os.environ.get('WIT_TOKEN')}"
+# Point these at a local stub server to test without Wit.ai
+SPEECH_BASE_URL = os.environ.get('WIT_BASE_URL', 'https://api.wit.ai').rstrip('/')
+SPEECH_URL = os.environ.get('WIT_SPEECH_URL') or f"{SPEECH_BASE_URL}/speech?v=20230202"
+
+# (connect, read) timeouts in seconds, the read timeout covers the transcription itself
+TIMEOUT = (3.05, 30)
+# Retries on connection errors, 429 and 5xx, waiting BACKOFF * 2^n seconds between attempts
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Content type for headerless 16-bit little endian mono PCM, as delivered by sd.InputStream(dtype='int16')
+RAW_CONTENT_TYPE = "audio/raw;encoding=signed-integer;bits=16;rate={rate};endian=little"
+
+
+def parse_speech_response(text: str):
+    """
+    Parse a Wit.ai speech response and return the final transcription, or None.
+    The response is a stream of JSON objects (partial then final transcriptions)
+    separated by carriage returns, the last valid one holds the final text.
+    """
+    json_objects = []
+    for line in text.strip().split('\r'):
+        line = line.strip()
+        if line:  # Skip empty lines
+            try:
+                json_objects.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Skip invalid JSON
+                pass
+    if not json_objects:
+        return None
+    return json_objects[-1].get("text", "")
+
+
+def _build_session(retry: Retry):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Buffered requests can be replayed, so they retry on errors and on 429/5xx answers
+_session = _build_session(Retry(
+    total=RETRIES,
+    backoff_factor=BACKOFF,
+    status_forcelist=RETRY_STATUSES,
+    allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+))
+# A streamed body is consumed as it is sent, so only failed connects (before any byte
+# of it went out) are retried, StreamingTranscription falls back to a buffered upload
+_stream_session = _build_session(Retry(
+    total=None, connect=RETRIES, read=0, status=0, other=0, backoff_factor=BACKOFF
+))
+
+
+def warm_up():
+    """
+    Open the pooled connections to the speech endpoint in the background, so the
+    first utterance doesn't pay for DNS, TCP and TLS.
+    """
+    def connect(session):
+        try:
+            session.head(SPEECH_BASE_URL, timeout=TIMEOUT)
+        except requests.RequestException:
+            pass
+
+    for session in (_session, _stream_session):
+        threading.Thread(target=connect, args=(session,), daemon=True).start()
+
+
+def transcribe(audio: bytes, content_type: str = 'audio/wav', token: str = None, url: str = None):
+    """
+    Send a whole recording to the speech endpoint over the pooled session.
+
+    Returns:
+        str | None: The final text, or None if the response held no transcription.
+    """
+    headers = {
+        'Authorization': token or WIT_TOKEN,
+        'Content-Type': content_type
+    }
+    response = _session.post(url or SPEECH_URL, headers=headers, data=audio, timeout=TIMEOUT)
+    response.raise_for_status()
+    return parse_speech_response(response.text)
+
+
+class StreamingTranscription:
+    """
+    Uploads audio to the speech endpoint while it is being recorded.
+
+    The recorder hands raw PCM chunks to write() (safe to call from the sounddevice
+    callback), a background thread sends them as a chunked-transfer request body as
+    they arrive, so when recording ends only the last chunks are left to upload and
+    the transcription follows within the server's processing time.
+    If the streamed request fails, the chunks are sent again as one buffered request,
+    which gets the full retry policy.
+    """
+
+    def __init__(self, sample_rate: int = 16000, url: str = None, token: str = None):
+        self.url = url or SPEECH_URL
+        self.token = token
+        self.content_type = RAW_CONTENT_TYPE.format(rate=sample_rate)
+        self.sent = []
+        self.headers = {
+            'Authorization': token or WIT_TOKEN,
+            'Content-Type': self.content_type
+        }
+        self.chunks = queue.Queue()
+        self.response = None
+        self.error = None
+        self.thread = threading.Thread(target=self._upload, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self, chunk: bytes):
+        self.chunks.put(chunk)
+
+    def _body(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            self.sent.append(chunk)
+            yield chunk
+
+    def _upload(self):
+        try:
+            self.response = _stream_session.post(self.url, headers=self.headers, data=self._body(), timeout=TIMEOUT)
+        except Exception as e:
+            self.error = e
+
+    def cancel(self):
+        """End the upload without waiting for a transcription."""
+        self.chunks.put(None)
+
+    def finish(self, timeout: float = 30):
+        """
+        End the upload and wait for the transcription.
+
+        Returns:
+            str | None: The final text, or None if the response held no transcription.
+        """
+        self.chunks.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise TimeoutError("No response from the speech endpoint")
+        if self.error is not None or self.response.status_code in RETRY_STATUSES:
+            # Replay what was streamed as one request, with retries
+            remaining = []
+            while not self.chunks.empty():
+                chunk = self.chunks.get()
+                if chunk is not None:
+                    remaining.append(chunk)
+            return transcribe(b"".join(self.sent + remaining), self.content_type, self.token, self.url)
+        self.response.raise_for_status()
+        return parse_speech_response(self.response.text)
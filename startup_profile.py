@@ -0,0 +1,52 @@
+import re
+import subprocess
+import sys
+from rich.table import Table
+
+# "import time:       self [us] | cumulative | imported package" lines of python -X importtime
+IMPORT_TIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module: str) -> list:
+    """
+    Import module in a fresh interpreter with -X importtime.
+
+    Returns:
+        list: (name, self_us, cumulative_us, depth) per imported module, in import order.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr.strip()}")
+    records = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+
+def profile_imports(module: str, console, limit: int = 15):
+    """Print the import time of module per top-level package, slowest first."""
+    records = measure_imports(module)
+    packages = {}
+    for name, self_us, _, _ in records:
+        package = name.split('.')[0]
+        count, total = packages.get(package, (0, 0))
+        packages[package] = (count + 1, total + self_us)
+    total_us = sum(self_us for _, self_us, _, _ in records)
+    interpreter_us = sum(cumulative_us for name, _, cumulative_us, depth in records if depth == 0 and name != module)
+    module_us = next((cumulative_us for name, _, cumulative_us, _ in records if name == module), 0)
+
+    table = Table(title=f"Import time of {module}")
+    table.add_column("Package")
+    table.add_column("Modules", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("%", justify="right")
+    for package, (count, self_us) in sorted(packages.items(), key=lambda item: item[1][1], reverse=True)[:limit]:
+        table.add_row(package, str(count), f"{self_us / 1000:.1f}", f"{100 * self_us / max(total_us, 1):.0f}")
+    console.print(table)
+    console.print(f"{module}: {module_us / 1000:.1f}ms, interpreter startup: {interpreter_us / 1000:.1f}ms, {len(records)} modules")
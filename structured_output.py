@@ -0,0 +1,237 @@
+import json
+import os
+import re
+from registry import registry
+from tracing import tracer
+
+# Set STRUCTURED_OUTPUT=off to let the model answer free-form text again
+ENABLED = os.environ.get('STRUCTURED_OUTPUT', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+STATES = ["plan", "action", "output"]
+FUNCTIONS = ["get_detailed_intents", "get_params_and_context", "preoutput"]
+
+# Appended to the system prompt when the schema is enforced, the schema has no union
+# types so every "input" is an object, even the one of get_detailed_intents
+STRUCTURED_PROMPT = """
+STRUCTURED OUTPUT
+Your responses are decoded against a JSON schema. "input" is always an object: for get_detailed_intents it is {"main_intent": "<main intent>"}, for the other functions it is the object shown in the formats.
+"""
+
+FENCE = re.compile(r"```(?:json|JSON)?")
+
+
+def _string(description: str = None) -> dict:
+    schema = {"type": "string"}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _params_schema() -> dict:
+    """Every param of every intent in intents.json, all optional and all strings."""
+    properties = {}
+    for main_intent in registry.main_intents():
+        for detailed_intent in registry.detailed_intents(main_intent):
+            for param in registry.params(main_intent, detailed_intent):
+                properties.setdefault(param["param_name"], _string())
+    # An object schema needs at least one property
+    return {"type": "object", "properties": properties or {"value": _string()}}
+
+
+def response_schema(protocol: str = "fast") -> dict:
+    """
+    JSON schema of a protocol state (plan, action or output), in the subset of OpenAPI
+    the Gemini API accepts as response_schema: no unions, so the fields of all states
+    are optional properties of one object and "type" says which of them are used.
+    The params object lists the params of intents.json, so a model configured with
+    this schema has to be configured again when intents.json changes.
+
+    Args:
+        protocol (str): "fast" adds the "next" state a fast plan carries.
+
+    Returns:
+        dict: The schema.
+    """
+    fields = {
+        "status": _string("OK, MISSING_PARAMS or UNRECOGNIZED_INTENT"),
+        "main_intent": _string(),
+        "detailed_intent": _string(),
+        "params": _params_schema(),
+        "response": _string("What to tell the user"),
+    }
+    action_input = {"type": "object", "properties": fields}
+    action = {
+        "type": "object",
+        "properties": {
+            "id": _string(),
+            "main_intent": _string(),
+            "detailed_intent": _string(),
+            "params": fields["params"],
+            "depends_on": {"type": "array", "items": _string(), "description": "Ids of the actions to run first"},
+        },
+        "required": ["id", "main_intent", "detailed_intent", "params"],
+    }
+    # A single command fills main_intent, detailed_intent and params, several fill actions
+    output = {
+        "type": "object",
+        "properties": dict(fields, actions={"type": "array", "items": action}),
+        "required": ["status", "response"],
+    }
+    function = {"type": "string", "enum": FUNCTIONS}
+    properties = {
+        "type": {"type": "string", "enum": STATES},
+        "plan": _string(),
+        "function": function,
+        "input": action_input,
+        "output": output,
+    }
+    if protocol == "fast":
+        properties["next"] = {
+            "type": "object",
+            "description": "The action or output that follows the plan",
+            "properties": {
+                "type": {"type": "string", "enum": ["action", "output"]},
+                "function": function,
+                "input": action_input,
+                "output": output,
+            },
+            "required": ["type"],
+        }
+    return {"type": "object", "properties": properties, "required": ["type"]}
+
+
+def generation_config(protocol: str = "fast"):
+    """The generation_config for configure_model, or None when structured output is off."""
+    if not ENABLED:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": response_schema(protocol)}
+
+
+def _requote(text: str) -> str:
+    """
+    Turn single quoted strings into double quoted ones and Python's True, False and None
+    into JSON, leaving double quoted strings (and the apostrophes in them) alone.
+    """
+    out = []
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote is None:
+            if char in "\"'":
+                quote = char
+                out.append('"')
+            else:
+                for word, literal in (("True", "true"), ("False", "false"), ("None", "null")):
+                    if text.startswith(word, i) and not (i and text[i - 1].isalnum()) and not text[i + len(word):i + len(word) + 1].isalnum():
+                        out.append(literal)
+                        i += len(word) - 1
+                        break
+                else:
+                    out.append(char)
+        elif char == "\\" and i + 1 < len(text):
+            # An escaped single quote needs no escape in a double quoted string
+            out.append(text[i + 1] if text[i + 1] == "'" else text[i:i + 2])
+            i += 1
+        elif char == quote:
+            quote = None
+            out.append('"')
+        elif char == '"':
+            out.append('\\"')
+        elif char == "\n":
+            out.append("\\n")
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _drop_trailing_commas(text: str) -> str:
+    return re.sub(r",\s*([}\]])", r"\1", text)
+
+
+def _close(text: str) -> str:
+    """Close the strings, arrays and objects a cut off response left open."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    return re.sub(r",\s*$", "", text) + "".join(reversed(stack))
+
+
+def _leading_object(text: str):
+    """Decode the JSON object text starts with, ignoring anything after it."""
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _is_output(state) -> bool:
+    """Whether a state is an output or a plan carrying one."""
+    if not isinstance(state, dict):
+        return False
+    following = state.get("next")
+    return state.get("type") == "output" or (isinstance(following, dict) and following.get("type") == "output")
+
+
+def parse_response(text: str) -> dict:
+    """
+    Parse a protocol state from a model response.
+
+    Well formed JSON is decoded directly. Otherwise the response is repaired in process:
+    code fences and text around the object are dropped, single quotes and Python
+    literals are converted, trailing commas removed and a cut off object closed,
+    unless it is an output: a cut off output is never run.
+
+    Args:
+        text (str): The response text.
+
+    Returns:
+        dict: The state, it always has a "type".
+
+    Raises:
+        ValueError: If no state could be recovered, the model has to be asked again.
+    """
+    try:
+        state = json.loads(text)
+        if isinstance(state, dict) and "type" in state:
+            return state
+    except json.JSONDecodeError:
+        pass
+
+    with tracer.span("json_repair", length=len(text)) as span:
+        body = FENCE.sub("", text)
+        start = body.find("{")
+        state = None
+        if start != -1:
+            body = body[start:].strip()
+            fixed = _drop_trailing_commas(_requote(body))
+            state = _leading_object(body) or _leading_object(fixed)
+            if state is None:
+                state = _leading_object(_close(fixed))
+                if _is_output(state):
+                    # A cut off output may hold a cut off path or param, running it could
+                    # delete the wrong directory, so the model is asked again instead
+                    span.set(repaired=False, truncated_output=True)
+                    raise ValueError("Response is a truncated output")
+        span.set(repaired=state is not None)
+        if not isinstance(state, dict) or not isinstance(state.get("type"), str):
+            raise ValueError("Response is not a protocol state")
+        return state
@@ -0,0 +1,220 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+# JSONL file the spans are appended to once tracing is on
+TRACE_PATH = os.environ.get('AIOS_TRACE_PATH') or os.path.join(os.path.expanduser('~'), '.aios', 'trace.jsonl')
+# Set AIOS_TRACE=on to trace without the --trace flag (daemon, batch runs)
+TRACE_ENABLED = os.environ.get('AIOS_TRACE', 'off').lower() in ('1', 'on', 'true', 'yes')
+# Port of the Prometheus endpoint on 127.0.0.1, off when unset
+METRICS_PORT = os.environ.get('AIOS_METRICS_PORT')
+
+# Upper bounds (seconds) of the duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The span code running in this thread or task is nested in, children take it as parent
+_current = contextvars.ContextVar('aios_span', default=None)
+
+
+class Span:
+    """
+    One timed stage. Use through tracer.span(); attributes can be added while it runs
+    with set(). The duration is measured whether or not tracing is on, so callers can
+    always read it after the block.
+    """
+
+    def __init__(self, tracer, name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.trace_id = None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start = None
+        self.duration = 0.0
+        self.error = None
+        self._started = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.trace_id = self.parent.trace_id if self.parent is not None else uuid.uuid4().hex
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._started
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited in another context than it was entered in (a generator or task moved)
+            _current.set(self.parent)
+        if exc_type is not None and not issubclass(exc_type, (GeneratorExit, KeyboardInterrupt)):
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer.finish(self)
+        return False
+
+    def record(self) -> dict:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": "error" if self.error else "ok",
+        }
+        if self.error:
+            record["error"] = self.error
+        if self.attrs:
+            record["attrs"] = self.attrs
+        return record
+
+
+class Metrics:
+    """Span counters and duration histograms by span name, in the Prometheus text format."""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, span: Span):
+        status = "error" if span.error else "ok"
+        with self.lock:
+            self.counts[(span.name, status)] = self.counts.get((span.name, status), 0) + 1
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += span.duration
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP aios_spans_total Finished request stages by span name and status.",
+            "# TYPE aios_spans_total counter",
+        ]
+        with self.lock:
+            for (name, status), count in sorted(self.counts.items()):
+                lines.append(f'aios_spans_total{{span="{name}",status="{status}"}} {count}')
+            lines.append("# HELP aios_span_duration_seconds Duration of request stages by span name.")
+            lines.append("# TYPE aios_span_duration_seconds histogram")
+            for name, histogram in sorted(self.histograms.items()):
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'aios_span_duration_seconds_bucket{{span="{name}",le="{bound:g}"}} {count}')
+                lines.append(f'aios_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'aios_span_duration_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+                lines.append(f'aios_span_duration_seconds_count{{span="{name}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+def _metrics_server(metrics: Metrics, port: int):
+    # http.server is only loaded when metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            payload = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+class Tracer:
+    """
+    Spans around the stages of a request: model round trips, format corrections, tool
+    calls, context builds and executor runs.
+
+    Spans nest through a context variable, so the spans of one request share its trace
+    id even across asyncio tasks and worker threads started with asyncio.to_thread.
+    While tracing is off a span only measures its duration, nothing is written.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.file = None
+        self.metrics = None
+        self.server = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None or self.metrics is not None
+
+    def span(self, name: str, **attrs) -> Span:
+        return Span(self, name, attrs)
+
+    def start(self, path: str = None, metrics_port: int = None):
+        """Write spans to path (JSONL, appended) and/or serve metrics on 127.0.0.1:metrics_port."""
+        if path is not None and self.file is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.path = path
+            self.file = open(path, 'a', encoding='utf-8')
+        if metrics_port is not None and self.server is None:
+            self.metrics = self.metrics or Metrics()
+            self.server = _metrics_server(self.metrics, int(metrics_port))
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.metrics = None
+
+    def finish(self, span: Span):
+        if self.metrics is not None:
+            self.metrics.observe(span)
+        if self.file is not None:
+            line = json.dumps(span.record(), default=str) + "\n"
+            with self.lock:
+                if self.file is not None:
+                    self.file.write(line)
+                    self.file.flush()
+
+
+tracer = Tracer()
+
+
+def setup(trace: str = None, metrics_port: int = None):
+    """
+    Turn tracing on from command line options, falling back to AIOS_TRACE,
+    AIOS_TRACE_PATH and AIOS_METRICS_PORT.
+
+    Args:
+        trace (str): Trace file, or None to only trace when AIOS_TRACE is on.
+        metrics_port (int): Port of the metrics endpoint, or None for AIOS_METRICS_PORT.
+    """
+    if trace is None and TRACE_ENABLED:
+        trace = TRACE_PATH
+    if metrics_port is None and METRICS_PORT:
+        metrics_port = int(METRICS_PORT)
+    tracer.start(trace, metrics_port)
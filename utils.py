@@ -1,42 +1,74 @@
+import asyncio
 import json
-from classes.notes import notes
-from classes.file_manager import file_manager
-from classes.alarm import alarms
-from classes.tasks import tasks
+import os
 from datetime import datetime
+from registry import registry
+from fs_cache import fs_cache, excerpt
+from filename_index import filename_index
+from context_warmer import context_warmer
+from tracing import tracer
 
-with open('intents.json','r') as file:
-    data = json.load(file)
+# Directory whose listing is given to the model as file_operation context
+FS_CONTEXT_ROOT = os.environ.get('FS_CONTEXT_ROOT', os.path.expanduser('~'))
+# Number of notes given to the model as notes context
+NOTES_CONTEXT_HITS = 10
+
+# Context sources by main intent, served from memory by the context warmer once it
+# is started. The listings expire after CONTEXT_TTL, the filesystem snapshot and
+# the notes index keep themselves up to date and are only built ahead of time.
+context_warmer.register('task_management', lambda: registry.executor("task_management", "list_tasks").run({}))
+context_warmer.register('alarms', lambda: registry.executor("alarms", "list_scheduled_alarms").run({}))
+context_warmer.register('notes', lambda: registry.executor("notes", "search_notes").index(), ttl=0)
+context_warmer.register('file_operation', lambda: fs_cache.snapshot(FS_CONTEXT_ROOT), ttl=0)
+context_warmer.register('filename_index', filename_index.warm, ttl=0)
 
 def get_main_intents():
-    """Retrieve main intents from the JSON data."""
-    return list(data.keys())
+    """Retrieve main intents from the intent registry."""
+    return registry.main_intents()
 
 def get_detailed_intents(main_intent):
     """Retrieve detailed intents under a specified main intent."""
-    if main_intent in data:
-        return [intent["name"] for intent in data[main_intent]]
-    return []
+    return registry.detailed_intents(main_intent)
 
-def get_params_and_context(intents):
-    """Retrieve parameters for a specific detailed intent under a main intent."""
-    params = []
+def get_params_and_context(intents, utterance=None, context=None):
+    """
+    Retrieve parameters for a specific detailed intent under a main intent.
+    The utterance, when given, is used to rank the filesystem context so only the
+    entries most relevant to the request are sent. A context already gathered for
+    the main intent (see get_context_async) can be passed in to skip gathering it again.
+    """
     main_intent, detailed_intent = intents["main_intent"],intents["detailed_intent"]
-    if main_intent in data:
-        for intent in data[main_intent]:
-            if intent["name"] == detailed_intent:
-                params =  intent.get("params", [])
+    params = registry.params(main_intent, detailed_intent)
+    if context is None:
+        context = get_context(main_intent, utterance)
+    output = {"params":params,"context":context}
+    # print(output)
+    return output
+
+def get_context(main_intent, utterance=None):
+    """
+    Gather the context the model needs for a main intent (file listing, tasks, notes,
+    alarms). It only depends on the main intent, not on the detailed one.
+    """
+    with tracer.span("context", main_intent=main_intent):
+        return _build_context(main_intent, utterance)
+
+def _build_context(main_intent, utterance):
     cnxt = 'no special context required'
     inst = " no special instructions, "
     if main_intent == 'file_operation':
-        inst = "These are the contents of the current filesystem for your reference, when dealing with paths always consult this, try your best to infer which files the user is thinking about from this, the user most likely doesnt remember the proper filenames or the extensions, extrapolate from the data. If there is no match here, preoutput to the user to specify the files while giving the ones you think are likely as options to the user\n"
+        inst = "These are the contents of the current filesystem for your reference, when dealing with paths always consult this, try your best to infer which files the user is thinking about from this, the user most likely doesnt remember the proper filenames or the extensions, extrapolate from the data. The matching paths listed after it were found anywhere below, deeper than this listing, use them as the full paths. If there is no match here, preoutput to the user to specify the files while giving the ones you think are likely as options to the user\n"
         try:
-            # Get actual file system contents using file_manager
-            file_mgr = file_manager("list_contents_of_directory_with_optional_file_type_filter")
-            # List contents of home directory
-            home_contents = file_mgr.run({"directory_location": "/home/oreneus", "constraint": ".{*}"})
-            if home_contents and not home_contents.startswith("Error"):
-                cnxt = home_contents
+            # Cached snapshot of the home directory, trimmed to the entries relevant to the utterance
+            snapshot = context_warmer.get('file_operation')
+            if snapshot.entries:
+                cnxt = excerpt(snapshot, utterance)
+                # Deeper entries whose names resemble the words of the request
+                candidates = filename_index.search(utterance) if utterance else []
+                if candidates:
+                    cnxt += "\n\nPaths matching the request, best first:\n" + "\n".join(
+                        f"{path}/ (directory)" if is_dir else path for path, is_dir, _ in candidates
+                    )
             else:
                 # Fallback in case of error
                 cnxt = "Error listing directory contents or no files found."
@@ -48,8 +80,7 @@ def get_params_and_context(intents):
         current_time = datetime.now().astimezone().strftime("%A, %B %d, %Y at %I:%M:%S.%f %p %Z (UTC%z)")
         try:
             # Get actual tasks list from the tasks script
-            tasks_instance = tasks("list_tasks")
-            tasks_list = tasks_instance.run({})
+            tasks_list = context_warmer.get('task_management')
             if tasks_list and not tasks_list.startswith("Error"):
                 cnxt = tasks_list + "\n" + f"Current date time is {current_time}"
             else:
@@ -59,24 +90,26 @@ def get_params_and_context(intents):
             # Fallback in case of exception
             cnxt = f"Error accessing tasks: {str(e)}" + "\n" + f"Current date time is {current_time}"
     elif main_intent == 'notes':
-        inst = "Given below is the current notes list. refer to this and extrapolate the note names to match existing ones. if nothing is even a remote match then use the preoutput to ask the user and give them options if possible. i repeat only move forward with something that is an exact match of the context.\n"
+        inst = "Given below are the existing notes that best match the request, best match first (not every note, only the closest ones). refer to this and extrapolate the note names to match existing ones. if nothing is even a remote match then use the preoutput to ask the user and give them options if possible. i repeat only move forward with something that is an exact match of the context.\n"
         try:
-            # Get actual notes list from the notes script
-            notes_instance = notes("list_notes")
-            notes_list = notes_instance.run({})
-            if notes_list and not notes_list.startswith("Error"):
-                cnxt = notes_list
+            # Top hits of the notes search index, so the context stays small however many notes there are
+            index = context_warmer.get('notes')
+            hits = index.search(utterance or "", NOTES_CONTEXT_HITS)
+            if hits:
+                cnxt = f"{len(index)} notes in total, closest matches:\n" + "\n".join(title for title, _ in hits)
+            elif len(index):
+                # Fallback to the most recent notes when nothing matches
+                recent = index.titles()[-NOTES_CONTEXT_HITS:]
+                cnxt = f"{len(index)} notes in total, none matches the request, most recent ones:\n" + "\n".join(reversed(recent))
             else:
-                # Fallback in case of error
-                cnxt = "No notes found or error retrieving notes."
+                cnxt = "No notes found."
         except Exception as e:
             # Fallback in case of exception
             cnxt = f"Error accessing notes: {str(e)}"
     elif main_intent == 'alarms':
         current_time = datetime.now().astimezone().strftime("%A, %B %d, %Y at %I:%M:%S.%f %p %Z (UTC%z)")
         try :
-            alarms_instance = alarms("list_scheduled_alarms")
-            alarms_list = alarms_instance.run({})
+            alarms_list = context_warmer.get('alarms')
             if alarms_list and not alarms_list.startswith("Error"):
                 cnxt = alarms_list + "\n" + f"Current date time is {current_time}"
             else:
@@ -86,10 +119,14 @@ def get_params_and_context(intents):
             # Fallback in case of exception
             cnxt = f"Error accessing alarm: {str(e)}" + "\n" + f"Current date time is {current_time}"
 
-    context = inst + ' \n ' + cnxt
-    output = {"params":params,"context":context}
-    # print(output)
-    return output
+    return inst + ' \n ' + cnxt
+
+async def get_context_async(main_intent, utterance=None):
+    """
+    get_context on a worker thread, so the listings and subprocesses behind it run
+    while the event loop waits on the model.
+    """
+    return await asyncio.to_thread(get_context, main_intent, utterance)
 
 def preoutput(status: str, main_intent: str, detailed_intent: str, params: dict, response: str):
     """Handles cases where either the main_intent, detailed_intent, or parameters are missing."""
@@ -106,10 +143,4 @@ def preoutput(status: str, main_intent: str, detailed_intent: str, params: dict,
     return json.dumps(preoutput_data)
 
 def get_class_name(main_intent: str, detailed_intent: str):
-    mapper = {
-        "notes": notes(detailed_intent),
-        "file_operation": file_manager(detailed_intent),
-        "alarms": alarms(detailed_intent),
-        "task_management": tasks(detailed_intent)
-    }
-    return mapper.get(main_intent)
\ No newline at end of file
+    return registry.executor(main_intent, detailed_intent)
\ No newline at end of file
@@ -0,0 +1,150 @@
+from collections import deque
+import numpy as np
+
+# Energies are RMS of samples scaled to [-1, 1]
+MIN_ENERGY = 0.002          # about -54 dBFS, nothing quieter counts as speech
+ENERGY_RATIO = 3.0          # speech must be this many times louder than the noise floor
+NOISE_ADAPTATION = 0.05     # weight of a silent frame in the running noise floor
+# Zero crossings per sample, broadband noise (fans, hiss) sits near 0.5, voiced speech well below
+MAX_SPEECH_ZCR = 0.35
+
+
+def frame_features(audio: np.ndarray, frame_length: int):
+    """
+    Energy and zero-crossing rate of every frame of an int16 signal, vectorized.
+    Trailing samples that don't fill a frame are ignored.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: per-frame RMS energy and zero-crossing rate.
+    """
+    samples = audio.reshape(-1).astype(np.float32) / 32768.0
+    count = len(samples) // frame_length
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_length - 1)
+    return energy, zcr
+
+
+class VoiceActivityDetector:
+    """
+    Energy and zero-crossing voice activity detection with an adaptive noise floor.
+
+    The first calibration_frames frames set the noise floor (the user is not expected
+    to speak in the first few hundred ms), silent frames keep adapting it afterwards.
+    Speech starts after onset_frames consecutive speech frames, so a single click is
+    ignored, and ends after hangover_frames consecutive silent ones, so short pauses
+    between words don't cut the recording.
+    """
+
+    def __init__(self, calibration_frames: int = 8, onset_frames: int = 2, hangover_frames: int = 16):
+        self.calibration_frames = calibration_frames
+        self.onset_frames = onset_frames
+        self.hangover_frames = hangover_frames
+        self.calibration = []
+        self.noise_floor = None
+        self.speaking = False
+        self.speech_run = 0
+        self.silence_run = 0
+
+    def threshold(self) -> float:
+        if self.noise_floor is None:
+            return MIN_ENERGY
+        return max(self.noise_floor * ENERGY_RATIO, MIN_ENERGY)
+
+    def classify(self, energy: np.ndarray, zcr: np.ndarray) -> np.ndarray:
+        """Raw per-frame speech decision, without calibration or smoothing."""
+        threshold = self.threshold()
+        return (energy > threshold) & ((zcr < MAX_SPEECH_ZCR) | (energy > 2 * threshold))
+
+    def is_speech(self, block: np.ndarray) -> bool:
+        """
+        Feed one recorder block (treated as one frame) and return the raw decision for it.
+        The smoothed state is in self.speaking.
+        """
+        energy, zcr = frame_features(block, len(block.reshape(-1)))
+        if not len(energy):
+            return False
+        energy_value = float(energy[0])
+
+        if self.noise_floor is None:
+            self.calibration.append(energy_value)
+            if len(self.calibration) >= self.calibration_frames:
+                self.noise_floor = float(np.median(self.calibration))
+            return False
+
+        speech = bool(self.classify(energy, zcr)[0])
+        if speech:
+            self.speech_run += 1
+            self.silence_run = 0
+            if self.speech_run >= self.onset_frames:
+                self.speaking = True
+        else:
+            self.speech_run = 0
+            self.silence_run += 1
+            self.noise_floor += NOISE_ADAPTATION * (energy_value - self.noise_floor)
+            if self.silence_run >= self.hangover_frames:
+                self.speaking = False
+        return speech
+
+    def trim(self, audio: np.ndarray, frame_length: int = 512, padding_frames: int = 4) -> np.ndarray:
+        """
+        Cut leading and trailing silence off a whole recording, keeping a few frames
+        of padding around the speech. Returns the audio unchanged if no frame is speech.
+        """
+        energy, zcr = frame_features(audio, frame_length)
+        if not len(energy):
+            return audio
+        if self.noise_floor is None:
+            # Not calibrated on a live stream, take the quietest frames as the noise floor
+            self.noise_floor = float(np.percentile(energy, 10))
+        speech = np.flatnonzero(self.classify(energy, zcr))
+        if not len(speech):
+            return audio
+        start = max(speech[0] - padding_frames, 0) * frame_length
+        end = min(speech[-1] + 1 + padding_frames, len(energy)) * frame_length
+        return audio[start:end]
+
+
+class SpeechGate:
+    """
+    Decides which recorder blocks are worth uploading.
+
+    Before speech the last preroll_frames blocks are held back and released with the
+    first speech block, so the start of the first word is kept. Silent blocks during
+    speech are held until speech resumes, when speech ends (hangover elapsed) they are
+    dropped, so nothing before or after the utterance is sent.
+    """
+
+    def __init__(self, vad: VoiceActivityDetector = None, preroll_frames: int = 4):
+        self.vad = vad or VoiceActivityDetector()
+        self.preroll = deque(maxlen=preroll_frames)
+        self.pending = []
+        self.started = False
+        self.ended = False
+
+    def push(self, block: np.ndarray) -> list:
+        """Feed one block, return the blocks to upload now (possibly none)."""
+        if self.ended:
+            return []
+        speech = self.vad.is_speech(block)
+        if not self.started:
+            self.preroll.append(block)
+            if self.vad.speaking:
+                self.started = True
+                released = list(self.preroll)
+                self.preroll.clear()
+                return released
+            return []
+        if not self.vad.speaking:
+            self.ended = True
+            self.pending = []
+            return []
+        if speech:
+            released = self.pending + [block]
+            self.pending = []
+            return released
+        self.pending.append(block)
+        return []